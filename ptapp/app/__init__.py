@@ -1,26 +1,29 @@
+import os
+
 from flask import Flask
-from .config import Config
-from .extensions import db
+from .config import CONFIGS
+from .extensions import db, init_engines
 from .main.routes import main_bp
 from app.journal.routes import journal_bp
 from app.backtest.routes import backtest_bp
 from app.planner.routes import planner_bp
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__, template_folder="templates", static_folder="static")
-    app.config.from_object(Config)
+    # APP_ENV=production selects the WAL / pooled / read-engine database profile
+    app.config.from_object(config or CONFIGS[os.environ.get("APP_ENV", "development")])
 
     db.init_app(app)
+    init_engines(app)
     
     from flask_login import LoginManager
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
     login_manager.init_app(app)
     
-    from app.models import User
-    @login_manager.user_loader
-    def load_user(user_id):
-        return User.query.get(int(user_id))
+    # User + subscription in one query; see app/identity.py
+    from app.identity import load_user
+    login_manager.user_loader(load_user)
 
     app.register_blueprint(main_bp)
     app.register_blueprint(journal_bp, url_prefix='/journal')
@@ -30,5 +33,33 @@ def create_app():
     app.register_blueprint(analytics_bp, url_prefix='/analytics')
     from app.auth.routes import auth_bp
     app.register_blueprint(auth_bp, url_prefix='/auth')
+    from app.jobs import jobs_bp
+    from app.jobs import runner as job_runner
+    app.register_blueprint(jobs_bp, url_prefix='/jobs')
+    from app.uploads import uploads_bp
+    app.register_blueprint(uploads_bp, url_prefix='/uploads')
+    job_runner.init_app(app)
+    from app import predictors
+    predictors.init_app(app)
+    from app import assets
+    assets.init_app(app)
+    from app import responses
+    responses.init_app(app)
+
+    # CLI: flask db upgrade / analytics rebuild-rollups / kpi backfill / ai backfill / candles ingest / candles prune / uploads backfill / assets build / plans match
+    from app.migrations import db_cli
+    app.cli.add_command(db_cli)
+    from app.analytics.rollups import rollups_cli
+    app.cli.add_command(rollups_cli)
+    from app.main.kpi import kpi_cli
+    app.cli.add_command(kpi_cli)
+    from app.journal.scoring import scoring_cli
+    app.cli.add_command(scoring_cli)
+    from app.market.store import candles_cli
+    app.cli.add_command(candles_cli)
+    from app.uploads.storage import uploads_cli
+    app.cli.add_command(uploads_cli)
+    from app.planner.matching import plans_cli
+    app.cli.add_command(plans_cli)
 
     return app
@@ -2,21 +2,75 @@ import datetime
 
 import json
 import os
+import zlib
 from pathlib import Path
 
+import numpy as np
+
 WEIGHTS_FILE = Path(__file__).parent / 'ai_weights.json'
 
+# Feature order produced by prepare_inputs
+FEATURES = ('time', 'sl', 'tp', 'rr', 'news', 'strategy')
+
+
+def missing_as_nan(values):
+    # None and 0 both mean "not filled in" for the numeric inputs
+    return np.array([np.nan if not v else v for v in values], dtype=np.float64)
+
+
+def encode_features(hours, entry_price, stop_loss, take_profit, risk_reward, news, strategy_codes):
+    """
+    Vectorized feature encoding behind prepare_inputs. Takes equal-length
+    arrays (numeric inputs NaN when missing, news as bools, strategy codes NaN
+    when there is no strategy) and returns an (n, 6) matrix in FEATURES order.
+    """
+    entry_price, stop_loss, take_profit, risk_reward, strategy_codes = (
+        np.asarray(a, dtype=np.float64) for a in (entry_price, stop_loss, take_profit, risk_reward, strategy_codes)
+    )
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sl = np.where(np.isnan(stop_loss) | np.isnan(entry_price), 0.5,
+                      np.minimum(np.abs(entry_price - stop_loss) / entry_price * 100, 1.0))
+        tp = np.where(np.isnan(take_profit) | np.isnan(entry_price), 0.5,
+                      np.minimum(np.abs(entry_price - take_profit) / entry_price * 100, 1.0))
+    rr = np.where(np.isnan(risk_reward), 0.5, np.minimum(risk_reward / 5.0, 1.0))
+    # Vocabulary codes are dense per user (1, 2, 3...), so strategies only share a value past 100
+    strategy = np.where(np.isnan(strategy_codes), 0.5, np.mod(strategy_codes, 100) / 100.0)
+    return np.column_stack([
+        np.asarray(hours, dtype=np.float64) / 24.0, sl, tp, rr,
+        np.asarray(news, dtype=np.float64), strategy,
+    ])
+
+
+def fallback_strategy_code(strategy):
+    # Stable across processes, unlike hash(); used only without a vocabulary
+    return zlib.crc32(strategy.encode('utf-8'))
+
+
+def sigmoid(z):
+    # Clipped so large activations don't overflow exp()
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -500, 500)))
+
+
 class TradePredictor:
-    def __init__(self):
+    """
+    Logistic model over the six prepare_inputs features. predict() returns a
+    win probability in [0, 1]; training is vectorized mini-batch gradient
+    descent on log-loss, so a full journal history trains in milliseconds.
+    """
+
+    def __init__(self, state=None):
         # Default Weights
-        self.weights = [0.5, 0.5, 0.5, 0.5, -0.5, 0.5]
+        self.weights = np.array([0.5, 0.5, 0.5, 0.5, -0.5, 0.5])
+        self.bias = 0.0
         self.learning_rate = 0.1
-        
-        # Load persistent weights if they exist
-        self.load_weights()
-        
-        # Initial training on default data if no weights found
-        if not WEIGHTS_FILE.exists():
+
+        if state is not None:
+            self.from_json(state)
+        elif WEIGHTS_FILE.exists():
+            # The old shared model is the starting point for new users
+            self.load_weights()
+        else:
+            # Initial training on default data if no weights found
              # User (time, sl, tp, rr, news, strategy, result)
             self.data = [
                 (0.8, 0.2, 0.6, 0.7, 0, 0.8, 1),  # good London trade
@@ -26,34 +80,56 @@ class TradePredictor:
                 (0.7, 0.4, 0.6, 0.6, 0, 0.7, 1),
             ]
             self.train_batch(self.data)
-            self.save_weights()
 
-    def neuron(self, inputs, weights):
-        total = 0
-        for i, w in zip(inputs, weights):
-            total += i * w
-        return total
+    def fit(self, X, y, epochs=20, batch_size=256, seed=0):
+        """Mini-batch gradient descent on (n, 6) features and n targets in [0, 1]"""
+        X = np.asarray(X, dtype=np.float64).reshape(-1, len(FEATURES))
+        y = np.asarray(y, dtype=np.float64).reshape(-1)
+        n = len(y)
+        if not n:
+            return self
+        rng = np.random.default_rng(seed)
+        for _ in range(epochs):
+            order = rng.permutation(n)
+            for start in range(0, n, batch_size):
+                batch = order[start:start + batch_size]
+                error = sigmoid(X[batch] @ self.weights + self.bias) - y[batch]
+                self.weights -= self.learning_rate * (X[batch].T @ error) / len(batch)
+                self.bias -= self.learning_rate * error.mean()
+        return self
 
-    def train_batch(self, dataset):
-        for epoch in range(20):
-            for row in dataset:
-                inputs = list(row[:-1])
-                correct = row[-1]
-                self._learn_step(inputs, correct)
+    def train_batch(self, dataset, epochs=20):
+        """Train on rows of (*features, target)"""
+        data = np.asarray(dataset, dtype=np.float64)
+        if data.size:
+            self.fit(data[:, :-1], data[:, -1], epochs=epochs)
 
     def _learn_step(self, inputs, correct):
-        prediction = self.neuron(inputs, self.weights)
-        mistake = correct - prediction
-        for i in range(len(self.weights)):
-            self.weights[i] += self.learning_rate * mistake * inputs[i]
+        self.fit([inputs], [correct], epochs=1, batch_size=1)
 
     def predict(self, inputs):
-        return self.neuron(inputs, self.weights)
+        return float(self.predict_batch([inputs])[0])
+
+    def predict_batch(self, matrix):
+        """Win probabilities for an (n, 6) feature matrix, in one pass"""
+        X = np.asarray(matrix, dtype=np.float64).reshape(-1, len(FEATURES))
+        return sigmoid(X @ self.weights + self.bias)
+
+    def to_json(self):
+        return {'weights': self.weights.tolist(), 'bias': self.bias}
+
+    def from_json(self, data):
+        # Legacy files are a bare list of the six linear weights (no bias)
+        if isinstance(data, list):
+            data = {'weights': data, 'bias': 0.0}
+        self.weights = np.array(data['weights'], dtype=np.float64)
+        self.bias = float(data.get('bias', 0.0))
+        return self
         
     def save_weights(self):
         try:
             with open(WEIGHTS_FILE, 'w') as f:
-                json.dump(self.weights, f)
+                json.dump(self.to_json(), f)
         except Exception as e:
             print(f"Error saving AI weights: {e}")
             
@@ -61,13 +137,16 @@ class TradePredictor:
         if WEIGHTS_FILE.exists():
             try:
                 with open(WEIGHTS_FILE, 'r') as f:
-                    self.weights = json.load(f)
+                    self.from_json(json.load(f))
             except Exception as e:
                 print(f"Error loading AI weights: {e}")
 
-    def prepare_inputs(self, form=None, entry=None):
-        # Heuristic mapping of form/entry data to [time, sl, tp, rr, news, strategy]
-        
+    def prepare_inputs(self, form=None, entry=None, strategy_code=None):
+        """
+        Map form/entry data to [time, sl, tp, rr, news, strategy].
+        strategy_code is the strategy's code in the user's feature vocabulary
+        (see app/journal/features.py).
+        """
         # Helper to extract value safely
         def get_val(obj, attr, default=None):
             if hasattr(obj, attr):
@@ -77,14 +156,6 @@ class TradePredictor:
                 return val
             return default
 
-        # 1. Time
-        time_val = 0.5
-        date = get_val(form, 'date') or get_val(entry, 'date')
-        if date and hasattr(date, 'hour'):
-            time_val = date.hour / 24.0
-        else:
-             time_val = datetime.datetime.now().hour / 24.0
-        
         # Helper to safely convert to float
         def safe_float(val):
             try:
@@ -92,53 +163,46 @@ class TradePredictor:
             except (ValueError, TypeError):
                 return None
 
-        # 2. SL / 3. TP
-        entry_price = safe_float(get_val(form, 'entry_price') or get_val(entry, 'entry_price'))
-        stop_loss = safe_float(get_val(form, 'stop_loss') or get_val(entry, 'stop_loss'))
-        take_profit = safe_float(get_val(form, 'take_profit') or get_val(entry, 'take_profit'))
-
-        sl_val = 0.5
-        if stop_loss is not None and entry_price is not None and entry_price != 0:
-             dist = abs(entry_price - stop_loss)
-             sl_val = min(dist / entry_price * 100, 1.0)
-             
-        tp_val = 0.5
-        if take_profit is not None and entry_price is not None and entry_price != 0:
-             dist = abs(entry_price - take_profit)
-             tp_val = min(dist / entry_price * 100, 1.0)
-
-        # 4. RR
-        rr_raw = safe_float(get_val(form, 'risk_reward') or get_val(entry, 'risk_reward'))
-        rr_val = 0.5
-        if rr_raw is not None:
-             rr_val = min(rr_raw / 5.0, 1.0)
-        
-        # 5. News
-        news_event = get_val(form, 'news_event') or get_val(entry, 'news_event')
-        news_val = 1.0 if news_event else 0.0
-        
+        def value(attr):
+            return get_val(form, attr) or get_val(entry, attr)
+
+        # 1. Time
+        date = value('date')
+        hour = date.hour if date and hasattr(date, 'hour') else datetime.datetime.now().hour
+
         # 6. Strategy
-        strategy = get_val(form, 'strategy') or get_val(entry, 'strategy')
-        strat_val = 0.5
-        if strategy:
-            strat_val = (hash(strategy) % 100) / 100.0
-            
-        return [time_val, sl_val, tp_val, rr_val, news_val, strat_val]
+        strategy = value('strategy')
+        if not strategy:
+            strategy_code = None
+        elif strategy_code is None:
+            strategy_code = fallback_strategy_code(strategy)
+
+        numeric = missing_as_nan([safe_float(value(attr)) for attr in
+                                   ('entry_price', 'stop_loss', 'take_profit', 'risk_reward')])
+        row = encode_features(
+            [hour], numeric[0:1], numeric[1:2], numeric[2:3], numeric[3:4],
+            [1.0 if value('news_event') else 0.0],
+            [np.nan if strategy_code is None else strategy_code],
+        )
+        return row[0].tolist()
+
+    @staticmethod
+    def target_for(result):
+        """Training target for a journal result: Win=1, Loss=0, BE=0.5; None if unknown"""
+        if not result:
+            return None
+        result = result.lower()
+        if result == 'win':
+            return 1.0
+        if result == 'be':
+            return 0.5
+        return 0.0
 
     def learn_from_entry(self, entry):
         # Only learn if we have a definitive result
-        if not entry.result: return
-        
-        # Map Result to Target (1 = Win, 0 = Loss/BE)
-        # Simplify: Win=1, Loss=0, BE=0.5? User code used 0/1.
-        target = 1.0 if entry.result.lower() == 'win' else 0.0
-        if entry.result.lower() == 'be': target = 0.5
-        
-        inputs = self.prepare_inputs(entry=entry)
-        
-        # Online Learning (Update weights based on this one sample)
-        # We can run a few iterations or just one step for SGD
-        self._learn_step(inputs, target)
-        self.save_weights()
+        target = self.target_for(entry.result)
+        if target is None:
+            return
 
-predictor = TradePredictor()
+        # Online Learning (Update weights based on this one sample)
+        self._learn_step(self.prepare_inputs(entry=entry), target)
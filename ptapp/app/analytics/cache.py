@@ -0,0 +1,129 @@
+"""
+Process-local LRU cache of each user's trades as TradeArrays.
+
+Entries are keyed on ``User.data_version``, which every journal write bumps in
+the same transaction (ORM writes through the ``before_flush`` hook below, bulk
+imports by calling ``bump_data_version``). A read checks the current version
+with a primary-key lookup and reloads only when it moved, so a cached entry is
+never served after the data it was built from has changed.
+
+The cache is bounded by the total size of the arrays (``TRADE_CACHE_MAX_BYTES``)
+and lives in each worker process separately; ``stats()`` reports how well it
+is doing in this one.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import event, inspect, update, select
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models import JournalEntry, User
+from . import engine
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # user_id -> (data_version, TradeArrays), oldest first
+_bytes = 0
+_counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def get_trades(user_id):
+    """The user's trades, from the cache when their data has not changed since"""
+    version = current_version(user_id)
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry is not None and entry[0] == version:
+            _entries.move_to_end(user_id)
+            _counters['hits'] += 1
+            return entry[1]
+        _counters['misses'] += 1
+
+    # Loaded outside the lock; the version was read first, so a write racing
+    # with this load only makes the entry look older than it is
+    arrays = engine.load_trades(user_id).freeze()
+    _store(user_id, version, arrays)
+    return arrays
+
+
+def current_version(user_id):
+    return db.session.execute(
+        select(User.data_version).where(User.id == user_id)
+    ).scalar() or 0
+
+
+def _store(user_id, version, arrays):
+    global _bytes
+    max_bytes = current_app.config.get('TRADE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+    size = arrays.nbytes
+    with _lock:
+        old = _entries.pop(user_id, None)
+        if old is not None:
+            _bytes -= old[1].nbytes
+        if size > max_bytes:
+            return  # Would evict everything else for a single user
+        _entries[user_id] = (version, arrays)
+        _bytes += size
+        while _bytes > max_bytes:
+            _, (_, evicted) = _entries.popitem(last=False)
+            _bytes -= evicted.nbytes
+            _counters['evictions'] += 1
+
+
+def invalidate(user_id=None):
+    """Drop one user's entry (or everything)"""
+    global _bytes
+    with _lock:
+        if user_id is None:
+            _entries.clear()
+            _bytes = 0
+        else:
+            old = _entries.pop(user_id, None)
+            if old is not None:
+                _bytes -= old[1].nbytes
+
+
+def stats():
+    with _lock:
+        lookups = _counters['hits'] + _counters['misses']
+        return dict(
+            _counters,
+            pid=os.getpid(),
+            entries=len(_entries),
+            bytes=_bytes,
+            max_bytes=current_app.config.get('TRADE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES),
+            hit_rate=round(_counters['hits'] / lookups, 3) if lookups else None,
+        )
+
+
+def bump_data_version(conn, user_ids):
+    """Mark users' journal data as changed; call inside the writing transaction"""
+    user_ids = {uid for uid in user_ids if uid is not None}
+    if user_ids:
+        table = User.__table__
+        conn.execute(update(table).where(table.c.id.in_(user_ids))
+                     .values(data_version=table.c.data_version + 1))
+
+
+# --- ORM hook ---
+
+@event.listens_for(Session, 'before_flush')
+def _track_journal_writes(session, flush_context, instances):
+    user_ids = set()
+    for obj in session.new:
+        if isinstance(obj, JournalEntry):
+            user_ids.add(obj.user_id)
+    for obj in session.deleted:
+        if isinstance(obj, JournalEntry):
+            user_ids.add(obj.user_id)
+    for obj in session.dirty:
+        if isinstance(obj, JournalEntry) and session.is_modified(obj):
+            user_ids.add(obj.user_id)
+            # Moving an entry to another user changes the old owner's data too
+            history = inspect(obj).attrs.user_id.history
+            user_ids.update(history.deleted)
+    if user_ids:
+        bump_data_version(session.connection(), user_ids)
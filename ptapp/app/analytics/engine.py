@@ -0,0 +1,267 @@
+"""
+Vectorized trade statistics.
+
+A user's journal is loaded once into columnar NumPy arrays (``TradeArrays``);
+every metric below is a handful of array operations over those columns, so
+the cost is dominated by the single fetch rather than per-trade Python work.
+"""
+from datetime import datetime
+
+import numpy as np
+
+from sqlalchemy import or_, func
+
+from app.extensions import db
+from app.models import JournalEntry
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+class TradeArrays:
+    """Columnar trades, ordered by time. Missing floats are NaN."""
+    __slots__ = ('ts', 'pnl', 'risk', 'complete', 'rules', 'news', 'clean')
+
+    def __init__(self, ts, pnl, risk, complete, rules, news, clean):
+        self.ts = ts  # datetime64[s]
+        self.pnl = pnl  # float64
+        self.risk = risk  # float64, risk_amount in account currency
+        self.complete = complete  # bool, journal_complete
+        self.rules = rules  # bool, rules_followed
+        self.news = news  # bool, news_checked
+        self.clean = clean  # bool, no (or a trivially short) mistakes note
+
+    def __len__(self):
+        return len(self.ts)
+
+    def _columns(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self._columns())
+
+    def freeze(self):
+        """Make the columns read-only so a shared (cached) instance can't be mutated"""
+        for column in self._columns():
+            column.flags.writeable = False
+        return self
+
+    def select(self, mask):
+        return TradeArrays(*(column[mask] for column in self._columns()))
+
+    def between(self, start, end):
+        """Trades with start <= time <= end (datetimes)"""
+        lo = np.searchsorted(self.ts, np.datetime64(start, 's'), side='left')
+        hi = np.searchsorted(self.ts, np.datetime64(end, 's'), side='right')
+        return self.select(slice(lo, hi))
+
+    def since(self, start, completed_only=False):
+        """Trades on/after a date (or datetime), optionally only completed journals"""
+        start = np.datetime64(datetime.combine(start, datetime.min.time())
+                              if not isinstance(start, datetime) else start, 's')
+        # ts is sorted, so the cut-off is a binary search
+        arrays = self.select(slice(np.searchsorted(self.ts, start, side='left'), None))
+        if completed_only:
+            arrays = arrays.select(arrays.complete)
+        return arrays
+
+
+def _as_float(values, count):
+    return np.fromiter((np.nan if v is None else v for v in values), dtype=np.float64, count=count)
+
+
+def _as_bool(values, count):
+    return np.fromiter((bool(v) for v in values), dtype=bool, count=count)
+
+
+def load_trades(user_id):
+    """Fetch a user's trades as TradeArrays with one narrow query (no ORM objects)"""
+    j = JournalEntry
+    rows = db.session.query(
+        j.date, j.profit_loss, j.risk_amount, j.journal_complete,
+        j.rules_followed, j.news_checked,
+        # Only whether the mistakes note is empty matters, not the text
+        or_(j.mistakes.is_(None), func.length(j.mistakes) < 5)
+    ).filter(
+        JournalEntry.user_id == user_id,
+        JournalEntry.date.isnot(None)
+    ).order_by(JournalEntry.date, JournalEntry.id).all()
+
+    n = len(rows)
+    if not n:
+        return empty_trades()
+    dates, pnl, risk, complete, rules, news, clean = zip(*rows)
+    return TradeArrays(
+        np.array(dates, dtype='datetime64[s]'),
+        _as_float(pnl, n),
+        _as_float(risk, n),
+        _as_bool(complete, n),
+        _as_bool(rules, n),
+        _as_bool(news, n),
+        _as_bool(clean, n),
+    )
+
+
+def empty_trades():
+    flags = np.empty(0, dtype=bool)
+    return TradeArrays(np.empty(0, dtype='datetime64[s]'), np.empty(0), np.empty(0),
+                       flags, flags.copy(), flags.copy(), flags.copy())
+
+
+# --- Metrics ---
+
+def closed_pnl(arrays):
+    """P/L of trades that have one (NaN rows dropped)"""
+    return arrays.pnl[~np.isnan(arrays.pnl)]
+
+
+def equity_curve(pnl, start_balance=0.0):
+    return start_balance + np.cumsum(pnl)
+
+
+def max_drawdown(pnl):
+    """(max drawdown amount, longest time under water in trades)"""
+    if not len(pnl):
+        return 0.0, 0
+    equity = np.concatenate(([0.0], np.cumsum(pnl)))
+    peaks = np.maximum.accumulate(equity)
+    drawdown = peaks - equity
+
+    # Indices where a new high is set; the widest gap between them (or to the
+    # end) is the longest drawdown duration
+    highs = np.flatnonzero(drawdown == 0)
+    gaps = np.diff(np.append(highs, len(equity))) - 1
+    return float(drawdown.max()), int(gaps.max())
+
+
+def profit_factor(pnl):
+    gross_profit = pnl[pnl > 0].sum()
+    gross_loss = -pnl[pnl < 0].sum()
+    return float(gross_profit / gross_loss) if gross_loss > 0 else 0.0
+
+
+def expectancy(pnl):
+    return float(pnl.mean()) if len(pnl) else 0.0
+
+
+def daily_pnl(arrays):
+    """(days, summed P/L) for days with closed trades"""
+    mask = ~np.isnan(arrays.pnl)
+    days = arrays.ts[mask].astype('datetime64[D]')
+    if not len(days):
+        return days, np.empty(0)
+    unique_days, inverse = np.unique(days, return_inverse=True)
+    return unique_days, np.bincount(inverse, weights=arrays.pnl[mask])
+
+
+def sharpe_ratio(daily):
+    if len(daily) < 2:
+        return 0.0
+    std = daily.std(ddof=1)
+    return float(daily.mean() / std * np.sqrt(TRADING_DAYS_PER_YEAR)) if std > 0 else 0.0
+
+
+def sortino_ratio(daily):
+    if len(daily) < 2:
+        return 0.0
+    downside = np.sqrt(np.mean(np.minimum(daily, 0.0) ** 2))
+    return float(daily.mean() / downside * np.sqrt(TRADING_DAYS_PER_YEAR)) if downside > 0 else 0.0
+
+
+def longest_streak(flags):
+    """Length of the longest run of True values"""
+    if not flags.any():
+        return 0
+    padded = np.concatenate(([False], flags, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    return int((edges[1::2] - edges[::2]).max())
+
+
+def average_r(arrays):
+    """Mean P/L in multiples of the risk taken, over trades with a recorded risk"""
+    mask = (arrays.risk > 0) & ~np.isnan(arrays.pnl)
+    if not mask.any():
+        return 0.0
+    return float(np.mean(arrays.pnl[mask] / arrays.risk[mask]))
+
+
+def rolling_win_rate(pnl, window=20):
+    """Win rate (%) over the trailing `window` trades, one value per trade from `window` on"""
+    if len(pnl) < window:
+        return np.empty(0)
+    wins = np.cumsum(np.concatenate(([0], (pnl > 0).astype(np.int64))))
+    return (wins[window:] - wins[:-window]) * 100.0 / window
+
+
+def pnl_by_weekday(arrays):
+    """Average P/L per trade for Mon..Fri"""
+    mask = ~np.isnan(arrays.pnl)
+    # 1970-01-01 was a Thursday: shift so Monday = 0
+    weekday = (arrays.ts[mask].astype('datetime64[D]').astype(np.int64) + 3) % 7
+    totals = np.bincount(weekday, weights=arrays.pnl[mask], minlength=7)
+    counts = np.bincount(weekday, minlength=7)
+    averages = np.divide(totals, counts, out=np.zeros(7), where=counts > 0)
+    return averages[:5]
+
+
+def pnl_by_hour(arrays):
+    mask = ~np.isnan(arrays.pnl)
+    hours = (arrays.ts[mask].astype(np.int64) // 3600) % 24
+    return np.bincount(hours, weights=arrays.pnl[mask], minlength=24)
+
+
+def goal_progress(arrays, start_date):
+    """(realized profit, average risk, trade count) of completed trades since a goal started"""
+    trades = arrays.since(start_date, completed_only=True)
+    profit = float(np.nansum(trades.pnl))
+    risks = trades.risk[(trades.risk != 0) & ~np.isnan(trades.risk)]
+    avg_risk = float(risks.mean()) if len(risks) else 0.0
+    return profit, avg_risk, len(trades)
+
+
+def week_counts(arrays, start, end, risk_limit=None):
+    """
+    Counts behind compute_weekly_kpis for the cached trades in [start, end]:
+    (trades, distinct_days, risk_compliant, good_execution, disciplined).
+
+    risk_limit: max allowed risk_amount when the user has an active goal.
+    Trades without a risk amount (or without a goal) fall back to rules_followed.
+    """
+    week = arrays.between(start, end)
+    if not len(week):
+        return 0, 0, 0, 0, 0
+    if risk_limit:
+        has_risk = ~np.isnan(week.risk) & (week.risk != 0)
+        risk_ok = np.where(has_risk, week.risk <= risk_limit, week.rules)
+    else:
+        risk_ok = week.rules
+    return (
+        len(week),
+        len(np.unique(week.ts.astype('datetime64[D]'))),
+        int(risk_ok.sum()),
+        int(week.clean.sum()),
+        int((week.news & week.complete).sum()),
+    )
+
+
+def summary(arrays):
+    """Headline statistics for the analytics page"""
+    pnl = closed_pnl(arrays)
+    drawdown, drawdown_trades = max_drawdown(pnl)
+    _, daily = daily_pnl(arrays)
+    rolling = rolling_win_rate(pnl)
+    return {
+        'trades': int(len(pnl)),
+        'net_pnl': round(float(pnl.sum()), 2),
+        'win_rate': round(float((pnl > 0).mean() * 100), 1) if len(pnl) else 0.0,
+        'expectancy': round(expectancy(pnl), 2),
+        'profit_factor': round(profit_factor(pnl), 2),
+        'max_drawdown': round(drawdown, 2),
+        'max_drawdown_trades': drawdown_trades,
+        'sharpe': round(sharpe_ratio(daily), 2),
+        'sortino': round(sortino_ratio(daily), 2),
+        'max_win_streak': longest_streak(pnl > 0),
+        'max_loss_streak': longest_streak(pnl < 0),
+        'avg_r': round(average_r(arrays), 2),
+        'rolling_win_rate': round(float(rolling[-1]), 1) if len(rolling) else None,
+    }
@@ -0,0 +1,328 @@
+"""
+Maximum adverse/favorable excursion (MAE/MFE) of journal and backtest trades.
+
+Trades are matched to the finest stored candle series of their pair (see
+app/market/store.py) and processed per pair in one vectorized pass: entry and
+exit bars come from a binary search of the trade times, and the lowest low and
+highest high inside every trade from a single np.minimum/np.maximum.reduceat
+over the (entry bar, exit bar) boundaries. Results are stored on the trade
+rows and ``excursion_at`` marks rows that are done; a before_flush hook clears
+it when a trade's pair, prices or times change.
+
+Journal entries have no exit time or price, so their exit is taken as the
+first touch of the stop loss or take profit within EXCURSION_MAX_HOURS, or
+the close at that horizon if neither is hit. Trade times are taken as UTC.
+"""
+import json
+import re
+from datetime import datetime
+
+import click
+import numpy as np
+from flask import current_app
+from sqlalchemy import bindparam, event, inspect, select, update
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models import BacktestEntry, BacktestRun, JournalEntry, User
+from app.market import store
+from app.market.candles import Candles, pip_size
+from app.backtest.replay import ExitSearch
+from app.responses import bump_content_version
+from .rollups import rollups_cli
+
+CHUNK_BARS = 250_000  # candle span per ExitSearch when estimating journal exits
+
+RESULT_COLUMNS = ('mae_pips', 'mfe_pips', 'risk_pips', 'captured_pips', 'captured_r', 'held_minutes')
+
+JOURNAL_INPUTS = ('pair', 'direction', 'date', 'entry_price', 'stop_loss', 'take_profit')
+BACKTEST_INPUTS = ('pair', 'direction', 'entry_time', 'exit_time', 'entry_price', 'exit_price')
+
+
+def normalize_pair(pair):
+    """'eur/usd' -> 'EURUSD'"""
+    return re.sub(r'[^A-Z0-9]', '', (pair or '').upper())
+
+
+def finest_series(pair):
+    """(candles, bar seconds) of the pair's finest stored timeframe, or (None, None)"""
+    stored = [tf for p, tf in store.available_series() if p == pair and tf in store.TIMEFRAMES]
+    if not stored:
+        return None, None
+    timeframe = min(stored, key=store.TIMEFRAMES.get)
+    return store.open_series(pair, timeframe), store.TIMEFRAMES[timeframe]
+
+
+def to_epoch_seconds(datetimes):
+    return np.array(datetimes, dtype='datetime64[s]').astype(np.int64)
+
+
+# --- Vectorized core ---
+
+def bars_for(candles, bar_seconds, ts):
+    """Index of the bar containing each timestamp, -1 if outside the data"""
+    idx = np.searchsorted(candles.ts, ts, side='right') - 1
+    inside = (idx >= 0) & (ts < np.asarray(candles.ts)[np.maximum(idx, 0)] + bar_seconds)
+    return np.where(inside, idx, -1)
+
+
+def window_extremes(candles, first, last):
+    """(lowest low, highest high) over bars first..last (inclusive) of each trade"""
+    lo, hi = int(first.min()), int(last.max()) + 1
+    # One sentinel bar so the boundary after the last trade is always a valid index
+    lows = np.append(candles.low[lo:hi], np.inf)
+    highs = np.append(candles.high[lo:hi], -np.inf)
+    bounds = np.empty(2 * len(first), dtype=np.int64)
+    bounds[0::2] = first - lo
+    bounds[1::2] = last + 1 - lo
+    # Even slots reduce [first, last + 1); odd slots only cover the gaps between trades
+    return np.minimum.reduceat(lows, bounds)[0::2], np.maximum.reduceat(highs, bounds)[0::2]
+
+
+def excursions(candles, bar_seconds, pair, side, entry_price, first, last, exit_price, risk_price):
+    """Per-trade result columns (see RESULT_COLUMNS) as float arrays"""
+    pip = pip_size(pair)
+    low, high = window_extremes(candles, first, last)
+    adverse = np.where(side > 0, entry_price - low, high - entry_price)
+    favorable = np.where(side > 0, high - entry_price, entry_price - low)
+    captured = (exit_price - entry_price) * side
+    risk = np.abs(risk_price)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        captured_r = np.where(risk > 0, captured / risk, np.nan)
+    return {
+        'mae_pips': np.maximum(adverse, 0) / pip,
+        'mfe_pips': np.maximum(favorable, 0) / pip,
+        'risk_pips': np.where(risk > 0, risk / pip, np.nan),
+        'captured_pips': captured / pip,
+        'captured_r': captured_r,
+        'held_minutes': (last - first + 1) * bar_seconds / 60,
+    }
+
+
+def estimate_exits(candles, first, side, entry_price, stop, target, horizon):
+    """Exit bar/price for trades without one: first touch of stop or target within horizon bars"""
+    n = len(candles)
+    order = np.argsort(first, kind='stable')
+    sorted_first = first[order]
+    last = np.empty(len(first), dtype=np.int64)
+    exit_price = np.empty(len(first))
+
+    # No stop/target: a threshold that can never be touched
+    stop = np.where(np.isnan(stop), -np.inf * side, stop)
+    target = np.where(np.isnan(target), np.inf * side, target)
+
+    start = 0
+    while start < len(order):
+        # Trades whose candle span fits one ExitSearch
+        end = max(start + 1, int(np.searchsorted(sorted_first, sorted_first[start] + CHUNK_BARS - horizon, 'right')))
+        part = order[start:end]
+        lo, hi = int(sorted_first[start]), min(int(sorted_first[end - 1]) + horizon, n)
+        window = Candles(*(column[lo:hi] for column in candles.columns()))
+        search = ExitSearch(window, horizon)
+
+        entries, longs = first[part] - lo, side[part] > 0
+        first_stop = search.first_touch(entries, np.where(longs, stop[part], -stop[part]), longs, horizon)
+        first_target = search.first_touch(entries, np.where(longs, -target[part], target[part]), ~longs, horizon)
+        offset = np.minimum(first_stop, first_target)
+        timed_out = offset == horizon
+        bar = np.where(timed_out, np.minimum(entries + horizon, hi - lo) - 1, entries + offset)
+        last[part] = bar + lo
+        exit_price[part] = np.where(timed_out, window.close[bar],
+                                    np.where(first_stop <= first_target, stop[part], target[part]))
+        start = end
+    return last, exit_price
+
+
+def sides(directions):
+    return np.array([-1 if (d or '').lower().startswith(('sell', 'short')) else 1 for d in directions])
+
+
+def as_float(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+# --- Batch computation ---
+
+def _write(table, user_id, ids, results):
+    now = datetime.utcnow()
+    stmt = update(table).where(table.c.id == bindparam('_id')).values(
+        excursion_at=now, **{name: bindparam(f'_{name}') for name in RESULT_COLUMNS}
+    )
+    rows = [{'_id': row_id} for row_id in ids]
+    for name in RESULT_COLUMNS:
+        for row, value in zip(rows, results[name].tolist()):
+            row[f'_{name}'] = None if np.isnan(value) else value
+    db.session.execute(stmt, rows)
+    bump_content_version(db.session.connection(), [user_id])
+
+
+def _by_pair(rows):
+    groups = {}
+    for row in rows:
+        groups.setdefault(normalize_pair(row.pair), []).append(row)
+    return groups
+
+
+def compute_journal(user_id, recompute=False):
+    """Excursions for the user's journal entries. Returns (computed, unmatched)."""
+    j = JournalEntry
+    query = select(j.id, j.pair, j.direction, j.date, j.entry_price, j.stop_loss, j.take_profit).where(
+        j.user_id == user_id, j.date.isnot(None), j.entry_price.isnot(None), j.entry_price != 0
+    )
+    if not recompute:
+        query = query.where(j.excursion_at.is_(None))
+
+    computed = unmatched = 0
+    for pair, rows in _by_pair(db.session.execute(query).all()).items():
+        candles, bar_seconds = finest_series(pair) if pair else (None, None)
+        if candles is None:
+            unmatched += len(rows)
+            continue
+        first = bars_for(candles, bar_seconds, to_epoch_seconds([r.date for r in rows]))
+        found = first >= 0
+        unmatched += int((~found).sum())
+        if not found.any():
+            continue
+        rows = [r for r, ok in zip(rows, found.tolist()) if ok]
+        first = first[found]
+
+        side = sides(r.direction for r in rows)
+        entry = as_float(r.entry_price for r in rows)
+        stop = as_float(r.stop_loss for r in rows)
+        horizon = max(1, int(np.ceil(current_app.config.get('EXCURSION_MAX_HOURS', 48) * 3600 / bar_seconds)))
+        last, exit_price = estimate_exits(candles, first, side, entry, stop,
+                                          as_float(r.take_profit for r in rows), horizon)
+        results = excursions(candles, bar_seconds, pair, side, entry, first, last, exit_price,
+                             np.where(np.isnan(stop), np.nan, entry - stop))
+        _write(j.__table__, user_id, [r.id for r in rows], results)
+        db.session.commit()
+        computed += len(rows)
+    return computed, unmatched
+
+
+def _run_stops(run_ids):
+    """{run id: stop distance in pips} for replay runs"""
+    if not run_ids:
+        return {}
+    runs = db.session.execute(select(BacktestRun.id, BacktestRun.params).where(BacktestRun.id.in_(run_ids))).all()
+    return {run_id: json.loads(params or '{}').get('stop_pips') for run_id, params in runs}
+
+
+def compute_backtests(user_id, recompute=False):
+    """Excursions for the user's backtests that have both times and prices. Returns (computed, unmatched)."""
+    b = BacktestEntry
+    query = select(b.id, b.pair, b.direction, b.run_id, b.entry_time, b.exit_time, b.entry_price, b.exit_price).where(
+        b.user_id == user_id, b.entry_time.isnot(None), b.exit_time.isnot(None), b.exit_time >= b.entry_time,
+        b.entry_price.isnot(None), b.entry_price != 0, b.exit_price.isnot(None), b.exit_price != 0
+    )
+    if not recompute:
+        query = query.where(b.excursion_at.is_(None))
+
+    computed = unmatched = 0
+    for pair, rows in _by_pair(db.session.execute(query).all()).items():
+        candles, bar_seconds = finest_series(pair) if pair else (None, None)
+        if candles is None:
+            unmatched += len(rows)
+            continue
+        first = bars_for(candles, bar_seconds, to_epoch_seconds([r.entry_time for r in rows]))
+        last = bars_for(candles, bar_seconds, to_epoch_seconds([r.exit_time for r in rows]))
+        found = (first >= 0) & (last >= 0)
+        unmatched += int((~found).sum())
+        if not found.any():
+            continue
+        rows = [r for r, ok in zip(rows, found.tolist()) if ok]
+
+        # Only replay trades have a known stop (their run's stop_pips)
+        stops = _run_stops({r.run_id for r in rows if r.run_id})
+        risk_pips = as_float(stops.get(r.run_id) if r.run_id else None for r in rows)
+        results = excursions(candles, bar_seconds, pair, sides(r.direction for r in rows),
+                             as_float(r.entry_price for r in rows), first[found], last[found],
+                             as_float(r.exit_price for r in rows), risk_pips * pip_size(pair))
+        _write(b.__table__, user_id, [r.id for r in rows], results)
+        db.session.commit()
+        computed += len(rows)
+    return computed, unmatched
+
+
+def compute_user(user_id, recompute=False):
+    journal, journal_unmatched = compute_journal(user_id, recompute)
+    backtests, backtest_unmatched = compute_backtests(user_id, recompute)
+    return {'journal': journal, 'backtests': backtests, 'unmatched': journal_unmatched + backtest_unmatched}
+
+
+@rollups_cli.command('excursions')
+@click.option('--user-id', type=int, default=None, help='Only this user.')
+@click.option('--recompute', is_flag=True, help='Recompute trades that already have excursions.')
+def excursions_command(user_id, recompute):
+    """Compute MAE/MFE excursions of trades from the candle store."""
+    user_ids = [user_id] if user_id is not None else [uid for (uid,) in db.session.query(User.id).order_by(User.id)]
+    for uid in user_ids:
+        result = compute_user(uid, recompute)
+        click.echo(f"User {uid}: {result['journal']} journal trades, {result['backtests']} backtests "
+                   f"({result['unmatched']} without candles)")
+
+
+# --- Stop placement analysis ---
+
+STOP_FRACTIONS = np.round(np.arange(0.1, 2.01, 0.1), 1)
+
+
+def stop_efficiency(user_id, max_points=1000):
+    """Chart data for the analytics page from the user's journal excursions, None if there are none"""
+    j = JournalEntry
+    rows = db.session.execute(
+        select(j.mae_pips, j.mfe_pips, j.risk_pips, j.captured_r, j.held_minutes, j.profit_loss)
+        .where(j.user_id == user_id, j.excursion_at.isnot(None), j.risk_pips > 0)
+        .order_by(j.date.desc())
+    ).all()
+    if not rows:
+        return None
+
+    risk = as_float(r.risk_pips for r in rows)
+    mae_r = as_float(r.mae_pips for r in rows) / risk
+    mfe_r = as_float(r.mfe_pips for r in rows) / risk
+    captured_r = as_float(r.captured_r for r in rows)
+    pnl = as_float(r.profit_loss for r in rows)
+    win = np.where(np.isnan(pnl), captured_r > 0, pnl > 0)
+    loss = ~win
+
+    def pct(mask):
+        return round(float(mask.mean()) * 100, 1) if len(mask) else 0.0
+
+    # Share of the best favorable move that winning exits kept
+    kept_mask = win & (captured_r > 0) & (mfe_r > 0)
+    kept = np.minimum(captured_r[kept_mask] / mfe_r[kept_mask], 1.0)
+    points = slice(0, max_points)
+    return {
+        'trades': len(rows),
+        'fractions': STOP_FRACTIONS.tolist(),
+        # Winners that never went further against them than a stop at x R
+        'winners_surviving': [pct(mae_r[win] < f) for f in STOP_FRACTIONS],
+        # Losers that were at least x R in profit before losing
+        'losers_in_profit': [pct(mfe_r[loss] >= f) for f in STOP_FRACTIONS],
+        'scatter_wins': [{'x': round(x, 2), 'y': round(y, 2)} for x, y in
+                         zip(mae_r[points][win[points]].tolist(), np.nan_to_num(captured_r[points][win[points]]).tolist())],
+        'scatter_losses': [{'x': round(x, 2), 'y': round(y, 2)} for x, y in
+                           zip(mae_r[points][loss[points]].tolist(), np.nan_to_num(captured_r[points][loss[points]]).tolist())],
+        'avg_mae_winners': round(float(mae_r[win].mean()), 2) if win.any() else None,
+        'avg_mfe_losers': round(float(mfe_r[loss].mean()), 2) if loss.any() else None,
+        'exit_efficiency': round(float(kept.mean()) * 100, 1) if len(kept) else None,
+        'avg_held_minutes': round(float(np.nanmean(as_float(r.held_minutes for r in rows))), 1),
+    }
+
+
+# --- ORM hook ---
+
+@event.listens_for(Session, 'before_flush')
+def _clear_stale_excursions(session, flush_context, instances):
+    for obj in session.dirty:
+        if isinstance(obj, JournalEntry):
+            inputs = JOURNAL_INPUTS
+        elif isinstance(obj, BacktestEntry):
+            inputs = BACKTEST_INPUTS
+        else:
+            continue
+        if obj.excursion_at is not None:
+            state = inspect(obj)
+            if any(state.attrs[a].history.has_changes() for a in inputs):
+                obj.excursion_at = None
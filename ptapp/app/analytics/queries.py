@@ -0,0 +1,123 @@
+"""
+Aggregation queries for analytics and KPIs.
+
+Everything here is pushed down to SQL (GROUP BY + SUM/COUNT(CASE ...)) and
+returns plain tuples, so callers never hydrate full ORM rows (and their large
+Text columns) just to add up numbers.
+"""
+from sqlalchemy import case, func, literal, select
+
+from app.extensions import db
+from app.models import BacktestEntry, JournalEntry, PnLRollup
+
+
+def _dialect():
+    return db.session.get_bind().dialect.name
+
+
+def period_bucket(col, grain, dialect=None):
+    """SQL expression producing the same period labels as rollups.period_keys"""
+    if (dialect or _dialect()) == 'sqlite':
+        return {
+            'day': func.date(col),
+            # Back 6 days then forward to the next Monday = Monday of this week
+            'week': func.date(col, '-6 days', 'weekday 1'),
+            'month': func.strftime('%Y-%m', col),
+            'year': func.strftime('%Y', col),
+        }[grain]
+    return {
+        'day': func.to_char(col, 'YYYY-MM-DD'),
+        'week': func.to_char(func.date_trunc('week', col), 'YYYY-MM-DD'),
+        'month': func.to_char(col, 'YYYY-MM'),
+        'year': func.to_char(col, 'YYYY'),
+    }[grain]
+
+
+def _count_if(condition):
+    return func.count(case((condition, 1)))
+
+
+# --- Journal P/L ---
+
+def pnl_bucket_select(grain, user_id=None, dialect=None):
+    """SELECT user_id, grain, period, SUM(pnl), wins, losses, breakeven GROUP BY user, period"""
+    j = JournalEntry.__table__
+    bucket = period_bucket(j.c.date, grain, dialect)
+    query = select(
+        j.c.user_id,
+        literal(grain).label('grain'),
+        bucket.label('period'),
+        func.sum(j.c.profit_loss),
+        _count_if(j.c.profit_loss > 0),
+        _count_if(j.c.profit_loss < 0),
+        _count_if(j.c.profit_loss == 0),
+    ).where(
+        j.c.date.isnot(None), j.c.profit_loss.isnot(None)
+    ).group_by(j.c.user_id, bucket)
+    if user_id is not None:
+        query = query.where(j.c.user_id == user_id)
+    return query
+
+
+def rollup_rows(user_id):
+    """(grain, period, pnl, wins, losses, breakeven) tuples for one user"""
+    return db.session.query(
+        PnLRollup.grain, PnLRollup.period, PnLRollup.pnl,
+        PnLRollup.wins, PnLRollup.losses, PnLRollup.breakeven
+    ).filter(PnLRollup.user_id == user_id).order_by(PnLRollup.period).all()
+
+
+# --- Weekly KPIs ---
+
+def backtest_count(user_id, start, end):
+    # Only hand-logged backtests count towards practice; replay runs are generated
+    return db.session.query(func.count(BacktestEntry.id)).filter(
+        BacktestEntry.user_id == user_id,
+        BacktestEntry.run_id.is_(None),
+        BacktestEntry.created_at >= start,
+        BacktestEntry.created_at <= end
+    ).scalar()
+
+
+def backtest_week_counts(user_id, start=None):
+    """{Monday ISO date: backtests created that week}, optionally from `start` on"""
+    week = period_bucket(BacktestEntry.created_at, 'week')
+    query = db.session.query(week, func.count(BacktestEntry.id)).filter(
+        BacktestEntry.user_id == user_id,
+        BacktestEntry.run_id.is_(None)
+    )
+    if start is not None:
+        query = query.filter(BacktestEntry.created_at >= start)
+    return dict(query.group_by(week).all())
+
+
+def first_backtest_at(user_id):
+    return db.session.query(func.min(BacktestEntry.created_at)).filter(
+        BacktestEntry.user_id == user_id,
+        BacktestEntry.run_id.is_(None)
+    ).scalar()
+
+
+# --- Backtests ---
+
+def backtest_strategy_stats(user_id):
+    """
+    Per-strategy (strategy, total, wins, pnl, gross_profit, gross_loss) tuples,
+    in order of first appearance. P/L is exit - entry (entry - exit for sells)
+    and only counted when both prices are set and non-zero.
+    """
+    b = BacktestEntry
+    strategy = func.coalesce(func.nullif(b.strategy_name, ''), literal('Unnamed Strategy'))
+    priced = (b.entry_price != 0) & (b.exit_price != 0)
+    move = case((b.direction == 'sell', b.entry_price - b.exit_price), else_=b.exit_price - b.entry_price)
+
+    return db.session.query(
+        strategy,
+        func.count(b.id),
+        _count_if(b.result == 'win'),
+        func.coalesce(func.sum(case((priced, move), else_=0)), 0),
+        func.coalesce(func.sum(case((priced & (move > 0), move), else_=0)), 0),
+        func.coalesce(func.sum(case((priced & (move <= 0), -move), else_=0)), 0),
+    ).filter(
+        b.user_id == user_id
+    ).group_by(strategy).order_by(func.min(b.id)).all()
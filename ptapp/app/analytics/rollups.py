@@ -0,0 +1,173 @@
+"""
+Incrementally maintained P/L rollups (day / ISO week / month / year).
+
+Journal writes made through the ORM are picked up by a ``before_flush`` hook,
+so the rollup rows change inside the same transaction as the entry itself.
+Bulk paths that bypass the ORM (CSV import) call ``record_rows`` with the
+rows they inserted, on the same connection.
+"""
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect, insert, delete
+from sqlalchemy.orm import Session
+
+from app.extensions import db, dialect_insert
+from app.models import JournalEntry, PnLRollup
+
+GRAINS = ('day', 'week', 'month', 'year')
+
+rollups_cli = AppGroup('analytics', help='Analytics maintenance commands.')
+
+
+def period_keys(dt):
+    """Rollup keys for a trade date; match the labels the dashboard charts use"""
+    return _day_keys(dt.date() if isinstance(dt, datetime) else dt)
+
+
+@lru_cache(maxsize=4096)
+def _day_keys(day):
+    # Cached per calendar day: bulk imports hit the same few days over and over
+    day_str = day.isoformat()
+    return (
+        ('day', day_str),
+        ('week', (day - timedelta(days=day.weekday())).isoformat()),
+        ('month', day_str[:7]),
+        ('year', day_str[:4]),
+    )
+
+
+def collect(deltas, user_id, trade_date, profit_loss, sign=1):
+    """Add (or with sign=-1 remove) one trade to a {(user, grain, period): [pnl, w, l, be]} dict"""
+    if user_id is None or trade_date is None or profit_loss is None:
+        return deltas
+    for grain, period in period_keys(trade_date):
+        d = deltas.setdefault((user_id, grain, period), [0.0, 0, 0, 0])
+        d[0] += sign * profit_loss
+        if profit_loss > 0:
+            d[1] += sign
+        elif profit_loss < 0:
+            d[2] += sign
+        else:
+            d[3] += sign
+    return deltas
+
+
+def apply_deltas(conn, deltas):
+    """Upsert accumulated deltas and drop periods that no longer hold any trade"""
+    if not deltas:
+        return
+    table = PnLRollup.__table__
+    stmt = dialect_insert(conn, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.grain, table.c.period],
+        set_={
+            'pnl': table.c.pnl + stmt.excluded.pnl,
+            'wins': table.c.wins + stmt.excluded.wins,
+            'losses': table.c.losses + stmt.excluded.losses,
+            'breakeven': table.c.breakeven + stmt.excluded.breakeven,
+        }
+    )
+    conn.execute(stmt, [
+        {'user_id': user_id, 'grain': grain, 'period': period,
+         'pnl': d[0], 'wins': d[1], 'losses': d[2], 'breakeven': d[3]}
+        for (user_id, grain, period), d in deltas.items()
+    ])
+
+    user_ids = {key[0] for key in deltas}
+    conn.execute(delete(table).where(
+        table.c.user_id.in_(user_ids),
+        table.c.wins + table.c.losses + table.c.breakeven <= 0
+    ))
+
+
+def record_rows(conn, rows):
+    """Roll up freshly bulk-inserted journal rows (dicts with user_id, date, profit_loss)"""
+    deltas = {}
+    for row in rows:
+        collect(deltas, row.get('user_id'), row.get('date'), row.get('profit_loss'))
+    apply_deltas(conn, deltas)
+
+
+def rebuild(conn, user_id=None):
+    """Recompute rollups from scratch for one user (or everyone) with INSERT ... SELECT GROUP BY"""
+    from .queries import pnl_bucket_select
+
+    table = PnLRollup.__table__
+    clear = delete(table)
+    if user_id is not None:
+        clear = clear.where(table.c.user_id == user_id)
+    conn.execute(clear)
+
+    written = 0
+    for grain in GRAINS:
+        result = conn.execute(insert(table).from_select(
+            ['user_id', 'grain', 'period', 'pnl', 'wins', 'losses', 'breakeven'],
+            pnl_bucket_select(grain, user_id, conn.dialect.name)
+        ))
+        written += result.rowcount
+    return written
+
+
+# --- ORM hook ---
+
+# The old values are needed even when the entry was expired (e.g. by a commit)
+# before being changed; active_history makes the ORM load them on assignment
+TRACKED_ATTRS = ('user_id', 'date', 'profit_loss')
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    pass
+
+
+for _attr in TRACKED_ATTRS:
+    event.listen(getattr(JournalEntry, _attr), 'set', _keep_old_value, active_history=True)
+
+
+def _old_value(obj, attr):
+    history = inspect(obj).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(obj, attr)
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_journal_changes(session, flush_context, instances):
+    deltas = {}
+    for obj in session.new:
+        if isinstance(obj, JournalEntry):
+            if obj.date is None:
+                # Mirror the column default so the rollup and the row agree
+                obj.date = datetime.utcnow()
+            collect(deltas, obj.user_id, obj.date, obj.profit_loss)
+
+    for obj in session.deleted:
+        if isinstance(obj, JournalEntry):
+            collect(deltas, _old_value(obj, 'user_id'), _old_value(obj, 'date'),
+                    _old_value(obj, 'profit_loss'), sign=-1)
+
+    for obj in session.dirty:
+        if not isinstance(obj, JournalEntry):
+            continue
+        state = inspect(obj)
+        if not any(state.attrs[a].history.has_changes() for a in TRACKED_ATTRS):
+            continue
+        collect(deltas, _old_value(obj, 'user_id'), _old_value(obj, 'date'),
+                _old_value(obj, 'profit_loss'), sign=-1)
+        collect(deltas, obj.user_id, obj.date, obj.profit_loss)
+
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+# --- CLI ---
+
+@rollups_cli.command('rebuild-rollups')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user.')
+def rebuild_rollups_command(user_id):
+    """Recompute day/week/month/year P/L rollups from the journal."""
+    with db.engine.begin() as conn:
+        written = rebuild(conn, user_id)
+    click.echo(f"Rebuilt {written} rollup rows.")
@@ -1,78 +1,48 @@
-from flask import render_template
+from flask import render_template, jsonify, redirect, url_for, flash, abort, current_app
 from flask_login import login_required, current_user
-from app.models import JournalEntry
 from . import analytics_bp
-from datetime import datetime, timedelta
-from app.extensions import db
-from sqlalchemy import func
+from .queries import rollup_rows
+from . import engine, cache
+from . import rollups  # registers the journal -> rollup flush hook
+from . import excursions  # registers the excursion reset hook and `flask analytics excursions`
+from app.extensions import read_only
+from app.jobs.runner import enqueue
+from app import responses
+from app.responses import cached_response
 
 @analytics_bp.route('/')
+@read_only
 @login_required
+@cached_response
 def dashboard():
-    # Fetch all journal entries for the user
-    entries = JournalEntry.query.filter_by(user_id=current_user.id).order_by(JournalEntry.date).all()
+    # Read the pre-aggregated day/week/month/year rollups (see rollups.py)
+    # instead of walking every journal entry the user has ever made.
+    rows = rollup_rows(current_user.id)
 
-    # --- Weekly Analytics ---
-    # Group by week number/start date
-    weekly_data = {}
-    
-    # --- Monthly Analytics ---
-    monthly_data = {}
-    
-    # --- Yearly Analytics ---
-    yearly_data = {}
-    
     # --- Heatmap Data ---
     # Format: { 'yyyy-mm-dd': profit_loss }
     heatmap_data = {}
-    
+
+    # --- Weekly / Monthly / Yearly Analytics ---
+    weekly_data = {}
+    monthly_data = {}
+    yearly_data = {}
+
     # --- Win/Loss Rates ---
     weekly_win_loss = {} # { 'Week Start': {'wins': 0, 'losses': 0} }
     monthly_win_loss = {}
 
-    for entry in entries:
-        if not entry.date or entry.profit_loss is None:
-            continue
-            
-        date_str = entry.date.strftime('%Y-%m-%d')
-        
-        # Heatmap
-        # Aggregate P/L for the day
-        heatmap_data[date_str] = heatmap_data.get(date_str, 0) + entry.profit_loss
-
-        # Weekly (Identify by Monday of the week)
-        week_start = entry.date - timedelta(days=entry.date.weekday())
-        week_key = week_start.strftime('%Y-%m-%d')
-        
-        weekly_data[week_key] = weekly_data.get(week_key, 0) + entry.profit_loss
-        
-        if week_key not in weekly_win_loss:
-            weekly_win_loss[week_key] = {'wins': 0, 'losses': 0, 'be': 0}
-            
-        if entry.profit_loss > 0:
-            weekly_win_loss[week_key]['wins'] += 1
-        elif entry.profit_loss < 0:
-            weekly_win_loss[week_key]['losses'] += 1
-        else:
-            weekly_win_loss[week_key]['be'] += 1
-
-        # Monthly
-        month_key = entry.date.strftime('%Y-%m') # "2023-10"
-        monthly_data[month_key] = monthly_data.get(month_key, 0) + entry.profit_loss
-        
-        if month_key not in monthly_win_loss:
-            monthly_win_loss[month_key] = {'wins': 0, 'losses': 0, 'be': 0}
-            
-        if entry.profit_loss > 0:
-            monthly_win_loss[month_key]['wins'] += 1
-        elif entry.profit_loss < 0:
-            monthly_win_loss[month_key]['losses'] += 1
-        else:
-            monthly_win_loss[month_key]['be'] += 1
-
-        # Yearly
-        year_key = entry.date.strftime('%Y')
-        yearly_data[year_key] = yearly_data.get(year_key, 0) + entry.profit_loss
+    for grain, period, pnl, wins, losses, be in rows:
+        if grain == 'day':
+            heatmap_data[period] = pnl
+        elif grain == 'week':
+            weekly_data[period] = pnl
+            weekly_win_loss[period] = {'wins': wins, 'losses': losses, 'be': be}
+        elif grain == 'month':
+            monthly_data[period] = pnl
+            monthly_win_loss[period] = {'wins': wins, 'losses': losses, 'be': be}
+        elif grain == 'year':
+            yearly_data[period] = pnl
 
     # Sort data for charts
     sorted_weeks = sorted(weekly_data.keys())
@@ -93,7 +63,20 @@ def dashboard():
     chart_yearly_labels = sorted_years
     chart_yearly_values = [yearly_data[k] for k in sorted_years]
 
+    # Trade-level statistics from the vectorized engine
+    trades = cache.get_trades(current_user.id)
+    stats = engine.summary(trades)
+    chart_dow_values = [round(v, 2) for v in engine.pnl_by_weekday(trades).tolist()]
+    chart_hour_values = [round(v, 2) for v in engine.pnl_by_hour(trades).tolist()]
+
+    # Stop placement / exit efficiency from stored MAE/MFE columns
+    stop_stats = excursions.stop_efficiency(current_user.id)
+
     return render_template('analytics.html',
+                           stats=stats,
+                           stop_stats=stop_stats,
+                           chart_dow_values=chart_dow_values,
+                           chart_hour_values=chart_hour_values,
                            heatmap_data=heatmap_data,
                            chart_weekly_labels=chart_weekly_labels,
                            chart_weekly_values=chart_weekly_values,
@@ -105,3 +88,21 @@ def dashboard():
                            chart_monthly_losses=chart_monthly_losses,
                            chart_yearly_labels=chart_yearly_labels,
                            chart_yearly_values=chart_yearly_values)
+
+
+@analytics_bp.route('/excursions', methods=['POST'])
+@login_required
+def compute_excursions():
+    enqueue('compute_excursions', user_id=current_user.id)
+    flash('Excursion analysis started. Charts update when it finishes.', 'success')
+    return redirect(url_for('jobs.job_list'))
+
+
+@analytics_bp.route('/cache-stats')
+@login_required
+def cache_stats():
+    # Process-wide numbers, not the user's: only in debug mode or when explicitly enabled
+    if not (current_app.debug or current_app.config.get('CACHE_STATS_ENABLED')):
+        abort(404)
+    # Per worker process: hits/misses/evictions and memory held by the trade cache
+    return jsonify(dict(cache.stats(), responses=responses.stats()))
@@ -0,0 +1,183 @@
+"""
+Fingerprinted static assets.
+
+At startup every file under the static folder (except user uploads, which
+``app/uploads`` serves) is hashed into a manifest. ``asset_url('css/main.css')``,
+used like ``url_for('static', filename=...)``, returns ``/assets/css/main.<hash>.css``.
+The URL changes whenever the file does, so it can be served with a one-year
+``immutable`` Cache-Control and repeat page loads never ask for it again.
+
+Compressible files also get gzip (and, with the ``brotli`` package, brotli)
+siblings under ``ASSET_FOLDER``, written at startup when missing or ahead of
+time with ``flask assets build``. Responses pick the best encoding the client
+accepts.
+
+In debug mode a changed file is re-fingerprinted on its next ``asset_url``.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from pathlib import Path
+
+import click
+from flask import Blueprint, abort, current_app, request, send_file, url_for
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+assets_bp = Blueprint('assets', __name__)
+assets_cli = AppGroup('assets', help='Static asset commands.')
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+EXCLUDE = ('uploads',)  # top-level static folders that are not assets
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map'}
+MIN_COMPRESS_BYTES = 512
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]  # preferred first
+
+_lock = threading.Lock()
+
+
+class Asset:
+    __slots__ = ('filename', 'path', 'digest', 'mtime', 'encodings')
+
+    def __init__(self, filename, path, digest, mtime):
+        self.filename = filename
+        self.path = path
+        self.digest = digest
+        self.mtime = mtime
+        self.encodings = {}  # content-encoding -> precompressed file
+
+    @property
+    def hashed(self):
+        stem, ext = os.path.splitext(self.filename)
+        return f"{stem}.{self.digest}{ext}"
+
+
+def init_app(app):
+    app.extensions['assets'] = {'by_name': {}, 'by_hash': {}}
+    with app.app_context():
+        build_manifest()
+    app.register_blueprint(assets_bp, url_prefix='/assets')
+    app.add_template_global(asset_url)
+    app.cli.add_command(assets_cli)
+
+
+def _manifest():
+    return current_app.extensions['assets']
+
+
+def _static_files(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        if Path(dirpath) == root:
+            dirnames[:] = [d for d in dirnames if d not in EXCLUDE]
+        for name in filenames:
+            path = Path(dirpath) / name
+            yield path.relative_to(root).as_posix(), path
+
+
+# --- Manifest ---
+
+def _fingerprint(filename, path):
+    stat = path.stat()
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()[:12]
+    asset = Asset(filename, path, digest, stat.st_mtime)
+    _compress(asset)
+    return asset
+
+
+def _compress(asset):
+    """Write (or reuse) the precompressed siblings of an asset"""
+    if asset.path.suffix.lower() not in COMPRESSIBLE or asset.path.stat().st_size < MIN_COMPRESS_BYTES:
+        return
+    folder = Path(current_app.config['ASSET_FOLDER'])
+    data = None
+    for encoding, suffix in ENCODINGS:
+        if encoding == 'br' and brotli is None:
+            continue
+        target = folder / f"{asset.hashed}{suffix}"
+        if not target.exists():
+            data = data if data is not None else asset.path.read_bytes()
+            packed = brotli.compress(data, quality=11) if encoding == 'br' else gzip.compress(data, 9, mtime=0)
+            if len(packed) >= len(data):
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(packed)
+            os.replace(tmp, target)
+        asset.encodings[encoding] = target
+
+
+def _register(asset):
+    manifest = _manifest()
+    with _lock:
+        old = manifest['by_name'].get(asset.filename)
+        if old is not None:
+            manifest['by_hash'].pop(old.hashed, None)
+        manifest['by_name'][asset.filename] = asset
+        manifest['by_hash'][asset.hashed] = asset
+
+
+def build_manifest():
+    """Fingerprint every static asset (and precompress it). Returns the assets."""
+    root = Path(current_app.static_folder)
+    assets = [_fingerprint(filename, path) for filename, path in _static_files(root)]
+    for asset in assets:
+        _register(asset)
+    return assets
+
+
+def asset_url(filename):
+    """Fingerprinted URL of a static file; falls back to the plain static URL for unknown files"""
+    asset = _manifest()['by_name'].get(filename)
+    if asset is not None and current_app.debug:
+        # Files are edited while the dev server runs
+        try:
+            if asset.path.stat().st_mtime != asset.mtime:
+                asset = _fingerprint(filename, asset.path)
+                _register(asset)
+        except FileNotFoundError:
+            asset = None
+    if asset is None:
+        return url_for('static', filename=filename)
+    return url_for('assets.serve', filename=asset.hashed)
+
+
+# --- Serving ---
+
+@assets_bp.route('/<path:filename>')
+def serve(filename):
+    asset = _manifest()['by_hash'].get(filename)
+    if asset is None:
+        abort(404)
+
+    path, encoding = asset.path, None
+    for candidate, _ in ENCODINGS:
+        if candidate in asset.encodings and request.accept_encodings[candidate]:
+            path, encoding = asset.encodings[candidate], candidate
+            break
+
+    mimetype = mimetypes.guess_type(asset.filename)[0] or 'application/octet-stream'
+    # Each encoding is a different representation, so it needs its own validator
+    etag = f"{asset.digest}-{encoding}" if encoding else asset.digest
+    response = send_file(path, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE, etag=etag)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+# --- CLI ---
+
+@assets_cli.command('build')
+def build_command():
+    """Fingerprint and precompress static assets (normally done at startup)."""
+    for asset in sorted(build_manifest(), key=lambda a: a.filename):
+        encodings = ', '.join(sorted(asset.encodings)) or 'uncompressed'
+        click.echo(f"{asset.filename} -> {asset.hashed} ({encodings})")
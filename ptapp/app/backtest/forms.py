@@ -1,7 +1,9 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, DateTimeField, TextAreaField, FileField, SubmitField, SelectField
-from wtforms.validators import DataRequired, Optional
+from wtforms import StringField, DateTimeField, TextAreaField, FileField, SubmitField, SelectField, \
+    IntegerField, FloatField, DateField, SelectMultipleField
+from wtforms.validators import DataRequired, Optional, NumberRange
 import re
+from .replay import RULES
 
 class CurrencyFloatField(StringField):
     """Custom field that strips currency symbols and formatting before validation"""
@@ -15,6 +17,21 @@ class CurrencyFloatField(StringField):
                 valuelist[0] = cleaned if cleaned else ''
         return super(CurrencyFloatField, self).process_formdata(valuelist)
 
+class NumberListField(StringField):
+    """Comma separated numbers, e.g. "10, 15, 20" -> [10.0, 15.0, 20.0]"""
+
+    def process_formdata(self, valuelist):
+        super(NumberListField, self).process_formdata(valuelist)
+        self.numbers = []
+        for part in (self.data or '').split(','):
+            part = part.strip()
+            if not part:
+                continue
+            try:
+                self.numbers.append(float(part))
+            except ValueError:
+                raise ValueError(f"'{part}' is not a number")
+
 class BacktestForm(FlaskForm):
     strategy_name = StringField("Strategy Name", validators=[DataRequired()], 
                                 render_kw={"placeholder": "e.g., Breakout Strategy"})
@@ -42,3 +59,66 @@ class BacktestForm(FlaskForm):
     
     submit = SubmitField("Save Backtest")
 
+
+
+class ReplayForm(FlaskForm):
+    """Candle replay settings; series choices are filled from CANDLE_FOLDER by the view"""
+    series = SelectField("Pair / Timeframe", validators=[DataRequired()])
+    strategy_name = StringField("Strategy Name", validators=[Optional()],
+                                render_kw={"placeholder": "Defaults to rule, pair and timeframe"})
+    rule = SelectField("Entry Rule", choices=[(name, spec['label']) for name, spec in RULES.items()])
+
+    # Rule parameters (only the ones the chosen rule uses are read)
+    fast = IntegerField("Fast MA", default=10, validators=[Optional(), NumberRange(min=1)])
+    slow = IntegerField("Slow MA", default=30, validators=[Optional(), NumberRange(min=2)])
+    lookback = IntegerField("Breakout Lookback", default=20, validators=[Optional(), NumberRange(min=1)])
+    period = IntegerField("RSI Period", default=14, validators=[Optional(), NumberRange(min=2)])
+
+    stop_pips = FloatField("Stop (pips)", default=20, validators=[DataRequired(), NumberRange(min=0.1)])
+    rr = FloatField("Target (R multiple)", default=2, validators=[DataRequired(), NumberRange(min=0.1)])
+    max_hold = IntegerField("Max Bars in Trade", default=240, validators=[DataRequired(), NumberRange(min=1)])
+    session = SelectField("Session", choices=[('', 'Any time'), ('asia', 'Asia'),
+                                              ('london', 'London'), ('newyork', 'New York')], default='')
+    direction = SelectField("Direction", choices=[('both', 'Buy & Sell'), ('buy', 'Buy only'),
+                                                  ('sell', 'Sell only')])
+    start = DateField("From", validators=[Optional()])
+    end = DateField("To", validators=[Optional()])
+
+    submit = SubmitField("Run Replay")
+
+    RULE_PARAMS = {'ma_cross': ('fast', 'slow'), 'breakout': ('lookback',), 'rsi_reversal': ('period',)}
+
+    def rule_params(self):
+        return {name: getattr(self, name).data for name in self.RULE_PARAMS[self.rule.data]
+                if getattr(self, name).data is not None}
+
+
+class SweepForm(FlaskForm):
+    """Parameter grid for a sweep; each list field is comma separated"""
+    name = StringField("Sweep Name", validators=[Optional()])
+    pairs = SelectMultipleField("Pairs", validators=[DataRequired()])
+    timeframe = SelectField("Timeframe")
+    rule = SelectField("Entry Rule", choices=[(name, spec['label']) for name, spec in RULES.items()])
+
+    fast = NumberListField("Fast MA", default="5, 10, 20")
+    slow = NumberListField("Slow MA", default="30, 50, 100")
+    lookback = NumberListField("Breakout Lookback", default="10, 20, 50")
+    period = NumberListField("RSI Period", default="7, 14, 21")
+
+    stops = NumberListField("Stops (pips)", default="10, 15, 20, 30", validators=[DataRequired()])
+    rrs = NumberListField("Targets (R multiples)", default="1, 1.5, 2, 3", validators=[DataRequired()])
+    sessions = SelectMultipleField("Sessions", choices=[('', 'Any time'), ('asia', 'Asia'),
+                                                        ('london', 'London'), ('newyork', 'New York')],
+                                   default=[''])
+    direction = SelectField("Direction", choices=[('both', 'Buy & Sell'), ('buy', 'Buy only'),
+                                                  ('sell', 'Sell only')])
+    max_hold = IntegerField("Max Bars in Trade", default=240, validators=[DataRequired(), NumberRange(min=1)])
+    start = DateField("From", validators=[Optional()])
+    end = DateField("To", validators=[Optional()])
+
+    submit = SubmitField("Start Sweep")
+
+    def rule_grid(self):
+        """{param: [values]} for the chosen rule; period-like params are whole numbers"""
+        return {name: [int(v) for v in getattr(getattr(self, name), 'numbers', [])] or [RULES[self.rule.data]['defaults'][name]]
+                for name in ReplayForm.RULE_PARAMS[self.rule.data]}
@@ -0,0 +1,289 @@
+"""
+Rule-driven candle replay.
+
+Entry signals for a whole candle series come from array operations (moving
+averages, rolling highs/lows, RSI). Every candidate entry's exit (stop, target
+or holding-time limit) is then found for all of them at once by a binary
+search over precomputed low/high extremes (see ExitSearch). Trades that would overlap an earlier open trade are
+dropped in a single pass. The surviving trades are written as BacktestEntry
+rows with one bulk insert + commit per chunk, tagged with the BacktestRun they
+came from.
+"""
+import json
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from app.extensions import db
+from app.models import BacktestEntry, BacktestRun
+from app.market.candles import pip_size
+from app.responses import bump_content_version
+
+INSERT_CHUNK = 5000
+
+# UTC hours [start, end) in which entries are allowed
+SESSIONS = {
+    'asia': (0, 8),
+    'london': (7, 16),
+    'newyork': (12, 21),
+}
+
+RULES = {}
+
+
+def rule(name, label, **defaults):
+    """Register signal(candles, **params) -> (long_mask, short_mask) as a replay rule"""
+    def decorator(func):
+        RULES[name] = {'func': func, 'label': label, 'defaults': defaults}
+        return func
+    return decorator
+
+
+# --- Indicators ---
+
+def sma(values, period):
+    """Simple moving average; NaN until `period` values are available"""
+    out = np.full(len(values), np.nan)
+    if period <= len(values):
+        sums = np.cumsum(np.insert(values, 0, 0.0))
+        out[period - 1:] = (sums[period:] - sums[:-period]) / period
+    return out
+
+
+def _crossed_above(a, b):
+    above = a > b
+    return above & ~np.roll(above, 1) & ~np.isnan(np.roll(a, 1)) & ~np.isnan(np.roll(b, 1))
+
+
+def _prior_extreme(values, lookback, reducer):
+    """reducer over the previous `lookback` values (excluding the current one)"""
+    out = np.full(len(values), np.nan)
+    if lookback < len(values):
+        out[lookback:] = reducer(sliding_window_view(values, lookback), axis=1)[:-1]
+    return out
+
+
+def rsi(close, period):
+    delta = np.diff(close, prepend=close[:1])
+    gain = sma(np.maximum(delta, 0), period)
+    loss = sma(np.maximum(-delta, 0), period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = gain / loss
+    return np.where(loss == 0, 100.0, 100 - 100 / (1 + rs))
+
+
+# --- Rules ---
+
+@rule('ma_cross', 'Moving average cross', fast=10, slow=30)
+def ma_cross(candles, fast, slow):
+    fast_ma, slow_ma = sma(candles.close, int(fast)), sma(candles.close, int(slow))
+    return _crossed_above(fast_ma, slow_ma), _crossed_above(slow_ma, fast_ma)
+
+
+@rule('breakout', 'Range breakout', lookback=20)
+def breakout(candles, lookback):
+    lookback = int(lookback)
+    prior_high = _prior_extreme(candles.high, lookback, np.max)
+    prior_low = _prior_extreme(candles.low, lookback, np.min)
+    up = candles.close > prior_high
+    down = candles.close < prior_low
+    # Only the first close outside the range
+    return up & ~np.roll(up, 1), down & ~np.roll(down, 1)
+
+
+@rule('rsi_reversal', 'RSI reversal', period=14, lower=30, upper=70)
+def rsi_reversal(candles, period, lower, upper):
+    values = rsi(candles.close, int(period))
+    prev = np.roll(values, 1)
+    return (prev < lower) & (values >= lower), (prev > upper) & (values <= upper)
+
+
+# --- Simulation ---
+
+def session_mask(ts, session):
+    if not session:
+        return np.ones(len(ts), dtype=bool)
+    start, end = SESSIONS[session]
+    hours = (ts // 3600) % 24
+    return (hours >= start) & (hours < end)
+
+
+class ExitSearch:
+    """
+    Sparse tables of low minima and (negated) high maxima over power-of-two
+    bar spans, so the first bar touching a price level within max_hold bars
+    is found with about log2(max_hold) lookups per trade instead of a scan of
+    every bar. Built once per candle series (and reused across a sweep).
+    """
+
+    def __init__(self, candles, max_hold):
+        self.max_hold = int(max_hold)
+        # Padding past the last bar never touches anything
+        pad = np.full(self.max_hold, np.inf)
+        self.lows = self._levels(np.concatenate((candles.low, pad)))
+        self.neg_highs = self._levels(np.concatenate((-np.asarray(candles.high), pad)))
+
+    def _levels(self, values):
+        levels = [values]
+        span = 1
+        while span * 2 <= self.max_hold:
+            levels.append(np.minimum(levels[-1][:-span], levels[-1][span:]))
+            span *= 2
+        return levels
+
+    def first_touch(self, start, threshold, on_lows, horizon):
+        """
+        Bars from `start` until the first one whose low (on_lows) or negated
+        high is <= threshold; `horizon` if none does within horizon bars.
+        """
+        pos = start.copy()
+        remaining = np.full(len(start), horizon)
+        for k in reversed(range(len(self.lows))):
+            step = 1 << k
+            usable = remaining >= step
+            at = np.where(usable, pos, 0)
+            span_min = np.where(on_lows, self.lows[k][at], self.neg_highs[k][at])
+            advance = (usable & (span_min > threshold)) * step
+            pos += advance
+            remaining -= advance
+        return pos - start
+
+
+def simulate_exits(candles, entry_idx, side, stop_dist, rr, max_hold, search=None):
+    """
+    Exit bar and price for each entry (entered at the open of entry_idx).
+    A bar touching both stop and target counts as a stop; trades still open
+    after max_hold bars close at that bar's close.
+    """
+    n = len(candles)
+    if search is None or search.max_hold < max_hold:
+        search = ExitSearch(candles, max_hold)
+
+    entry_price = candles.open[entry_idx]
+    stop = entry_price - side * stop_dist
+    target = entry_price + side * stop_dist * rr
+    longs = side > 0
+
+    # Longs: stop on a low <= stop, target on a high >= target; shorts the other way round
+    first_stop = search.first_touch(entry_idx, np.where(longs, stop, -stop), longs, max_hold)
+    first_target = search.first_touch(entry_idx, np.where(longs, -target, target), ~longs, max_hold)
+
+    offset = np.minimum(first_stop, first_target)
+    timed_out = offset == max_hold
+    last = np.minimum(entry_idx + max_hold - 1, n - 1)
+    exit_idx = np.where(timed_out, last, entry_idx + offset)
+    exit_price = np.where(
+        timed_out, candles.close[last],
+        np.where(first_stop <= first_target, stop, target)
+    )
+    return exit_idx, exit_price
+
+
+def drop_overlaps(entry_idx, exit_idx):
+    """Keep trades in order, skipping any that start before the previous one closed"""
+    keep = np.zeros(len(entry_idx), dtype=bool)
+    # Jump straight to the first entry after each kept trade's exit (entries are sorted)
+    next_after_exit = np.searchsorted(entry_idx, exit_idx, side='right').tolist()
+    i = 0
+    while i < len(keep):
+        keep[i] = True
+        i = next_after_exit[i]
+    return keep
+
+
+def entry_signals(candles, rule_name, params=None, session=None, direction='both'):
+    """(entry bar indexes, sides +1/-1, resolved params) for a rule; entries are at the bar after the signal"""
+    spec = RULES[rule_name]
+    params = dict(spec['defaults'], **(params or {}))
+    longs, shorts = spec['func'](candles, **params)
+
+    allowed = session_mask(candles.ts, session)
+    if direction == 'buy':
+        shorts = np.zeros_like(shorts)
+    elif direction == 'sell':
+        longs = np.zeros_like(longs)
+    longs, shorts = longs & allowed, shorts & allowed & ~longs
+
+    # Signal on a bar's close, enter at the next bar's open
+    signal_idx = np.flatnonzero(longs | shorts)
+    signal_idx = signal_idx[signal_idx + 1 < len(candles)]
+    return signal_idx + 1, np.where(longs[signal_idx], 1, -1), params
+
+
+def simulate(candles, entry_idx, side, pair=None, stop_pips=20.0, rr=2.0, max_hold=240, search=None):
+    """Trades for the given entries: exits, overlap removal and P/L. Returns a dict of per-trade arrays."""
+    stop_dist = stop_pips * pip_size(pair)
+    exit_idx, exit_price = simulate_exits(candles, entry_idx, side, stop_dist, rr, int(max_hold), search)
+    keep = drop_overlaps(entry_idx, exit_idx)
+
+    entry_idx, exit_idx, side, exit_price = entry_idx[keep], exit_idx[keep], side[keep], exit_price[keep]
+    entry_price = candles.open[entry_idx]
+    return {
+        'entry_idx': entry_idx,
+        'exit_idx': exit_idx,
+        'side': side,
+        'entry_price': entry_price,
+        'exit_price': exit_price,
+        'pnl': (exit_price - entry_price) * side,
+    }
+
+
+def replay(candles, rule_name, params=None, pair=None, stop_pips=20.0, rr=2.0, max_hold=240,
+           session=None, direction='both'):
+    """Simulate a rule over candles. Returns a dict of per-trade arrays (plus the resolved params)."""
+    entry_idx, side, params = entry_signals(candles, rule_name, params, session, direction)
+    trades = simulate(candles, entry_idx, side, pair, stop_pips, rr, max_hold)
+    trades['params'] = params
+    return trades
+
+
+def _utc(epoch_seconds):
+    return datetime.fromtimestamp(epoch_seconds, tz=timezone.utc).replace(tzinfo=None)
+
+
+def run_replay(user_id, candles, pair, timeframe, strategy_name, rule_name, params=None,
+               stop_pips=20.0, rr=2.0, max_hold=240, session=None, direction='both', progress=None):
+    """Replay and store the trades as BacktestEntry rows of a new BacktestRun. Returns the run."""
+    started = time.perf_counter()
+    trades = replay(candles, rule_name, params, pair=pair, stop_pips=stop_pips, rr=rr,
+                    max_hold=max_hold, session=session, direction=direction)
+
+    run = BacktestRun(
+        user_id=user_id, pair=pair, timeframe=timeframe, strategy_name=strategy_name, rule=rule_name,
+        params=json.dumps({**trades['params'], 'stop_pips': stop_pips, 'rr': rr, 'max_hold': max_hold,
+                           'session': session, 'direction': direction}),
+        candles=len(candles), trades=len(trades['pnl']), wins=int((trades['pnl'] > 0).sum()),
+        net_pips=float(trades['pnl'].sum() / pip_size(pair)),
+    )
+    db.session.add(run)
+    db.session.flush()
+
+    now = datetime.utcnow()
+    table = BacktestEntry.__table__
+    total = len(trades['pnl'])
+    for lo in range(0, total, INSERT_CHUNK):
+        part = slice(lo, lo + INSERT_CHUNK)
+        db.session.execute(table.insert(), [{
+            'user_id': user_id, 'run_id': run.id, 'pair': pair, 'strategy_name': strategy_name,
+            'direction': 'buy' if side > 0 else 'sell',
+            'entry_time': _utc(entry_ts), 'exit_time': _utc(exit_ts),
+            'entry_price': entry_price, 'exit_price': exit_price,
+            'result': 'win' if pnl > 0 else 'loss', 'created_at': now,
+        } for side, entry_ts, exit_ts, entry_price, exit_price, pnl in zip(
+            trades['side'][part].tolist(),
+            candles.ts[trades['entry_idx'][part]].tolist(),
+            candles.ts[trades['exit_idx'][part]].tolist(),
+            trades['entry_price'][part].tolist(),
+            trades['exit_price'][part].tolist(),
+            trades['pnl'][part].tolist(),
+        )])
+        bump_content_version(db.session.connection(), [user_id])
+        db.session.commit()
+        if progress:
+            progress(min(lo + INSERT_CHUNK, total), total)
+
+    run.elapsed_ms = int((time.perf_counter() - started) * 1000)
+    db.session.commit()
+    return run
@@ -1,11 +1,18 @@
-import os
-from flask import Blueprint, render_template, redirect, url_for, flash, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, current_app, request
 from flask_login import login_required, current_user
-from werkzeug.utils import secure_filename
-from app.extensions import db
-from app.models import BacktestEntry
-from .forms import BacktestForm
-from collections import defaultdict
+from sqlalchemy.orm import defer
+from app.extensions import db, read_only
+import json
+from app.models import BacktestEntry, BacktestRun, BacktestSweep, SweepResult
+from app.analytics.queries import backtest_strategy_stats
+from app.jobs.runner import enqueue
+from app.market import store
+from app.market.candles import day_bounds
+from app.pagination import keyset_page, render_rows
+from app.responses import cached_response
+from app.uploads.storage import save_upload
+from .forms import BacktestForm, ReplayForm, SweepForm
+from .sweep import combination_count, heatmap
 
 backtest_bp = Blueprint('backtest', __name__, url_prefix='/backtest')
 
@@ -14,14 +21,7 @@ backtest_bp = Blueprint('backtest', __name__, url_prefix='/backtest')
 def add_backtest():
     form = BacktestForm()
     if form.validate_on_submit():
-        after_img = None
-
-        if form.after_image.data:
-            after_file = form.after_image.data
-            after_img = secure_filename(after_file.filename)
-            upload_path = os.path.join(current_app.static_folder, 'uploads')
-            os.makedirs(upload_path, exist_ok=True)
-            after_file.save(os.path.join(upload_path, after_img))
+        after_img = save_upload(form.after_image.data)
 
         # Convert string prices to float
         entry_price = float(form.entry_price.data) if form.entry_price.data else None
@@ -49,10 +49,14 @@ def add_backtest():
 
 
 @backtest_bp.route('/list')
+@read_only
 @login_required
 def list_backtests():
-    entries = BacktestEntry.query.filter_by(user_id=current_user.id).order_by(BacktestEntry.created_at.desc()).all()
-    return render_template('backtest_list.html', entries=entries)
+    query = BacktestEntry.query.filter_by(user_id=current_user.id).options(defer(BacktestEntry.notes))
+    page = keyset_page(query, BacktestEntry.created_at, BacktestEntry.id, request.args.get('cursor'))
+    if request.args.get('partial'):
+        return render_rows('_backtest_rows.html', page, entries=page.items)
+    return render_template('backtest_list.html', entries=page.items, page=page)
 
 
 @backtest_bp.route('/view/<int:entry_id>')
@@ -66,71 +70,43 @@ def view_backtest(entry_id):
 
 
 @backtest_bp.route('/analytics')
+@read_only
 @login_required
+@cached_response
 def analytics():
     """Show backtest analytics and strategy performance"""
-    entries = BacktestEntry.query.filter_by(user_id=current_user.id).all()
+    rows = backtest_strategy_stats(current_user.id)
     
-    if not entries:
+    if not rows:
         return render_template('backtest_analytics.html', 
                              total_trades=0,
                              strategies={})
     
+    # Per-Strategy Stats (aggregated in SQL, one row per strategy)
+    strategy_stats = {}
+    for strategy, total, wins, pnl, gross_profit, gross_loss in rows:
+        strategy_stats[strategy] = {
+            'total': total,
+            'wins': wins,
+            'losses': total - wins,
+            'pnl': pnl,
+            'gross_profit': gross_profit,
+            'gross_loss': gross_loss,
+            'win_rate': (wins / total * 100) if total > 0 else 0,
+            'profit_factor': (gross_profit / gross_loss) if gross_loss > 0 else 0
+        }
+    
     # Overall Stats
-    total_trades = len(entries)
-    wins = sum(1 for e in entries if e.result == 'win')
+    total_trades = sum(s['total'] for s in strategy_stats.values())
+    wins = sum(s['wins'] for s in strategy_stats.values())
     losses = total_trades - wins
     win_rate = (wins / total_trades * 100) if total_trades > 0 else 0
     
-    # Calculate P/L
-    total_pnl = 0
-    gross_profit = 0
-    gross_loss = 0
-    
-    for e in entries:
-        if e.entry_price and e.exit_price:
-            pnl = e.exit_price - e.entry_price
-            total_pnl += pnl
-            if pnl > 0:
-                gross_profit += pnl
-            else:
-                gross_loss += abs(pnl)
-    
+    total_pnl = sum(s['pnl'] for s in strategy_stats.values())
+    gross_profit = sum(s['gross_profit'] for s in strategy_stats.values())
+    gross_loss = sum(s['gross_loss'] for s in strategy_stats.values())
     profit_factor = (gross_profit / gross_loss) if gross_loss > 0 else 0
     
-    # Per-Strategy Stats
-    strategy_stats = defaultdict(lambda: {
-        'total': 0,
-        'wins': 0,
-        'losses': 0,
-        'pnl': 0,
-        'gross_profit': 0,
-        'gross_loss': 0
-    })
-    
-    for e in entries:
-        strategy = e.strategy_name or 'Unnamed Strategy'
-        stats = strategy_stats[strategy]
-        stats['total'] += 1
-        
-        if e.result == 'win':
-            stats['wins'] += 1
-        else:
-            stats['losses'] += 1
-        
-        if e.entry_price and e.exit_price:
-            pnl = e.exit_price - e.entry_price
-            stats['pnl'] += pnl
-            if pnl > 0:
-                stats['gross_profit'] += pnl
-            else:
-                stats['gross_loss'] += abs(pnl)
-    
-    # Calculate derived metrics for each strategy
-    for strategy, stats in strategy_stats.items():
-        stats['win_rate'] = (stats['wins'] / stats['total'] * 100) if stats['total'] > 0 else 0
-        stats['profit_factor'] = (stats['gross_profit'] / stats['gross_loss']) if stats['gross_loss'] > 0 else 0
-    
     return render_template('backtest_analytics.html',
                          total_trades=total_trades,
                          wins=wins,
@@ -138,5 +114,113 @@ def analytics():
                          win_rate=round(win_rate, 1),
                          total_pnl=round(total_pnl, 2),
                          profit_factor=round(profit_factor, 2),
-                         strategies=dict(strategy_stats))
+                         strategies=strategy_stats)
+
+
+@backtest_bp.route('/replay', methods=['GET', 'POST'])
+@login_required
+def replay():
+    """Replay a rule over local candles in the background; trades land in analytics"""
+    form = ReplayForm()
+    stored = set(store.available_series())
+    form.series.choices = [
+        (f"{pair}_{tf}", f"{pair} {tf}" + ('' if (pair, tf) in stored else ' (resampled)'))
+        for pair in sorted({pair for pair, _ in stored}) for tf in store.timeframes_for(pair)
+    ]
+
+    if form.validate_on_submit():
+        pair, timeframe = form.series.data.rsplit('_', 1)
+        enqueue('backtest_replay', user_id=current_user.id, pair=pair, timeframe=timeframe,
+                rule=form.rule.data, strategy_name=form.strategy_name.data or None,
+                params=form.rule_params(), stop_pips=form.stop_pips.data, rr=form.rr.data,
+                max_hold=form.max_hold.data, session=form.session.data or None,
+                direction=form.direction.data,
+                start=form.start.data.isoformat() if form.start.data else None,
+                end=form.end.data.isoformat() if form.end.data else None)
+        flash('Replay started. Results appear in Backtest Analytics when it finishes.', 'success')
+        return redirect(url_for('jobs.job_list'))
+
+    runs = BacktestRun.query.filter_by(user_id=current_user.id) \
+        .order_by(BacktestRun.created_at.desc()).limit(20).all()
+    return render_template('backtest_replay.html', form=form, runs=runs)
+
+
+@backtest_bp.route('/sweeps', methods=['GET', 'POST'])
+@login_required
+def sweeps():
+    """Start a parameter sweep and list earlier ones"""
+    form = SweepForm()
+    pairs = sorted({pair for pair, _ in store.available_series()})
+    form.pairs.choices = [(pair, pair) for pair in pairs]
+    form.timeframe.choices = [(tf, tf) for tf in store.TIMEFRAMES
+                              if any(tf in store.timeframes_for(pair) for pair in pairs)]
+
+    if form.validate_on_submit():
+        grid = {
+            'pairs': form.pairs.data,
+            'params': form.rule_grid(),
+            'stops': form.stops.numbers,
+            'rrs': form.rrs.numbers,
+            'sessions': [s or None for s in form.sessions.data] or [None],
+            'direction': form.direction.data,
+            'max_hold': form.max_hold.data,
+        }
+        grid['start'], grid['end'] = day_bounds(form.start.data, form.end.data)
+        unreadable = [pair for pair in grid['pairs'] if form.timeframe.data not in store.timeframes_for(pair)]
+        combinations = combination_count(grid)
+        limit = current_app.config.get('SWEEP_MAX_COMBINATIONS', 5000)
+        if unreadable:
+            flash(f"No {form.timeframe.data} candles for {', '.join(unreadable)}.", 'danger')
+        elif combinations > limit:
+            flash(f"That grid has {combinations} combinations; the limit is {limit}.", 'danger')
+        else:
+            sweep = BacktestSweep(user_id=current_user.id, name=form.name.data or None, rule=form.rule.data,
+                                  timeframe=form.timeframe.data, grid=json.dumps(grid),
+                                  combinations=combinations, completed=0)
+            db.session.add(sweep)
+            db.session.commit()
+            enqueue('backtest_sweep', user_id=current_user.id, sweep_id=sweep.id)
+            flash(f"Sweep of {combinations} combinations started.", 'success')
+            return redirect(url_for('backtest.sweep_detail', sweep_id=sweep.id))
+
+    history = BacktestSweep.query.filter_by(user_id=current_user.id) \
+        .order_by(BacktestSweep.created_at.desc()).limit(20).all()
+    return render_template('backtest_sweeps.html', form=form, sweeps=history)
+
+
+SWEEP_SORTS = {
+    'net_pips': SweepResult.net_pips.desc(),
+    'profit_factor': SweepResult.profit_factor.desc(),
+    'expectancy': SweepResult.expectancy.desc(),
+    'drawdown': SweepResult.max_drawdown.asc(),
+    'trades': SweepResult.trades.desc(),
+}
+
+
+@backtest_bp.route('/sweeps/<int:sweep_id>')
+@read_only
+@login_required
+def sweep_detail(sweep_id):
+    """Ranked results of a sweep and a stop x target heatmap"""
+    sweep = BacktestSweep.query.get_or_404(sweep_id)
+    if sweep.user_id != current_user.id:
+        flash('Unauthorized', 'danger')
+        return redirect(url_for('backtest.sweeps'))
+
+    sort = request.args.get('sort', 'net_pips')
+    if sort not in SWEEP_SORTS:
+        sort = 'net_pips'
+    ranked = SweepResult.query.filter_by(sweep_id=sweep.id) \
+        .order_by(SWEEP_SORTS[sort], SweepResult.id).limit(100).all()
+
+    grid = json.loads(sweep.grid)
+    pair = request.args.get('pair') or grid['pairs'][0]
+    session = request.args.get('session', grid['sessions'][0] or '')
+    results = SweepResult.query.filter_by(sweep_id=sweep.id, pair=pair) \
+        .options(defer(SweepResult.params)).all()
+    stops, rrs, cells = heatmap(results, pair, session)
+    values = [cell.net_pips for cell in cells.values()]
+    scale = max((abs(v) for v in values), default=0) or 1
 
+    return render_template('backtest_sweep_detail.html', sweep=sweep, grid=grid, ranked=ranked, sort=sort,
+                           pair=pair, session=session, stops=stops, rrs=rrs, cells=cells, scale=scale)
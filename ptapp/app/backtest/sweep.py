@@ -0,0 +1,145 @@
+"""
+Parameter sweeps over candle replays.
+
+A sweep is the cross product of the rule's parameter lists, stop distances,
+reward multiples and session filters, for each pair. Combinations that share a
+pair, rule parameters and session also share their entry signals, so they form
+one pool task: the worker computes the signals once and simulates every
+stop/target pair against them, reusing the series' ExitSearch tables.
+
+Workers open the memory-mapped candle store themselves, so candles are never
+pickled or copied between processes. Each finished task's metrics are written
+to ``sweep_results`` by the calling process as soon as it arrives.
+"""
+import itertools
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from app.extensions import db
+from app.models import SweepResult
+from app.market import store
+from app.market.candles import pip_size
+from .replay import ExitSearch, entry_signals, simulate
+
+
+def expand_grid(grid):
+    """
+    Pool tasks for a grid dict (pairs, params: {name: [values]}, sessions,
+    stops, rrs): a list of (pair, params, session, [(stop, rr), ...]).
+    """
+    names = sorted(grid.get('params', {}))
+    param_sets = [dict(zip(names, values))
+                  for values in itertools.product(*(grid['params'][n] for n in names))]
+    exits = list(itertools.product(grid['stops'], grid['rrs']))
+    return [(pair, params, session, exits)
+            for pair in grid['pairs']
+            for params in param_sets
+            for session in grid.get('sessions') or [None]]
+
+
+def combination_count(grid):
+    return sum(len(exits) for *_, exits in expand_grid(grid))
+
+
+def metrics(pips):
+    """Summary of a trade sequence's P/L in pips"""
+    wins = pips > 0
+    gross_profit = float(pips[wins].sum())
+    gross_loss = float(-pips[~wins].sum())
+    equity = np.cumsum(pips)
+    peak = np.maximum.accumulate(np.concatenate(([0.0], equity)))[1:]
+    return {
+        'trades': len(pips),
+        'wins': int(wins.sum()),
+        'net_pips': float(equity[-1]) if len(pips) else 0.0,
+        'profit_factor': gross_profit / gross_loss if gross_loss > 0 else None,
+        'expectancy': float(pips.mean()) if len(pips) else 0.0,
+        'max_drawdown': float((peak - equity).max()) if len(pips) else 0.0,
+    }
+
+
+# --- Pool workers ---
+
+_worker_root = None
+_worker_series = {}  # last series loaded by this worker (tasks arrive grouped by pair)
+
+
+def _init_worker(root):
+    # Workers build no Flask app and touch no database: they only read the candle store at root
+    global _worker_root
+    _worker_root = root
+
+
+def _series(pair, timeframe, start, end, max_hold):
+    """(candles, ExitSearch) for a series, reused across this worker's tasks"""
+    key = (pair, timeframe, start, end, max_hold)
+    if key not in _worker_series:
+        _worker_series.clear()
+        candles = store.load(pair, timeframe, start, end, root=_worker_root)
+        _worker_series[key] = (candles, ExitSearch(candles, max_hold))
+    return _worker_series[key]
+
+
+def _evaluate_group(pair, timeframe, start, end, rule, params, session, direction, max_hold, exits):
+    """Runs in a pool process: metrics for every (stop, rr) of one signal group"""
+    candles, search = _series(pair, timeframe, start, end, max_hold)
+    entry_idx, side, resolved = entry_signals(candles, rule, params, session, direction)
+    pip = pip_size(pair)
+    rows = []
+    for stop, rr in exits:
+        trades = simulate(candles, entry_idx, side, pair, stop, rr, max_hold, search)
+        rows.append(dict(metrics(trades['pnl'] / pip), pair=pair, params=json.dumps(resolved),
+                         session=session, stop_pips=stop, rr=rr))
+    return rows
+
+
+# --- Runner ---
+
+def run_sweep(sweep, workers=None, progress=None):
+    """Evaluate every combination of a BacktestSweep, streaming rows into sweep_results"""
+    started = time.perf_counter()
+    grid = json.loads(sweep.grid)
+    tasks = expand_grid(grid)
+    total = sum(len(exits) for *_, exits in tasks)
+    table = SweepResult.__table__
+
+    # Sweeps run from a job thread of the web process: spawn, don't fork it
+    pool = ProcessPoolExecutor(max_workers=workers or None, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker, initargs=(str(store.store_root()),))
+    with pool:
+        futures = [pool.submit(_evaluate_group, pair, sweep.timeframe, grid.get('start'), grid.get('end'),
+                               sweep.rule, params, session, grid.get('direction', 'both'),
+                               grid.get('max_hold', 240), exits)
+                   for pair, params, session, exits in tasks]
+        for future in as_completed(futures):
+            rows = future.result()
+            db.session.execute(table.insert(), [dict(row, sweep_id=sweep.id) for row in rows])
+            sweep.completed = (sweep.completed or 0) + len(rows)
+            db.session.commit()
+            if progress:
+                progress(sweep.completed, total)
+
+    sweep.elapsed_ms = int((time.perf_counter() - started) * 1000)
+    db.session.commit()
+    return sweep
+
+
+def heatmap(results, pair, session):
+    """
+    Best net pips per (stop, rr) for one pair/session over the other parameters:
+    (stops, rrs, {(stop, rr): result}).
+    """
+    cells = {}
+    for result in results:
+        if result.pair != pair or (result.session or '') != (session or ''):
+            continue
+        key = (result.stop_pips, result.rr)
+        if key not in cells or result.net_pips > cells[key].net_pips:
+            cells[key] = result
+    stops = sorted({stop for stop, _ in cells})
+    rrs = sorted({rr for _, rr in cells})
+    return stops, rrs, cells
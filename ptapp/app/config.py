@@ -9,5 +9,75 @@ class Config:
         "DATABASE_URL", f"sqlite:///{BASE_DIR / 'new_data.db'}"
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER", str(BASE_DIR / "static" / "uploads"))
+    UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER", str(BASE_DIR / "app" / "static" / "uploads")) # content-addressed (app/uploads/storage.py)
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+    IMPORT_FOLDER = os.environ.get("IMPORT_FOLDER", str(BASE_DIR / "instance" / "imports"))
+    ASSET_FOLDER = os.environ.get("ASSET_FOLDER", str(BASE_DIR / "instance" / "assets")) # precompressed static files (app/assets.py)
+    CANDLE_FOLDER = os.environ.get("CANDLE_FOLDER", str(BASE_DIR / "instance" / "candles")) # memmapped store (app/market/store.py)
+    EXCURSION_MAX_HOURS = 48 # journal trades have no exit time: follow them this long at most
+
+    # Background jobs (app/jobs/runner.py)
+    JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+    JOB_STALE_SECONDS = 300 # running jobs without a heartbeat for this long are requeued
+    JOB_HEARTBEAT_SECONDS = 30 # how often the runner refreshes a running job's heartbeat
+
+    # Per-process trade cache (app/analytics/cache.py)
+    TRADE_CACHE_MAX_BYTES = int(os.environ.get("TRADE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    CACHE_STATS_ENABLED = os.environ.get("CACHE_STATS_ENABLED") == "1" # /analytics/cache-stats outside debug mode
+
+    # Cross-request cache of the logged-in user row (app/identity.py); 0 = off
+    USER_CACHE_SECONDS = int(os.environ.get("USER_CACHE_SECONDS", 0))
+
+    # Per-process rendered page cache (app/responses.py)
+    RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+    # Per-user predictor models (app/predictors.py)
+    PREDICTOR_CACHE_SIZE = 256 # models kept deserialized per process
+    PREDICTOR_FLUSH_EVERY = 20 # buffered outcomes before weights are saved
+    PREDICTOR_FLUSH_SECONDS = 60 # ...or once the oldest buffered outcome is this old
+
+    # Parameter sweeps (app/backtest/sweep.py)
+    SWEEP_WORKERS = int(os.environ.get("SWEEP_WORKERS", 0)) # 0 = one per CPU
+    SWEEP_MAX_COMBINATIONS = 5000
+
+    # Goal projections (app/planner/montecarlo.py)
+    GOAL_SIMULATION_PATHS = 100_000 # per background run
+    GOAL_INLINE_PATHS = 2000 # in-request preview until a goal's first background run finishes
+    GOAL_PROJECTION_CACHE_SIZE = 128 # projections kept per process
+    GOAL_TRADES_PER_DAY = 1.0 # assumed pace when there are no recent trades
+    GOAL_HORIZON_DAYS = 90 # projection length for goals without a deadline
+    GOAL_MAX_TRADES = 1000
+
+    # Plan-to-trade matching (app/planner/matching.py)
+    PLAN_MATCH_DAYS = 2 # a plan matches trades on its day or the next
+
+
+class ProductionConfig(Config):
+    """
+    SQLite for several workers: WAL (readers never wait for a writer, e.g. a
+    large import), tuned pragmas, sized connection pools and a separate
+    read-only engine for the analytics and list pages (@read_only routes).
+    """
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL', # durable at checkpoints; safe with WAL
+        'busy_timeout': 5000, # ms a writer waits for the write lock
+        'cache_size': -64000, # 64 MB page cache per connection
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    }
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get("DB_POOL_SIZE", 10)),
+        'max_overflow': int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        'pool_timeout': 30,
+        'pool_pre_ping': True,
+    }
+    # Same file unless a replica is given; its connections are query_only
+    READ_DATABASE_URL = os.environ.get("READ_DATABASE_URL", Config.SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_BINDS = {'read': READ_DATABASE_URL}
+
+
+CONFIGS = {
+    'development': Config,
+    'production': ProductionConfig,
+}
@@ -1,3 +1,77 @@
+from functools import partial, wraps
+
+from flask import g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+
+READ_BIND = 'read'
+
+
+class RoutingSession(Session):
+    """
+    Sends the reads of a @read_only request to the 'read' engine when one is
+    configured. Flushes and INSERT/UPDATE/DELETE statements always go to the
+    primary engine, and once a request has written, its later reads do too so
+    it sees its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica(clause):
+            return self._db.engines[READ_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self, clause):
+        if not (has_request_context() and g.get('_read_only')) or self.info.get('wrote'):
+            return False
+        if self._flushing or getattr(clause, 'is_dml', False):
+            self.info['wrote'] = True
+            return False
+        return READ_BIND in self._db.engines
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def read_only(view):
+    """Route a view's reads to the read-only engine (its writes still reach the primary)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g._read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def write_connection():
+    """The session's connection to the primary engine, for Core writes outside a flush"""
+    db.session.info['wrote'] = True
+    return db.session.connection()
+
+
+def init_engines(app):
+    """Apply SQLITE_PRAGMAS to every new SQLite connection; the read engine's are also query_only"""
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:'):
+                event.listen(engine, 'connect', partial(_apply_pragmas, pragmas, key == READ_BIND))
+
+
+def _apply_pragmas(pragmas, query_only, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        if name == 'journal_mode' and query_only:
+            continue  # set (persistently) by the primary
+        cursor.execute(f"PRAGMA {name}={value}")
+    if query_only:
+        cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
 
-db = SQLAlchemy()
+def dialect_insert(conn, table):
+    """INSERT construct with on_conflict_do_nothing/do_update for the connection's dialect"""
+    dialect = {'sqlite': sqlite, 'postgresql': postgresql}.get(conn.dialect.name)
+    if dialect is None:
+        raise RuntimeError(f"Upserts are not supported on {conn.dialect.name}")
+    return dialect.insert(table)
@@ -0,0 +1,107 @@
+"""
+Request-scoped identity.
+
+``load_user`` (the Flask-Login loader) fetches the user and their subscription
+in one joined query, so ``current_user.is_pro`` never lazy-loads. Per-user
+lookups that several parts of a request need (the active goals and the
+journal entry count) are memoized on ``g`` and run at most once per request.
+
+With ``USER_CACHE_SECONDS`` > 0 the user row (with subscription) is also kept
+for that long across requests in this process and merged into each request's
+session without a query. Writes to a user or subscription made through this
+process drop the entry; other processes see them within the TTL.
+"""
+import threading
+import time
+
+from flask import current_app, g, has_request_context
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached
+
+from app.extensions import db
+from app.models import JournalEntry, Subscription, TradingGoal, User
+
+_lock = threading.Lock()
+_users = {}  # user_id -> (expires_at, detached User)
+
+
+def load_user(user_id):
+    user_id = int(user_id)
+    ttl = current_app.config.get('USER_CACHE_SECONDS', 0)
+    if ttl:
+        with _lock:
+            cached = _users.get(user_id)
+        if cached is not None and cached[0] > time.monotonic():
+            # Attach a copy to this request's session without reloading it
+            return db.session.merge(cached[1], load=False)
+
+    user = db.session.get(User, user_id, options=[joinedload(User.subscription)])
+    if user is not None and ttl:
+        with _lock:
+            _users[user_id] = (time.monotonic() + ttl, _detached_copy(user))
+    return user
+
+
+def _detached_copy(user):
+    """A copy of the user (and subscription) owned by no session, so commits can't expire it"""
+    def copy(obj):
+        return type(obj)(**{attr.key: getattr(obj, attr.key) for attr in obj.__mapper__.column_attrs})
+
+    clones = [copy(user)]
+    clones[0].subscription = copy(user.subscription) if user.subscription else None
+    if user.subscription:
+        clones.append(clones[0].subscription)
+    # Linked while transient, so neither copy carries pending changes
+    for clone in clones:
+        make_transient_to_detached(clone)
+    return clones[0]
+
+
+def forget_user(user_id=None):
+    with _lock:
+        if user_id is None:
+            _users.clear()
+        else:
+            _users.pop(user_id, None)
+
+
+# --- Per-request memos ---
+
+def _memo(name, user_id, load):
+    if not has_request_context():
+        return load()
+    memo = g.setdefault('_identity', {})
+    key = (name, user_id)
+    if key not in memo:
+        memo[key] = load()
+    return memo[key]
+
+
+def active_goals(user_id):
+    """The user's active goals, oldest first"""
+    return _memo('active_goals', user_id, lambda: TradingGoal.query.filter_by(
+        user_id=user_id, status='active').order_by(TradingGoal.id).all())
+
+
+def active_goal(user_id):
+    goals = active_goals(user_id)
+    return goals[0] if goals else None
+
+
+def journal_count(user_id):
+    return _memo('journal_count', user_id, lambda: db.session.execute(
+        select(db.func.count(JournalEntry.id)).where(JournalEntry.user_id == user_id)).scalar())
+
+
+# --- ORM hook ---
+
+@event.listens_for(Session, 'after_flush')
+def _forget_changed_users(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            forget_user(obj.id)
+        elif isinstance(obj, Subscription):
+            forget_user(obj.user_id)
+        elif isinstance(obj, (TradingGoal, JournalEntry)) and has_request_context():
+            # Later reads in this request see the write
+            g.pop('_identity', None)
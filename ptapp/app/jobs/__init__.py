@@ -0,0 +1,5 @@
+from flask import Blueprint
+
+jobs_bp = Blueprint('jobs', __name__, template_folder='../templates')
+
+from . import routes, handlers
@@ -0,0 +1,107 @@
+"""Job handlers. Each returns a JSON-serialisable result stored on the job."""
+import os
+
+from app.extensions import db
+from .runner import job_handler
+
+
+@job_handler('import_journal')
+def import_journal(ctx, path, filename=None):
+    from app.journal.importer import import_csv
+
+    size = os.path.getsize(path)
+    try:
+        with open(path, 'rb') as f:
+            def progress(report):
+                ctx.progress(f.tell(), size,
+                             f"{report.imported} imported, {report.duplicates} already present, "
+                             f"{report.skipped} skipped")
+            report = import_csv(f, ctx.user_id, progress=progress)
+    finally:
+        os.remove(path)
+
+    result = report.to_dict()
+    result['filename'] = filename
+    if report.imported:
+        # Learn from the imported outcomes and score the new trades
+        from .runner import enqueue
+        result['scoring_job'] = enqueue('score_journal', user_id=ctx.user_id).id
+        result['excursions_job'] = enqueue('compute_excursions', user_id=ctx.user_id).id
+    return result
+
+
+@job_handler('score_journal')
+def score_journal(ctx, retrain=True):
+    from app.journal.scoring import score_user
+
+    return score_user(ctx.user_id, retrain_model=retrain,
+                      progress=lambda done, total: ctx.progress(done, total, f"{done} of {total} trades scored"))
+
+
+@job_handler('compute_excursions')
+def compute_excursions(ctx, recompute=False):
+    from app.analytics.excursions import compute_user
+
+    ctx.progress(0, 1, "Matching trades to candles")
+    return compute_user(ctx.user_id, recompute=recompute)
+
+
+@job_handler('rebuild_rollups')
+def rebuild_rollups(ctx):
+    """The job's user, or everyone for a system job (enqueue consumes user_id)"""
+    from app.analytics.rollups import rebuild
+
+    with db.engine.begin() as conn:
+        written = rebuild(conn, ctx.user_id)
+    return {'rows': written}
+
+
+@job_handler('backtest_replay')
+def backtest_replay(ctx, pair, timeframe, rule, strategy_name=None, params=None, stop_pips=20.0, rr=2.0,
+                    max_hold=240, session=None, direction='both', start=None, end=None):
+    from app.backtest.replay import run_replay
+    from app.market import store
+    from app.market.candles import day_bounds
+
+    ctx.progress(0, 1, f"Loading {pair} {timeframe} candles")
+    candles = store.load(pair, timeframe, *day_bounds(start, end))
+
+    run = run_replay(ctx.user_id, candles, pair, timeframe, strategy_name or f"{rule} {pair} {timeframe}",
+                     rule, params, stop_pips=stop_pips, rr=rr, max_hold=max_hold, session=session,
+                     direction=direction,
+                     progress=lambda done, total: ctx.progress(done, total, f"{done} of {total} trades saved"))
+    if run.trades:
+        from .runner import enqueue
+        enqueue('compute_excursions', user_id=ctx.user_id)
+    return {'run_id': run.id, 'candles': run.candles, 'trades': run.trades,
+            'win_rate': run.win_rate, 'elapsed_ms': run.elapsed_ms}
+
+
+@job_handler('backtest_sweep')
+def backtest_sweep(ctx, sweep_id):
+    from flask import current_app
+    from app.backtest.sweep import run_sweep
+    from app.models import BacktestSweep
+
+    sweep = db.session.get(BacktestSweep, sweep_id)
+    sweep = run_sweep(sweep, workers=current_app.config.get('SWEEP_WORKERS'),
+                      progress=lambda done, total: ctx.progress(done, total, f"{done} of {total} combinations"))
+    return {'sweep_id': sweep.id, 'combinations': sweep.completed, 'elapsed_ms': sweep.elapsed_ms}
+
+
+@job_handler('upload_variants')
+def upload_variants(ctx, name):
+    from app.uploads.storage import make_variants
+
+    return {'written': make_variants(name)}
+
+
+@job_handler('goal_projection')
+def goal_projection(ctx, goal_id, source='plan', key=None):
+    from app.planner.montecarlo import refresh_goal
+
+    result = refresh_goal(goal_id, source, key)
+    if result is None:
+        return None
+    return {'goal_id': goal_id, 'source': result['source'], 'paths': result['paths'],
+            'probability': result['probability'], 'ruin': result['ruin']}
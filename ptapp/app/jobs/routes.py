@@ -0,0 +1,18 @@
+from flask import render_template, jsonify, abort
+from flask_login import login_required, current_user
+from app.models import Job
+from . import jobs_bp
+
+@jobs_bp.route('/')
+@login_required
+def job_list():
+    jobs = Job.query.filter_by(user_id=current_user.id).order_by(Job.created_at.desc()).limit(50).all()
+    return render_template('jobs.html', jobs=jobs)
+
+@jobs_bp.route('/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = Job.query.get_or_404(job_id)
+    if job.user_id != current_user.id:
+        abort(404)
+    return jsonify(job.to_dict())
@@ -0,0 +1,170 @@
+"""
+In-process background jobs.
+
+Jobs are rows in the ``jobs`` table and run on a thread pool owned by this
+process, so no external broker is needed. Queued jobs (and running jobs whose
+heartbeat went stale because their process died) are picked up again after a
+restart. Claiming is an atomic UPDATE, so several workers sharing one database
+never run the same job twice. While a job runs, the runner refreshes its
+heartbeat every ``JOB_HEARTBEAT_SECONDS`` on its own, so a long step that
+reports no progress is not mistaken for an orphan.
+
+Enqueueing writes the job on its own connection: it never commits the
+caller's session.
+"""
+import json
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import insert, update
+
+from app.extensions import db
+from app.models import Job
+
+HANDLERS = {}
+
+_app = None
+_executor = None
+_resumed = False
+
+
+def job_handler(kind):
+    """Register func(ctx, **payload) as the handler for a job kind"""
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+class JobContext:
+    """Handed to job handlers for progress reporting"""
+
+    def __init__(self, job_id, user_id):
+        self.job_id = job_id
+        self.user_id = user_id
+
+    def progress(self, done, total=None, message=None):
+        values = {'progress': int(done), 'heartbeat_at': datetime.utcnow()}
+        if total is not None:
+            values['total'] = int(total)
+        if message is not None:
+            values['message'] = message[:255]
+        # Own short transaction so the handler's session is left alone
+        with db.engine.begin() as conn:
+            conn.execute(update(Job.__table__).where(Job.__table__.c.id == self.job_id).values(**values))
+
+
+def init_app(app):
+    global _app, _executor
+    _app = app
+    _executor = ThreadPoolExecutor(max_workers=app.config.get('JOB_WORKERS', 2),
+                                   thread_name_prefix='job')
+
+    @app.before_request
+    def _resume_jobs_once():
+        global _resumed
+        if not _resumed:
+            _resumed = True
+            resume_pending()
+
+
+def enqueue(kind, user_id=None, **payload):
+    """Persist a job and schedule it. Returns the Job row."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    values = {'user_id': user_id, 'kind': kind, 'status': 'queued', 'payload': json.dumps(payload),
+              'progress': 0, 'created_at': datetime.utcnow()}
+    # Own transaction: the caller's pending work is neither committed nor rolled back here
+    with db.engine.begin() as conn:
+        job_id = conn.execute(insert(Job.__table__).values(**values)).inserted_primary_key[0]
+    _submit(job_id)
+    return Job(id=job_id, **values)
+
+
+def _submit(job_id):
+    if _executor is None:
+        raise RuntimeError("Job runner not initialised; call jobs.runner.init_app(app)")
+    _executor.submit(_run, job_id)
+
+
+def resume_pending():
+    """Requeue jobs orphaned by a dead process and schedule everything queued"""
+    stale_before = datetime.utcnow() - timedelta(seconds=_app.config.get('JOB_STALE_SECONDS', 300))
+    table = Job.__table__
+    with db.engine.begin() as conn:
+        conn.execute(update(table).where(
+            table.c.status == 'running',
+            (table.c.heartbeat_at < stale_before) | table.c.heartbeat_at.is_(None)
+        ).values(status='queued'))
+        job_ids = [row[0] for row in conn.execute(
+            table.select().with_only_columns(table.c.id).where(table.c.status == 'queued')
+            .order_by(table.c.id)
+        )]
+    for job_id in job_ids:
+        _submit(job_id)
+    return job_ids
+
+
+def _claim(job_id):
+    table = Job.__table__
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        claimed = conn.execute(update(table).where(
+            table.c.id == job_id, table.c.status == 'queued'
+        ).values(status='running', started_at=now, heartbeat_at=now)).rowcount
+    return claimed == 1
+
+
+def _finish(job_id, **values):
+    values['finished_at'] = datetime.utcnow()
+    with db.engine.begin() as conn:
+        conn.execute(update(Job.__table__).where(Job.__table__.c.id == job_id).values(**values))
+
+
+def _touch(job_id):
+    with db.engine.begin() as conn:
+        conn.execute(update(Job.__table__).where(Job.__table__.c.id == job_id)
+                     .values(heartbeat_at=datetime.utcnow()))
+
+
+def _keep_alive(job_id, stop):
+    """Refresh a running job's heartbeat until stop is set"""
+    with _app.app_context():
+        interval = current_app.config.get('JOB_HEARTBEAT_SECONDS', 30)
+        while not stop.wait(interval):
+            try:
+                _touch(job_id)
+            except Exception:
+                current_app.logger.exception("Heartbeat for job %s failed", job_id)
+
+
+def _run(job_id):
+    with _app.app_context():
+        stop = threading.Event()
+        try:
+            if not _claim(job_id):
+                return  # Another worker got it first
+            threading.Thread(target=_keep_alive, args=(job_id, stop), daemon=True,
+                             name=f"job-{job_id}-heartbeat").start()
+            job = db.session.get(Job, job_id)
+            handler = HANDLERS.get(job.kind)
+            if handler is None:
+                _finish(job_id, status='failed', error=f"No handler for {job.kind}")
+                return
+            ctx = JobContext(job.id, job.user_id)
+            payload = json.loads(job.payload or '{}')
+            db.session.close()
+
+            result = handler(ctx, **payload)
+            _finish(job_id, status='done',
+                    result=json.dumps(result) if result is not None else None)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception("Job %s failed", job_id)
+            _finish(job_id, status='failed', message=str(e)[:255], error=traceback.format_exc())
+        finally:
+            stop.set()
+            db.session.remove()
@@ -0,0 +1,155 @@
+"""
+Feature store for the trade predictor.
+
+Each journal entry's predictor inputs are computed once into ``trade_features``
+and read back as contiguous matrices for training and scoring. Strategy (and
+pair) names are encoded through a per-user vocabulary with stable integer codes
+(1, 2, 3... per user and kind, so other users' names never shift them) instead
+of Python's per-process salted hash().
+
+Rows are computed lazily and in bulk by ``ensure_features``. A ``before_flush``
+hook drops the stored row when an entry's inputs change or the entry is
+deleted, so a vector is only ever recomputed when its inputs changed.
+"""
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import delete, event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from app.ai_helper import encode_features, missing_as_nan
+from app.extensions import db, dialect_insert
+from app.models import FeatureVocab, JournalEntry, TradeFeatures
+
+CHUNK_SIZE = 5000
+
+# Journal columns the features depend on
+INPUT_ATTRS = ('user_id', 'date', 'entry_price', 'stop_loss', 'take_profit',
+               'risk_reward', 'news_event', 'strategy', 'pair')
+
+MATRIX_COLUMNS = (
+    TradeFeatures.f_time, TradeFeatures.f_sl, TradeFeatures.f_tp,
+    TradeFeatures.f_rr, TradeFeatures.f_news, TradeFeatures.f_strategy,
+)
+
+
+# --- Vocabulary ---
+
+def vocab_codes(conn, user_id, kind, values):
+    """{value: stable code} for a user's strategies/pairs, adding unseen values"""
+    values = {v[:100] for v in values if v}
+    if not values:
+        return {}
+    table = FeatureVocab.__table__
+    lookup = select(table.c.value, table.c.code).where(
+        table.c.user_id == user_id, table.c.kind == kind, table.c.value.in_(values)
+    )
+    next_code = select(func.coalesce(func.max(table.c.code), 0) + 1).where(
+        table.c.user_id == user_id, table.c.kind == kind
+    ).scalar_subquery()
+    codes = dict(conn.execute(lookup).all())
+    for _ in range(3):
+        missing = values - codes.keys()
+        if not missing:
+            break
+        # Each row takes the next code as it is inserted; insert-or-ignore, so a concurrent
+        # writer adding the same value (or taking the same code) only costs another round
+        conn.execute(
+            dialect_insert(conn, table).values(code=next_code).on_conflict_do_nothing(),
+            [{'user_id': user_id, 'kind': kind, 'value': v} for v in sorted(missing)]
+        )
+        codes = dict(conn.execute(lookup).all())
+    return codes
+
+
+def strategy_code(user_id, strategy):
+    if not strategy:
+        return None
+    return vocab_codes(db.session.connection(), user_id, 'strategy', [strategy]).get(strategy[:100])
+
+
+def entry_vector(entry):
+    """Feature vector for a single (ORM) entry, using the user's vocabulary"""
+    from app.predictors import get_predictor
+    return get_predictor(entry.user_id).prepare_inputs(
+        entry=entry, strategy_code=strategy_code(entry.user_id, entry.strategy)
+    )
+
+
+# --- Store ---
+
+def ensure_features(user_id, chunk_size=CHUNK_SIZE):
+    """Compute and store vectors for the user's entries that have none. Returns how many."""
+    j, tf = JournalEntry, TradeFeatures
+    computed = 0
+    while True:
+        rows = db.session.execute(
+            select(j.id, j.date, j.entry_price, j.stop_loss, j.take_profit,
+                   j.risk_reward, j.news_event, j.strategy, j.pair)
+            .outerjoin(tf, tf.journal_entry_id == j.id)
+            .where(j.user_id == user_id, tf.journal_entry_id.is_(None))
+            .order_by(j.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            return computed
+
+        conn = db.session.connection()
+        strategies = vocab_codes(conn, user_id, 'strategy', (r.strategy for r in rows))
+        pairs = vocab_codes(conn, user_id, 'pair', (r.pair for r in rows))
+        strategy_ids = [strategies.get(r.strategy[:100]) if r.strategy else None for r in rows]
+
+        now_hour = datetime.now().hour
+        matrix = encode_features(
+            [r.date.hour if r.date else now_hour for r in rows],
+            missing_as_nan(r.entry_price for r in rows),
+            missing_as_nan(r.stop_loss for r in rows),
+            missing_as_nan(r.take_profit for r in rows),
+            missing_as_nan(r.risk_reward for r in rows),
+            [1.0 if r.news_event else 0.0 for r in rows],
+            [np.nan if code is None else code for code in strategy_ids],
+        )
+
+        now = datetime.utcnow()
+        conn.execute(tf.__table__.insert(), [{
+            'journal_entry_id': r.id, 'user_id': user_id,
+            'f_time': v[0], 'f_sl': v[1], 'f_tp': v[2], 'f_rr': v[3], 'f_news': v[4], 'f_strategy': v[5],
+            'strategy_id': code, 'pair_id': pairs.get(r.pair[:100]) if r.pair else None,
+            'computed_at': now,
+        } for r, v, code in zip(rows, matrix.tolist(), strategy_ids)])
+        db.session.commit()
+        computed += len(rows)
+
+
+def feature_rows(user_id, *criteria, extra=()):
+    """Select of (journal id, *extra, 6 feature columns) for the user's entries matching criteria"""
+    j, tf = JournalEntry, TradeFeatures
+    return select(j.id, *extra, *MATRIX_COLUMNS).join(tf, tf.journal_entry_id == j.id) \
+        .where(j.user_id == user_id, *criteria)
+
+
+def to_matrix(rows):
+    """(n, 6) feature matrix from the last six columns of feature_rows results"""
+    if not rows:
+        return np.empty((0, len(MATRIX_COLUMNS)))
+    return np.array([row[-len(MATRIX_COLUMNS):] for row in rows], dtype=np.float64)
+
+
+# --- ORM hook ---
+
+@event.listens_for(Session, 'before_flush')
+def _drop_stale_features(session, flush_context, instances):
+    entry_ids = set()
+    for obj in session.deleted:
+        if isinstance(obj, JournalEntry) and obj.id is not None:
+            entry_ids.add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, JournalEntry) and obj.id is not None:
+            state = inspect(obj)
+            if any(state.attrs[a].history.has_changes() for a in INPUT_ATTRS):
+                entry_ids.add(obj.id)
+                # Its confidence came from the old inputs: rescore on the next backfill
+                obj.ai_model_version = None
+    if entry_ids:
+        session.connection().execute(
+            delete(TradeFeatures.__table__).where(TradeFeatures.__table__.c.journal_entry_id.in_(entry_ids))
+        )
@@ -0,0 +1,245 @@
+"""
+Streaming broker CSV import (MetaTrader / cTrader / generic).
+
+The upload is read row by row, parsed into plain dicts and written in
+fixed-size chunks with one executemany INSERT + commit per chunk, so memory
+stays flat and the SQLite write lock is only held for one chunk at a time.
+
+Every imported trade carries a deterministic fingerprint (broker ticket, or a
+hash of its content) backed by a unique (user_id, fingerprint) index, so
+re-importing an overlapping statement only inserts the new rows. Each chunk
+also links the trade plans its trades executed (app/planner/matching.py) and
+drops the KPI snapshots of the closed weeks it wrote into (app/main/kpi.py).
+"""
+import csv
+import hashlib
+import io
+import re
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import select
+
+from app.extensions import db, dialect_insert
+from app.models import JournalEntry
+from app.analytics.rollups import record_rows
+from app.analytics.cache import bump_data_version
+from app.responses import bump_content_version
+from app.planner.matching import match_trades
+from app.main.kpi import invalidate_weeks, week_start_of
+
+CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 200
+
+DATE_FORMATS = (
+    '%Y.%m.%d %H:%M:%S',  # MT4/MT5: 2023.10.25 14:00:00
+    '%Y-%m-%d %H:%M:%S',
+    '%Y.%m.%d %H:%M',
+    '%Y-%m-%d %H:%M',
+)
+
+# Common header aliases, first match wins
+DATE_COLUMNS = ('Time', 'Date', 'Open Time')
+PAIR_COLUMNS = ('Symbol', 'Item', 'Pair')
+DIRECTION_COLUMNS = ('Type', 'Direction')
+PRICE_COLUMNS = ('Open', 'Price', 'Entry Price')
+PROFIT_COLUMNS = ('Profit', 'Amount', 'Net')
+TICKET_COLUMNS = ('Ticket', 'Order', 'Position', 'Deal', 'Order ID', 'Position ID')
+
+# 1,234,567.89: the only comma use we accept; "1234,56" (decimal comma) is an error, not 123456
+THOUSANDS = re.compile(r'^[-+]?\d{1,3}(,\d{3})+(\.\d+)?$')
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportReport:
+    """Progress counters and row-level errors for one import"""
+
+    def __init__(self):
+        self.rows_read = 0
+        self.imported = 0
+        self.skipped = 0
+        self.duplicates = 0
+        self.chunks = 0
+        self.errors = []  # (line number, message), capped at MAX_REPORTED_ERRORS
+
+    def add_error(self, line, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def to_dict(self):
+        return {
+            'rows_read': self.rows_read,
+            'imported': self.imported,
+            'skipped': self.skipped,
+            'duplicates': self.duplicates,
+            'chunks': self.chunks,
+            'errors': [list(e) for e in self.errors],
+        }
+
+
+def _first(row, columns):
+    for col in columns:
+        value = row.get(col)
+        if value is not None and value.strip() != '':
+            return value.strip()
+    return None
+
+
+def parse_date(value):
+    # Fast path: ISO-like stamps, including MT4's dotted dates (2023.10.25 14:00:00).
+    # Only the date part's dots are separators; a later one starts fractional seconds.
+    try:
+        return datetime.fromisoformat(value[:10].replace('.', '-') + value[10:])
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise RowError(f"Unrecognised date '{value}'")
+
+
+def _parse_float(value, label):
+    if value is None:
+        return 0.0
+    if ',' in value:
+        if not THOUSANDS.match(value):
+            raise RowError(f"Invalid {label} '{value}' (use '.' for decimals)")
+        value = value.replace(',', '')
+    try:
+        return float(value)
+    except ValueError:
+        raise RowError(f"Invalid {label} '{value}'")
+
+
+def fingerprint(ticket, trade_date, pair, direction, open_price, profit, occurrence=0):
+    """
+    Broker ticket when the export has one, else a hash of the trade's content.
+    occurrence numbers identical ticketless rows within one file (partial closes), so each is kept.
+    """
+    if ticket:
+        return f"ticket:{ticket}"[:64]
+    raw = f"{trade_date.isoformat()}|{pair.upper()}|{direction}|{open_price!r}|{profit!r}"
+    if occurrence:
+        raw += f"|{occurrence}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def parse_row(row, user_id):
+    """Map one CSV row to journal_entries column values, or raise RowError"""
+    date_str = _first(row, DATE_COLUMNS)
+    if not date_str:
+        raise RowError("Missing date/time column")
+    pair = _first(row, PAIR_COLUMNS)
+    direction = _first(row, DIRECTION_COLUMNS)
+    if not pair or not direction:
+        raise RowError("Missing symbol or trade type")
+
+    trade_date = parse_date(date_str)
+    direction = direction.lower()
+    open_price = _parse_float(_first(row, PRICE_COLUMNS), 'open price')
+    profit = _parse_float(_first(row, PROFIT_COLUMNS), 'profit')
+    return {
+        'user_id': user_id,
+        'date': trade_date,
+        'pair': pair,
+        'direction': direction,
+        'entry_price': open_price,
+        'profit_loss': profit,
+        'result': 'win' if profit > 0 else 'loss',
+        'journal_complete': False,  # Needs review
+        'ticket': _first(row, TICKET_COLUMNS),
+    }
+
+
+def parse_csv(stream, user_id, report):
+    """Generator of parsed rows; bad rows are recorded on the report and skipped"""
+    reader = csv.DictReader(stream)
+    seen = Counter()  # content fingerprint -> identical ticketless rows so far in this file
+    for row in reader:
+        report.rows_read += 1
+        try:
+            parsed = parse_row(row, user_id)
+        except RowError as e:
+            # reader.line_num is the physical line, header included
+            report.add_error(reader.line_num, str(e))
+            continue
+        ticket = parsed.pop('ticket')
+        content = (parsed['date'], parsed['pair'], parsed['direction'], parsed['entry_price'],
+                   parsed['profit_loss'])
+        occurrence = 0
+        if not ticket:
+            base = fingerprint(None, *content)
+            occurrence = seen[base]
+            seen[base] += 1
+        # The nth copy gets the same fingerprint on every import of the file, so re-imports stay no-ops
+        parsed['fingerprint'] = fingerprint(ticket, *content, occurrence=occurrence)
+        yield parsed
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def new_rows(conn, user_id, chunk):
+    """Drop rows already imported and repeated tickets within the chunk (indexed fingerprint lookup)"""
+    table = JournalEntry.__table__
+    unique = {}
+    for row in chunk:
+        unique.setdefault(row['fingerprint'], row)
+    existing = set(conn.execute(
+        select(table.c.fingerprint).where(
+            table.c.user_id == user_id,
+            table.c.fingerprint.in_(list(unique))
+        )
+    ).scalars())
+    return [row for fp, row in unique.items() if fp not in existing]
+
+
+def import_csv(binary_stream, user_id, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Import a broker CSV for a user. Commits once per chunk and calls
+    progress(report) after each one. Returns the ImportReport.
+    """
+    report = ImportReport()
+    text_stream = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+    table = JournalEntry.__table__
+
+    for chunk in chunked(parse_csv(text_stream, user_id, report), chunk_size):
+        conn = db.session.connection()
+        rows = new_rows(conn, user_id, chunk)
+        if rows:
+            # Insert-or-ignore keeps a concurrent import of the same file harmless: rows it
+            # skipped are not RETURNed, so they are neither rolled up nor counted
+            stmt = dialect_insert(conn, table).on_conflict_do_nothing(
+                index_elements=['user_id', 'fingerprint']
+            ).returning(table.c.fingerprint)
+            inserted = set(conn.execute(stmt, rows).scalars())
+            rows = [row for row in rows if row['fingerprint'] in inserted]
+        if rows:
+            record_rows(conn, rows)
+            bump_data_version(conn, [user_id])
+            bump_content_version(conn, [user_id])
+            dates = [row['date'] for row in rows]
+            invalidate_weeks(conn, {(user_id, week_start_of(d.date())) for d in dates})
+            match_trades(conn, user_id, min(dates), max(dates))
+        db.session.commit()
+
+        report.imported += len(rows)
+        report.duplicates += len(chunk) - len(rows)
+        report.chunks += 1
+        if progress:
+            progress(report)
+
+    return report
@@ -1,11 +1,22 @@
 # app/journal/routes.py
 import os
+import uuid
 from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_required, current_user
+from sqlalchemy.orm import defer
 from werkzeug.utils import secure_filename
 from datetime import datetime
-from app.extensions import db
-from app.models import JournalEntry, TradingGoal
+from app.extensions import db, read_only
+from app.models import JournalEntry
+from app import identity, predictors
+from app.planner.matching import match_trades
+from . import features
+from .forms import JournalForm
+from app.jobs.runner import enqueue
+from app.pagination import keyset_page, render_rows
+from app.uploads.storage import save_upload
+
+journal_bp = Blueprint('journal', __name__)
 
 @journal_bp.route('/new', methods=['GET', 'POST'])
 @login_required
@@ -13,7 +24,7 @@ def new_journal_entry():
     form = JournalForm()
     
     # Populate Plan Choices
-    active_plans = TradingGoal.query.filter_by(user_id=current_user.id, status='active').all()
+    active_plans = identity.active_goals(current_user.id)
     form.linked_plan.choices = [(0, 'Normal Trade (No Plan)')] + [(p.id, p.name) for p in active_plans]
     
     # Debug: Print form data if POST
@@ -24,32 +35,22 @@ def new_journal_entry():
     
     # Check Plan Limits
     if not current_user.is_pro:
-        entry_count = JournalEntry.query.filter_by(user_id=current_user.id).count()
+        entry_count = identity.journal_count(current_user.id)
         if entry_count >= 50:
             flash('Free plan limit reached (50 trades). Please upgrade to Pro for unlimited journaling.', 'warning')
             return redirect(url_for('journal.list_journals'))
 
     if form.validate_on_submit():
-        # Save uploaded images
-        upload_folder = os.path.join(current_app.root_path, 'static', 'uploads')
-        os.makedirs(upload_folder, exist_ok=True)
-
-        before_filename = None
-        after_filename = None
-
-        if form.before_image.data:
-            before_filename = secure_filename(form.before_image.data.filename)
-            form.before_image.data.save(os.path.join(upload_folder, before_filename))
-
-        if form.after_image.data:
-            after_filename = secure_filename(form.after_image.data.filename)
-            form.after_image.data.save(os.path.join(upload_folder, after_filename))
-
-        # Calculate AI confidence before trade
-        inputs = predictor.prepare_inputs(form=form)
+        # Save uploaded images (stored by content hash; thumbnails are built in the background)
+        before_filename = save_upload(form.before_image.data)
+        after_filename = save_upload(form.after_image.data)
+
+        # Calculate AI confidence before trade (win probability, 0-1)
+        predictor = predictors.get_predictor(current_user.id)
+        inputs = predictor.prepare_inputs(
+            form=form, strategy_code=features.strategy_code(current_user.id, form.strategy.data)
+        )
         confidence = predictor.predict(inputs)
-        # Normalize to 0-1 range
-        confidence = max(0.0, min(1.0, confidence))
 
         # Create new journal entry
         entry = JournalEntry(
@@ -78,6 +79,7 @@ def new_journal_entry():
             risk_reward=form.risk_reward.data,
             news_event=form.news_event.data,
             ai_confidence=confidence, # Save calculated confidence
+            ai_model_version=predictors.current_version(current_user.id),
 
             result=form.result.data,
             profit_loss=form.profit_loss.data,
@@ -87,11 +89,14 @@ def new_journal_entry():
         )
 
         db.session.add(entry)
+        db.session.flush()
+        # Mark the trade plan this entry executed, in the same transaction
+        match_trades(db.session.connection(), current_user.id, entry.date, entry.date)
         db.session.commit()
         
         # If result is already provided (e.g. historical entry), learn instantly
         if entry.result:
-             predictor.learn_from_entry(entry)
+             predictors.learn_from_entry(current_user.id, entry)
 
         flash(f'Journal entry added! AI Trade Confidence: {round(confidence * 100)}%', 'success')
         return redirect(url_for('journal.list_journals'))
@@ -119,73 +124,38 @@ def import_journal():
     form = ImportJournalForm()
     
     if form.validate_on_submit():
-        import csv
-        from io import TextIOWrapper
-        
-        file = form.csv_file.data
-        # Simple CSV parsing (Naive implementation for demo)
-        # In a real app, use pandas or flexible mapping logic
-        stream = TextIOWrapper(file.stream, encoding='utf-8')
-        csv_input = csv.DictReader(stream)
-        
-        count = 0
-        for row in csv_input:
-            # Attempt to find common headers
-            # Date/Time
-            date_str = row.get('Time') or row.get('Date') or row.get('Open Time')
-            if not date_str: continue # Skip invalid
-            
-            # Simple Date Parsing (Assuming YYYY.MM.DD HH:MM:SS or similar)
-            # This is fragile, but sufficient for a "demo" of the feature
-            try:
-                # Try standard MT4 format: 2023.10.25 14:00:00
-                trade_date = datetime.strptime(date_str, '%Y.%m.%d %H:%M:%S')
-            except:
-                try:
-                    trade_date = datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S')
-                except:
-                     trade_date = datetime.utcnow() # Fallback
-
-            # Pair
-            pair = row.get('Symbol') or row.get('Item') or row.get('Pair')
-            
-            # Type
-            direction = row.get('Type') or row.get('Direction') # buy/sell
-            
-            # Price
-            open_price = row.get('Open') or row.get('Price') or row.get('Entry Price')
-            
-            # Profit
-            profit = row.get('Profit') or row.get('Amount') or row.get('Net')
-            
-            if pair and direction:
-                entry = JournalEntry(
-                    user_id=current_user.id,
-                    date=trade_date,
-                    pair=pair,
-                    direction=direction.lower(),
-                    entry_price=float(open_price) if open_price else 0.0,
-                    profit_loss=float(profit) if profit else 0.0,
-                    result='win' if float(profit or 0) > 0 else 'loss',
-                    journal_complete=False # Needs review
-                )
-                db.session.add(entry)
-                count += 1
-        
-        db.session.commit()
-        flash(f'Successfully imported {count} trades from CSV.', 'success')
-        return redirect(url_for('journal.list_journals'))
+        # Park the upload on disk and import it in the background
+        import_folder = current_app.config['IMPORT_FOLDER']
+        os.makedirs(import_folder, exist_ok=True)
+        upload = form.csv_file.data
+        path = os.path.join(import_folder, f"{uuid.uuid4().hex}.csv")
+        upload.save(path)
+
+        enqueue('import_journal', user_id=current_user.id, path=path,
+                filename=secure_filename(upload.filename or 'upload.csv'))
+        flash('Import started. You can follow its progress below.', 'success')
+        return redirect(url_for('jobs.job_list'))
         
     return render_template('import_journal.html', form=form)
 
 @journal_bp.route('/list')
+@read_only
 @login_required
 def list_journals():
-    entries = JournalEntry.query.filter_by(user_id=current_user.id).order_by(JournalEntry.date.desc()).all()
-    return render_template('journal_list.html', entries=entries)
+    # Keyset-paginated; the long free-text columns are never loaded for the list
+    query = JournalEntry.query.filter_by(user_id=current_user.id).options(
+        defer(JournalEntry.pre_trade_analysis),
+        defer(JournalEntry.reflection),
+        defer(JournalEntry.mistakes)
+    )
+    page = keyset_page(query, JournalEntry.date, JournalEntry.id, request.args.get('cursor'))
+    if request.args.get('partial'):
+        return render_rows('_journal_rows.html', page, entries=page.items)
+    return render_template('journal_list.html', entries=page.items, page=page)
 
 
 @journal_bp.route('/view/<int:entry_id>')
+@read_only
 @login_required
 def view_journal(entry_id):
     entry = JournalEntry.query.get_or_404(entry_id)
@@ -0,0 +1,95 @@
+"""
+Bulk AI-confidence scoring.
+
+Retrains a user's predictor on every journal entry that has a result, then
+scores the entries that have no confidence yet or whose inputs changed since
+they were scored, chunk by chunk: one feature matrix read from the feature
+store and one predict_batch call per chunk, and one executemany UPDATE to
+write the confidences back.
+
+A newer model version alone doesn't make a confidence stale: rescoring
+history with a model refit on those same outcomes would leak the result into
+the score and make every import O(history).
+"""
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, func, or_, update
+
+from app import predictors
+from app.ai_helper import TradePredictor
+from app.extensions import db
+from app.models import JournalEntry, User
+from .features import ensure_features, feature_rows, to_matrix
+
+CHUNK_SIZE = 2000
+
+scoring_cli = AppGroup('ai', help='Trade predictor maintenance commands.')
+
+
+def retrain(user_id):
+    """Fit a fresh model on all of the user's labeled entries and save it. Returns (model, samples)."""
+    j = JournalEntry
+    rows = db.session.execute(
+        feature_rows(user_id, j.result.isnot(None), j.result != '', extra=(j.result,)).order_by(j.id)
+    ).all()
+    model = TradePredictor()
+    if not rows:
+        return model, 0
+    model.fit(to_matrix(rows), [TradePredictor.target_for(row.result) for row in rows])
+    predictors.save(user_id, model, samples=len(rows))
+    return model, len(rows)
+
+
+def score_user(user_id, retrain_model=True, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Score a user's unscored entries (new, or inputs edited) with their current model.
+    progress(done, total) is called after each chunk. Returns a summary dict.
+    """
+    # Vectors for new or edited entries; everything else is read as stored
+    computed = ensure_features(user_id)
+
+    trained = 0
+    if retrain_model:
+        _, trained = retrain(user_id)
+    model = predictors.get_predictor(user_id)
+    version = predictors.current_version(user_id)
+
+    j = JournalEntry
+    # Editing an entry's inputs clears its ai_model_version (see features._drop_stale_features)
+    stale = [or_(j.ai_confidence.is_(None), j.ai_model_version.is_(None))]
+    total = db.session.query(func.count(j.id)).filter(j.user_id == user_id, *stale).scalar()
+    table = j.__table__
+    write = update(table).where(table.c.id == bindparam('_id')).values(
+        ai_confidence=bindparam('_confidence'), ai_model_version=version
+    )
+
+    scored, last_id = 0, 0
+    while True:
+        # Keyset over id; rows scored by this pass drop out of `stale` anyway
+        rows = db.session.execute(
+            feature_rows(user_id, *stale, j.id > last_id).order_by(j.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        confidences = model.predict_batch(to_matrix(rows))
+        db.session.execute(write, [
+            {'_id': row.id, '_confidence': float(c)} for row, c in zip(rows, confidences)
+        ])
+        db.session.commit()
+        scored += len(rows)
+        last_id = rows[-1].id
+        if progress:
+            progress(scored, total)
+
+    return {'features_computed': computed, 'trained_on': trained, 'scored': scored, 'model_version': version}
+
+
+@scoring_cli.command('backfill')
+@click.option('--user-id', type=int, default=None, help='Only score this user.')
+@click.option('--no-retrain', is_flag=True, help='Score with the current models without retraining.')
+def backfill_command(user_id, no_retrain):
+    """Retrain predictors and (re)score AI confidence for journal entries."""
+    user_ids = [user_id] if user_id is not None else [uid for (uid,) in db.session.query(User.id).order_by(User.id)]
+    for uid in user_ids:
+        result = score_user(uid, retrain_model=not no_retrain)
+        click.echo(f"User {uid}: trained on {result['trained_on']}, scored {result['scored']}")
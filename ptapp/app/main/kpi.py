@@ -0,0 +1,286 @@
+"""
+Weekly KPI scores and their snapshots.
+
+The current week is scored live from the user's cached trade arrays. A week
+that is over no longer changes, so closed weeks are written once to
+``kpi_summaries`` (the first time the dashboard is opened after they end) and
+the history page/API only read those rows. ``flask kpi backfill`` recomputes
+every user's weeks across a process pool.
+
+A late write into a closed week (an edited or back-dated entry, a statement
+import) deletes that week's snapshot in the same transaction: ORM writes
+through the ``before_flush`` hook below, the CSV import by calling
+``invalidate_weeks`` per chunk. The next dashboard visit rescores it.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import delete, event, func, inspect, tuple_
+from sqlalchemy.orm import Session
+
+from app.extensions import db, dialect_insert, write_connection
+from app.models import BacktestEntry, JournalEntry, KPISummary, User
+from app import identity
+from app.analytics import engine
+from app.analytics.cache import get_trades
+from app.analytics.queries import backtest_count, backtest_week_counts, first_backtest_at
+
+kpi_cli = AppGroup('kpi', help='Weekly KPI snapshot commands.')
+
+
+def week_start_of(day):
+    return day - timedelta(days=day.weekday())
+
+
+def _week_bounds(start_date):
+    end_date = start_date + timedelta(days=6)
+    return datetime.combine(start_date, datetime.min.time()), datetime.combine(end_date, datetime.max.time())
+
+
+def _risk_limit(user_id):
+    # If active goal, risk is checked against the plan (5% buffer). Else rules_followed.
+    # Goal history isn't kept, so a closed week is scored against the goal active when its
+    # snapshot is written (or rewritten after invalidation / backfill), not the one of that week.
+    active_goal = identity.active_goal(user_id)
+    return active_goal.risk_per_trade * 1.05 if active_goal and active_goal.risk_per_trade else None
+
+
+def score_week(start_date, counts, backtests):
+    """
+    Turn a week's journal counts (see engine.week_counts) and backtest count
+    into 0..100 scores. Each component is a 0..1 value; overall is their average.
+    """
+    trades, unique_days, risk_compliant, good_exec, disciplined = counts
+
+    # 1. Journaling Score: Consistency (Days traded / 5)
+    # Did user log at least one trade on distinct days?
+    journaling_score = min(1.0, unique_days / 5)
+
+    # 2. Backtest Score: Volume (Target: 10 backtests / week)
+    backtest_score = min(1.0, backtests / 10)
+
+    # 3. Risk Score: Adherence to plan
+    risk_score = risk_compliant / trades if trades else 0.0
+
+    # 4. Execution Score: Error Free % (Trades with empty or short 'mistakes')
+    execution_score = good_exec / trades if trades else 0.0
+
+    # 5. Discipline Score: Process (Must have checked news AND marked journal complete)
+    discipline_score = disciplined / trades if trades else 0.0
+
+    total = (journaling_score + backtest_score + risk_score + execution_score + discipline_score) / 5 * 100
+
+    return {
+        "week_start": start_date,
+        "journaling": int(journaling_score * 100),
+        "backtest": int(backtest_score * 100),
+        "risk": int(risk_score * 100),
+        "execution": int(execution_score * 100),
+        "discipline": int(discipline_score * 100),
+        "total": int(total)
+    }
+
+
+def compute_weekly_kpis(user_id=1, start_date=None):
+    """Live KPI scores for one week (default: the current one)"""
+    if start_date is None:
+        start_date = week_start_of(date.today())
+    week_from, week_to = _week_bounds(start_date)
+
+    # Counts come from the user's cached trade arrays; no journal rows are loaded
+    counts = engine.week_counts(get_trades(user_id), week_from, week_to, risk_limit=_risk_limit(user_id))
+    return score_week(start_date, counts, backtest_count(user_id, week_from, week_to))
+
+
+def week_scores(user_id, arrays, first_week, last_week):
+    """Scores for every week from first_week through last_week (Mondays), oldest first"""
+    if first_week > last_week:
+        return []
+    risk_limit = _risk_limit(user_id)
+    backtests = backtest_week_counts(user_id, datetime.combine(first_week, datetime.min.time()))
+
+    scores = []
+    week = first_week
+    while week <= last_week:
+        week_from, week_to = _week_bounds(week)
+        counts = engine.week_counts(arrays, week_from, week_to, risk_limit=risk_limit)
+        scores.append(score_week(week, counts, backtests.get(week.isoformat(), 0)))
+        week += timedelta(days=7)
+    return scores
+
+
+def first_active_week(user_id, arrays):
+    """Monday of the user's first journal entry or backtest, None if there are neither"""
+    starts = [arrays.ts[0].item().date()] if len(arrays) else []
+    first_backtest = first_backtest_at(user_id)
+    if first_backtest is not None:
+        starts.append(first_backtest.date())
+    return week_start_of(min(starts)) if starts else None
+
+
+def last_closed_week():
+    return week_start_of(date.today()) - timedelta(days=7)
+
+
+# --- Snapshots ---
+
+def _snapshot_rows(user_id, scores):
+    now = datetime.utcnow()
+    return [{
+        'user_id': user_id,
+        'week_start': s['week_start'],
+        'journaling_score': s['journaling'],
+        'backtest_score': s['backtest'],
+        'risk_score': s['risk'],
+        'execution_score': s['execution'],
+        'discipline_score': s['discipline'],
+        'total_score': s['total'],
+        'created_at': now,
+    } for s in scores]
+
+
+def write_snapshots(conn, rows, replace=False):
+    """Insert snapshot rows; existing weeks are kept unless replace=True"""
+    if not rows:
+        return
+    table = KPISummary.__table__
+    stmt = dialect_insert(conn, table)
+    if replace:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.week_start],
+            set_={c: stmt.excluded[c] for c in (
+                'journaling_score', 'backtest_score', 'risk_score',
+                'execution_score', 'discipline_score', 'total_score', 'created_at')}
+        )
+    else:
+        # Two requests closing the same week at once: first one wins
+        stmt = stmt.on_conflict_do_nothing(index_elements=[table.c.user_id, table.c.week_start])
+    conn.execute(stmt, rows)
+
+
+def materialize_closed_weeks(user_id):
+    """Snapshot every closed week that has none (new or invalidated). Returns the number written."""
+    arrays = get_trades(user_id)
+    first_week = first_active_week(user_id, arrays)
+    if first_week is None:
+        return 0
+    through = last_closed_week()
+    expected = (through - first_week).days // 7 + 1
+    in_range = db.session.query(KPISummary.week_start).filter(
+        KPISummary.user_id == user_id,
+        KPISummary.week_start >= first_week,
+        KPISummary.week_start <= through
+    )
+    if expected <= 0 or in_range.count() >= expected:
+        return 0  # Up to date: the common case costs one indexed count
+
+    existing = {week for (week,) in in_range}
+    missing = first_week
+    while missing in existing:
+        missing += timedelta(days=7)
+    scores = [s for s in week_scores(user_id, arrays, missing, through) if s['week_start'] not in existing]
+    rows = _snapshot_rows(user_id, scores)
+    write_snapshots(write_connection(), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def invalidate_weeks(conn, weeks):
+    """Delete the snapshots of (user_id, Monday) weeks; call inside the writing transaction"""
+    weeks = {(uid, week) for uid, week in weeks if uid is not None and week is not None}
+    if weeks:
+        table = KPISummary.__table__
+        conn.execute(delete(table).where(tuple_(table.c.user_id, table.c.week_start).in_(weeks)))
+
+
+def history(user_id, weeks=52):
+    """The user's latest `weeks` snapshots, oldest first"""
+    rows = KPISummary.query.filter_by(user_id=user_id) \
+        .order_by(KPISummary.week_start.desc()).limit(weeks).all()
+    return rows[::-1]
+
+
+# --- ORM hook ---
+
+# Owner and timestamp of each model whose writes can change a closed week's scores
+WEEK_ATTRS = ((JournalEntry, ('user_id', 'date')), (BacktestEntry, ('user_id', 'created_at')))
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    pass
+
+
+# The old week is needed even when the object was expired before being changed
+for _model, _attrs in WEEK_ATTRS:
+    for _attr in _attrs:
+        event.listen(getattr(_model, _attr), 'set', _keep_old_value, active_history=True)
+
+
+def _values(obj, attr):
+    """Current value plus the one pending flush replaces"""
+    return {getattr(obj, attr), *inspect(obj).attrs[attr].history.deleted}
+
+
+def _touched_weeks(obj, attrs):
+    user_attr, stamp_attr = attrs
+    return {(uid, week_start_of(ts.date()))
+            for uid in _values(obj, user_attr) for ts in _values(obj, stamp_attr) if ts is not None}
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_week_writes(session, flush_context, instances):
+    weeks = set()
+    for obj in list(session.new) + list(session.deleted) + list(session.dirty):
+        for model, attrs in WEEK_ATTRS:
+            if isinstance(obj, model) and (obj not in session.dirty or session.is_modified(obj)):
+                weeks |= _touched_weeks(obj, attrs)
+    if weeks:
+        invalidate_weeks(session.connection(), weeks)
+
+
+# --- Backfill (process pool) ---
+
+_worker_app = None
+
+
+def _init_worker():
+    global _worker_app
+    from app import create_app
+    _worker_app = create_app()
+
+
+def _backfill_user(user_id):
+    """Runs in a pool process: every closed week of one user, as snapshot rows"""
+    with _worker_app.app_context():
+        arrays = engine.load_trades(user_id)
+        first_week = first_active_week(user_id, arrays)
+        if first_week is None:
+            return user_id, []
+        scores = week_scores(user_id, arrays, first_week, last_closed_week())
+        return user_id, _snapshot_rows(user_id, scores)
+
+
+@kpi_cli.command('backfill')
+@click.option('--user-id', type=int, default=None, help='Only backfill this user.')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: CPU count).')
+def backfill_command(user_id, workers):
+    """Recompute weekly KPI snapshots for all closed weeks."""
+    if user_id is not None:
+        user_ids = [user_id]
+    else:
+        user_ids = [uid for (uid,) in db.session.query(User.id).order_by(User.id)]
+    db.session.remove()
+
+    written = 0
+    # Scoring runs in the pool; this process does all the writing
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(_backfill_user, uid) for uid in user_ids]
+        for future in as_completed(futures):
+            uid, rows = future.result()
+            with db.engine.begin() as conn:
+                write_snapshots(conn, rows, replace=True)
+            written += len(rows)
+            click.echo(f"User {uid}: {len(rows)} weeks")
+    click.echo(f"Wrote {written} KPI snapshots for {len(user_ids)} users.")
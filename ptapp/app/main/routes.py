@@ -1,113 +1,36 @@
-from flask import Blueprint, render_template, current_app, flash, redirect, url_for
+from flask import Blueprint, render_template, current_app, flash, redirect, url_for, request, jsonify
 from flask_login import login_required, current_user
-from datetime import datetime, timedelta, date
-from app.models import JournalEntry, BacktestEntry, TradingGoal
-from app.extensions import db
+from datetime import datetime
+from app.extensions import db, read_only
+from app import identity
+from app.analytics import engine
+from app.analytics.cache import get_trades
+from app.planner import montecarlo
+from app.responses import cached_response
+from . import kpi
+from .kpi import compute_weekly_kpis
 
 main_bp = Blueprint("main", __name__, template_folder="templates", static_folder="../../static")
 
-def compute_weekly_kpis(user_id=1, start_date=None):
-    """
-    Compute simple weekly KPI scores for user.
-    Each component returns a 0..1 value. Overall is average * 100.
-    This is intentionally simple and easy to tweak.
-    """
-    if start_date is None:
-        # week start = Monday of current week
-        today = date.today()
-        start_date = today - timedelta(days=today.weekday())
-
-    # end date inclusive
-    end_date = start_date + timedelta(days=6)
-
-    # Query DB for journals and backtests in that week
-    journals = JournalEntry.query.filter(
-        JournalEntry.user_id == user_id,
-        JournalEntry.date >= datetime.combine(start_date, datetime.min.time()),
-        JournalEntry.date <= datetime.combine(end_date, datetime.max.time())
-    ).all()
-
-    backtests = BacktestEntry.query.filter(
-        BacktestEntry.user_id == user_id,
-        BacktestEntry.created_at >= datetime.combine(start_date, datetime.min.time()),
-        BacktestEntry.created_at <= datetime.combine(end_date, datetime.max.time())
-    ).all()
-
-    # 1. Journaling Score: Consistency (Days traded / 5)
-    # Did user log at least one trade on distinct days?
-    unique_days = set(j.date.date() for j in journals)
-    journaling_score = min(1.0, len(unique_days) / 5)
-
-    # 2. Backtest Score: Volume (Target: 10 backtests / week)
-    backtest_score = min(1.0, len(backtests) / 10)
-
-    # 3. Risk Score: Adherence to plan
-    # If active goal, check if risk <= planned risk. Else check rules_followed.
-    risk_score = 0.0
-    active_goal = TradingGoal.query.filter_by(user_id=user_id, status='active').first()
-    
-    if journals:
-        risk_compliant_count = 0
-        for j in journals:
-            # If we have a goal and risk amount recorded, check limit
-            if active_goal and j.risk_amount and active_goal.risk_per_trade:
-                # Allow 5% buffer
-                if j.risk_amount <= (active_goal.risk_per_trade * 1.05):
-                    risk_compliant_count += 1
-            # Fallback to self-reported rule adherence
-            elif j.rules_followed:
-                risk_compliant_count += 1
-                
-        risk_score = risk_compliant_count / len(journals)
-
-    # 4. Execution Score: Error Free % (Trades with empty 'mistakes')
-    execution_score = 0.0
-    if journals:
-        # If 'mistakes' field is empty or short, consider it good execution
-        good_exec_count = sum(1 for j in journals if not j.mistakes or len(j.mistakes) < 5)
-        execution_score = good_exec_count / len(journals)
-
-    # 5. Discipline Score: Process (News Checked + Complete Journal)
-    discipline_score = 0.0
-    if journals:
-        # Strict: Must have checked news AND marked journal complete
-        disciplined_count = sum(1 for j in journals if j.news_checked and j.journal_complete)
-        discipline_score = disciplined_count / len(journals)
-
-    total = (journaling_score + backtest_score + risk_score + execution_score + discipline_score) / 5 * 100
-
-    return {
-        "week_start": start_date,
-        "journaling": int(journaling_score * 100),
-        "backtest": int(backtest_score * 100),
-        "risk": int(risk_score * 100),
-        "execution": int(execution_score * 100),
-        "discipline": int(discipline_score * 100),
-        "total": int(total)
-    }
-
 @main_bp.route("/")
+@read_only
+@cached_response
 def index():
     if not current_user.is_authenticated:
         return render_template('landing.html')
         
-    # Simple single-user demo (user_id=1). Replace with current_user.id later.
+    # Closed weeks are snapshotted once; only the current week is scored live
+    kpi.materialize_closed_weeks(current_user.id)
     kpis = compute_weekly_kpis(user_id=current_user.id)
     bible_verse = "Colossians 3:23 — Whatever you do, work heartily, as for the Lord and not for men."
     # Fetch Active Goal
-    active_goal = TradingGoal.query.filter_by(user_id=current_user.id, status='active').first()
+    active_goal = identity.active_goal(current_user.id)
     goal_data = None
     
     if active_goal:
-        # Calculate Realized P/L since goal start
-        # Note: In a real app we'd sum profit_loss from Closed trades
-        trades_since_start = JournalEntry.query.filter(
-            JournalEntry.user_id == current_user.id,
-            JournalEntry.date >= datetime.combine(active_goal.start_date, datetime.min.time()),
-            JournalEntry.journal_complete == True
-        ).all()
-        
-        current_profit = sum((t.profit_loss or 0) for t in trades_since_start)
+        # Realized P/L of completed trades since goal start
+        trades = get_trades(current_user.id)
+        current_profit, avg_risk, _ = engine.goal_progress(trades, active_goal.start_date)
         current_eq = active_goal.start_balance + current_profit
         
         # Projection Logic
@@ -126,9 +49,7 @@ def index():
         
         # Risk Warning Logic
         warning = None
-        recent_risks = [t.risk_amount for t in trades_since_start if t.risk_amount]
-        if recent_risks:
-            avg_risk = sum(recent_risks) / len(recent_risks)
+        if avg_risk:
             # Tolerance: Allow up to 10% deviation (1.1x)
             if avg_risk > (active_goal.risk_per_trade * 1.1):
                 warning = f"High Risk Warning: You are risking ${avg_risk:.2f} avg vs planned ${active_goal.risk_per_trade}."
@@ -142,6 +63,8 @@ def index():
             "progress": progress_pct,
             "ev": round(ev_per_trade, 2),
             "trades_to_go": trades_to_go,
+            # Odds of getting there (computed in the background; see montecarlo.project)
+            "projection": montecarlo.project(active_goal, current_profit, trades),
             "deadline": active_goal.deadline,
             "warning": warning
         }
@@ -160,6 +83,20 @@ def index():
         goal=goal_data
     )
 
+@main_bp.route("/kpi")
+@read_only
+@login_required
+def kpi_history():
+    weeks = kpi.history(current_user.id, weeks=request.args.get('weeks', 52, type=int))
+    return render_template("kpi_history.html", weeks=weeks, current=compute_weekly_kpis(user_id=current_user.id))
+
+@main_bp.route("/api/kpi/history")
+@login_required
+def kpi_history_api():
+    # Snapshot rows only; the live current week is on the dashboard
+    weeks = kpi.history(current_user.id, weeks=request.args.get('weeks', 52, type=int))
+    return jsonify([w.to_dict() for w in weeks])
+
 @main_bp.route("/subscription")
 @login_required
 def subscription():
@@ -0,0 +1 @@
+"""Local market data (OHLC candles) used by replay backtests and trade analysis."""
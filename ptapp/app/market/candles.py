@@ -0,0 +1,137 @@
+"""
+OHLC candles as columnar NumPy arrays, and parsers for candle files (see
+store.py for how they are kept).
+
+Supported files:
+- CSV with a header naming the columns (time/date, open, high, low, close,
+  volume; MT5 style ``<DATE>``/``<TIME>`` headers and tab separators work too)
+- MT4 history exports without a header: date, time, open, high, low, close, volume
+- ``.npz`` archives with ts/open/high/low/close[/volume] arrays
+"""
+import csv
+import io
+import re
+from pathlib import Path
+
+import numpy as np
+
+COLUMNS = ('ts', 'open', 'high', 'low', 'close', 'volume')
+DAY_SECONDS = 24 * 3600
+
+
+class Candles:
+    """Columnar candles sorted by time; ts is int64 epoch seconds (UTC)"""
+    __slots__ = COLUMNS
+
+    def __init__(self, ts, open, high, low, close, volume=None):
+        self.ts = np.asarray(ts, dtype=np.int64)
+        self.open = np.asarray(open, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.volume = np.zeros(len(self.ts)) if volume is None else np.asarray(volume, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ts)
+
+    def columns(self):
+        return [getattr(self, name) for name in COLUMNS]
+
+    def slice(self, start=None, end=None):
+        """Candles with start <= ts < end (epoch seconds), by binary search"""
+        lo = 0 if start is None else np.searchsorted(self.ts, start, side='left')
+        hi = len(self.ts) if end is None else np.searchsorted(self.ts, end, side='left')
+        return Candles(*(column[lo:hi] for column in self.columns()))
+
+    def sorted(self):
+        """Sorted by time with duplicate timestamps dropped (last one wins)"""
+        order = np.argsort(self.ts, kind='stable')
+        ts = self.ts[order]
+        keep = np.append(ts[1:] != ts[:-1], True)
+        return Candles(*(column[order][keep] for column in self.columns()))
+
+
+def to_epoch(values):
+    """Parse date(-time) strings ('2024.01.02 13:45', '2024-01-02T13:45:00.500', ...) to epoch seconds"""
+    iso = _dashed_dates(np.char.strip(np.atleast_1d(np.asarray(values, dtype=str))))
+    iso = np.char.replace(iso, ' ', 'T')
+    return np.array(iso, dtype='datetime64[s]').astype(np.int64)
+
+
+def _dashed_dates(stamps):
+    """'2024.01.02 10:00:00.500' -> '2024-01-02 10:00:00.500': only the date's dots are separators"""
+    head = np.char.replace(stamps.astype('U10'), '.', '-')
+    width = stamps.dtype.itemsize // np.dtype('U1').itemsize
+    if width <= 10:
+        return head
+    # Time part, by viewing each fixed-width string as its characters (no per-row Python)
+    chars = np.ascontiguousarray(stamps).view('U1').reshape(len(stamps), width)
+    tail = np.ascontiguousarray(chars[:, 10:]).view(f'U{width - 10}')[:, 0]
+    return np.char.add(head, tail)
+
+
+def day_bounds(start=None, end=None):
+    """
+    (start, end) epoch seconds for Candles.slice / store.load covering the days
+    start..end, both inclusive. Takes dates or 'YYYY-MM-DD' strings; None leaves
+    that side open.
+    """
+    lo = None if start is None else int(to_epoch([str(start)])[0])
+    hi = None if end is None else int(to_epoch([str(end)])[0]) + DAY_SECONDS
+    return lo, hi
+
+
+def _header_key(name):
+    return re.sub(r'[^a-z]', '', name.lower())
+
+
+def parse_csv(text_stream):
+    """Candles from a CSV/TSV stream (see module docstring for the layouts)"""
+    sample = text_stream.read(4096)
+    text_stream.seek(0)
+    dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    rows = list(csv.reader(text_stream, dialect))
+    if not rows:
+        return Candles([], [], [], [], [])
+
+    header = [_header_key(h) for h in rows[0]]
+    if 'open' in header and 'close' in header:
+        body = np.array([r for r in rows[1:] if r], dtype=str)
+        col = {name: i for i, name in enumerate(header)}
+        if 'date' in col and 'time' in col:
+            stamps = np.char.add(np.char.add(body[:, col['date']], ' '), body[:, col['time']])
+        else:
+            stamps = body[:, col.get('time', col.get('date', col.get('datetime', 0)))]
+        volume_col = next((col[k] for k in ('volume', 'tickvol', 'vol') if k in col), None)
+        volume = body[:, volume_col] if volume_col is not None else None
+        candles = Candles(to_epoch(stamps), body[:, col['open']], body[:, col['high']],
+                          body[:, col['low']], body[:, col['close']], volume)
+    else:
+        # MT4 export: date, time, open, high, low, close, volume
+        body = np.array([r for r in rows if r], dtype=str)
+        stamps = np.char.add(np.char.add(body[:, 0], ' '), body[:, 1])
+        candles = Candles(to_epoch(stamps), body[:, 2], body[:, 3], body[:, 4], body[:, 5],
+                          body[:, 6] if body.shape[1] > 6 else None)
+    return candles.sorted()
+
+
+def load_file(path):
+    """Candles from a .csv/.txt or .npz file"""
+    path = Path(path)
+    if path.suffix == '.npz':
+        with np.load(path) as data:
+            return Candles(*(data[name] if name in data else None for name in COLUMNS)).sorted()
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        return parse_csv(io.StringIO(f.read()))
+
+
+def pip_size(pair):
+    pair = (pair or '').upper()
+    if 'JPY' in pair or pair.startswith('XAG'):
+        return 0.01
+    if pair.startswith('XAU'):
+        return 0.1
+    if pair.startswith(('US30', 'NAS', 'SPX', 'BTC', 'ETH')):
+        return 1.0
+    return 0.0001
+
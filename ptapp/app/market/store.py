@@ -0,0 +1,265 @@
+"""
+Memory-mapped columnar candle store.
+
+Each series is stored as one ``.npy`` file per column under
+``CANDLE_FOLDER/<PAIR>/<TIMEFRAME>/v<N>/`` and opened with
+``np.load(mmap_mode='r')``, so every process (web workers, job threads, sweep
+pool) reads the same page-cache pages and nothing is loaded up front.
+
+Ingesting writes a new version directory and then atomically replaces the
+series' ``CURRENT`` pointer. The previous version is kept, so a reader that
+resolved ``CURRENT`` just before the swap can still open its files; older
+versions are pruned by the next ingest (or ``flask candles prune``). Higher timeframes that are not stored are
+resampled on the fly from the finest stored one.
+
+    flask candles ingest data/EURUSD_M1.csv      # pair/timeframe from the file name
+    flask candles ingest export.csv --pair GBPUSD --timeframe M5
+    flask candles list
+    flask candles prune
+"""
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import click
+import numpy as np
+from flask import current_app
+from flask.cli import AppGroup
+
+from .candles import COLUMNS, Candles, load_file
+
+candles_cli = AppGroup('candles', help='Market data (candle store) commands.')
+
+TIMEFRAMES = {
+    'M1': 60, 'M5': 300, 'M15': 900, 'M30': 1800,
+    'H1': 3600, 'H4': 14400, 'D1': 86400, 'W1': 604800,
+}
+_MONDAY = 4 * 86400  # 1970-01-05, so weekly bars start on Monday
+KEEP_VERSIONS = 2  # the current version and the one before it
+
+_lock = threading.Lock()
+_open = {}  # (series dir, version) -> Candles of read-only memmaps
+
+
+def store_root():
+    return Path(current_app.config['CANDLE_FOLDER'])
+
+
+def _series_dir(root, pair, timeframe):
+    return Path(root) / pair.upper() / timeframe.upper()
+
+
+def _current_version(series_dir):
+    try:
+        return (series_dir / 'CURRENT').read_text().strip()
+    except FileNotFoundError:
+        return None
+
+
+# --- Reading ---
+
+def available_series(root=None):
+    """Sorted (pair, timeframe) tuples that are stored (not resampled)"""
+    root = Path(root or store_root())
+    if not root.is_dir():
+        return []
+    return sorted(
+        (pair_dir.name, tf_dir.name)
+        for pair_dir in root.iterdir() if pair_dir.is_dir()
+        for tf_dir in pair_dir.iterdir() if _current_version(tf_dir)
+    )
+
+
+def timeframes_for(pair, root=None):
+    """Every timeframe a pair can be read in: stored ones plus anything they resample to"""
+    stored = [TIMEFRAMES[tf] for p, tf in available_series(root) if p == pair.upper() and tf in TIMEFRAMES]
+    if not stored:
+        return []
+    finest = min(stored)
+    return [tf for tf, seconds in TIMEFRAMES.items() if seconds % finest == 0]
+
+
+def open_series(pair, timeframe, root=None):
+    """The stored series as Candles backed by read-only memmaps (no data is read yet)"""
+    series_dir = _series_dir(root or store_root(), pair, timeframe)
+    version = _current_version(series_dir)
+    if version is None:
+        raise FileNotFoundError(f"No candles stored for {pair} {timeframe}")
+
+    key = (str(series_dir), version)
+    with _lock:
+        candles = _open.get(key)
+    if candles is None:
+        candles = Candles(*(np.load(series_dir / version / f"{name}.npy", mmap_mode='r') for name in COLUMNS))
+        with _lock:
+            # Older versions of this series are dropped; their maps close once unreferenced
+            for stale in [k for k in _open if k[0] == key[0]]:
+                del _open[stale]
+            _open[key] = candles
+    return candles
+
+
+def load(pair, timeframe, start=None, end=None, root=None):
+    """
+    Candles for start <= ts < end (epoch seconds), read from the stored series
+    or resampled from the finest stored timeframe that divides `timeframe`.
+    """
+    timeframe = timeframe.upper()
+    stored = {tf for p, tf in available_series(root) if p == pair.upper()}
+    if timeframe in stored:
+        return open_series(pair, timeframe, root).slice(start, end)
+
+    seconds = TIMEFRAMES[timeframe]
+    sources = sorted((TIMEFRAMES[tf], tf) for tf in stored if tf in TIMEFRAMES and seconds % TIMEFRAMES[tf] == 0)
+    if not sources:
+        raise FileNotFoundError(f"No candles stored for {pair} that resample to {timeframe}")
+    source = open_series(pair, sources[0][1], root)
+    # Widen to whole buckets so the first/last bars are complete
+    if start is not None:
+        start = bucket_start(np.int64(start), seconds)
+    return resample(source.slice(start, end), seconds)
+
+
+# --- Resampling ---
+
+def bucket_start(ts, seconds):
+    if seconds % TIMEFRAMES['W1'] == 0:
+        return (ts - _MONDAY) // seconds * seconds + _MONDAY
+    return ts // seconds * seconds
+
+
+def resample(candles, seconds):
+    """Aggregate sorted candles into `seconds`-long bars (first open, max high, min low, last close)"""
+    if not len(candles):
+        return candles
+    buckets = bucket_start(np.asarray(candles.ts), seconds)
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    ends = np.append(starts[1:], len(buckets)) - 1
+    return Candles(
+        buckets[starts],
+        np.asarray(candles.open)[starts],
+        np.maximum.reduceat(candles.high, starts),
+        np.minimum.reduceat(candles.low, starts),
+        np.asarray(candles.close)[ends],
+        np.add.reduceat(candles.volume, starts),
+    )
+
+
+# --- Writing ---
+
+def ingest(candles, pair, timeframe, root=None, replace=False):
+    """
+    Merge candles into the stored series (newer rows win on equal timestamps)
+    and publish it as a new version. Returns the number of stored rows.
+    """
+    series_dir = _series_dir(root or store_root(), pair, timeframe)
+    series_dir.mkdir(parents=True, exist_ok=True)
+    old_version = _current_version(series_dir)
+
+    if old_version and not replace:
+        existing = Candles(*(np.load(series_dir / old_version / f"{name}.npy") for name in COLUMNS))
+        # Stable sort keeps the new rows after the old ones, so sorted() keeps the new ones
+        merged = Candles(*(np.concatenate((a, b)) for a, b in zip(existing.columns(), candles.columns())))
+        candles = merged.sorted()
+    else:
+        candles = candles.sorted()
+
+    version = f"v{int(old_version[1:]) + 1 if old_version else 1}"
+    version_dir = series_dir / version
+    if version_dir.exists():
+        shutil.rmtree(version_dir)  # left over from an interrupted ingest
+    version_dir.mkdir()
+    for name, column in zip(COLUMNS, candles.columns()):
+        np.save(version_dir / f"{name}.npy", np.ascontiguousarray(column))
+    (version_dir / 'meta.json').write_text(json.dumps({
+        'rows': len(candles),
+        'first': int(candles.ts[0]) if len(candles) else None,
+        'last': int(candles.ts[-1]) if len(candles) else None,
+    }))
+
+    pointer = series_dir / f"CURRENT.{os.getpid()}"
+    pointer.write_text(version)
+    os.replace(pointer, series_dir / 'CURRENT')
+
+    prune(series_dir)
+    return len(candles)
+
+
+def _version_number(name):
+    return int(name[1:]) if name[:1] == 'v' and name[1:].isdigit() else None
+
+
+def prune(series_dir, keep=KEEP_VERSIONS):
+    """
+    Delete versions older than the newest `keep` up to CURRENT (never CURRENT or
+    the one before it). Processes still mapping deleted files keep them until
+    they reopen (POSIX). Returns the removed version names.
+    """
+    current = _current_version(series_dir)
+    if current is None:
+        return []
+    oldest_kept = _version_number(current) - max(keep, KEEP_VERSIONS) + 1
+    removed = []
+    for path in series_dir.iterdir():
+        number = _version_number(path.name)
+        if path.is_dir() and number is not None and number < oldest_kept:
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path.name)
+    return sorted(removed, key=_version_number)
+
+
+def series_from_filename(path):
+    """(PAIR, TIMEFRAME) from a file named like EURUSD_M1.csv, else (None, None)"""
+    stem = Path(path).stem
+    if '_' not in stem:
+        return None, None
+    pair, timeframe = stem.rsplit('_', 1)
+    return pair.upper(), timeframe.upper()
+
+
+# --- CLI ---
+
+@candles_cli.command('ingest')
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--pair', default=None, help='Pair (default: from the file name, e.g. EURUSD_M1.csv).')
+@click.option('--timeframe', default=None, help='Timeframe (default: from the file name).')
+@click.option('--replace', is_flag=True, help='Replace the stored series instead of merging.')
+def ingest_command(paths, pair, timeframe, replace):
+    """Ingest CSV/MT export/.npz candle files into the store."""
+    for path in paths:
+        file_pair, file_timeframe = series_from_filename(path)
+        series_pair, series_timeframe = (pair or file_pair or '').upper(), (timeframe or file_timeframe or '').upper()
+        if not series_pair or not series_timeframe:
+            raise click.UsageError(f"{path}: pass --pair/--timeframe or name the file like EURUSD_M1.csv")
+        candles = load_file(path)
+        rows = ingest(candles, series_pair, series_timeframe, replace=replace)
+        click.echo(f"{path}: {len(candles)} candles -> {series_pair} {series_timeframe} ({rows} stored)")
+
+
+@candles_cli.command('list')
+def list_command():
+    """List stored candle series."""
+    root = store_root()
+    series = available_series(root)
+    if not series:
+        click.echo(f"No candles stored in {root}.")
+    for pair, timeframe in series:
+        series_dir = _series_dir(root, pair, timeframe)
+        meta = json.loads((series_dir / _current_version(series_dir) / 'meta.json').read_text())
+        first = np.datetime64(meta['first'], 's') if meta['first'] is not None else '-'
+        last = np.datetime64(meta['last'], 's') if meta['last'] is not None else '-'
+        click.echo(f"{pair} {timeframe}: {meta['rows']} candles, {first} .. {last}")
+
+
+@candles_cli.command('prune')
+@click.option('--keep', type=int, default=KEEP_VERSIONS, show_default=True,
+              help='Versions to keep per series (at least the current and previous one).')
+def prune_command(keep):
+    """Delete old versions of stored candle series."""
+    root = store_root()
+    for pair, timeframe in available_series(root):
+        removed = prune(_series_dir(root, pair, timeframe), keep)
+        if removed:
+            click.echo(f"{pair} {timeframe}: removed {', '.join(removed)}")
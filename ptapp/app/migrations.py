@@ -0,0 +1,250 @@
+"""
+Versioned schema migrations.
+
+Each migration is a (version, description, function) tuple. Applied versions
+are recorded in the ``schema_version`` table so ``flask db upgrade`` only runs
+what is missing. Migrations must be idempotent: fresh databases are created by
+``db.create_all()`` and already contain the latest columns and indexes.
+"""
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import inspect, text
+
+from .extensions import db
+
+db_cli = AppGroup('db', help='Database schema management.')
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register a migration function under a version number"""
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+
+# --- Helpers ---
+
+def _columns(conn, table):
+    return {col['name'] for col in inspect(conn).get_columns(table)}
+
+
+def add_column(conn, table, name, ddl_type):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists"""
+    if name not in _columns(conn, table):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl_type}"))
+
+
+def create_index(conn, name, table, columns, unique=False):
+    unique_sql = "UNIQUE " if unique else ""
+    conn.execute(text(
+        f"CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+    ))
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR(255), "
+        "applied_at DATETIME)"
+    ))
+
+
+def applied_versions(conn):
+    _ensure_version_table(conn)
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_version"))}
+
+
+# --- Migrations ---
+
+@migration(1, "Add trade plan columns to planners")
+def _planner_columns(conn):
+    for name, ddl_type in [
+        ("pair", "VARCHAR(20)"),
+        ("direction", "VARCHAR(10)"),
+        ("entry_price", "FLOAT"),
+        ("stop_loss", "FLOAT"),
+        ("take_profit", "FLOAT"),
+        ("risk_amount", "FLOAT"),
+        ("strategy", "VARCHAR(100)"),
+        ("analysis", "TEXT"),
+        ("executed_trade_id", "INTEGER"),
+    ]:
+        add_column(conn, "planners", name, ddl_type)
+
+
+@migration(2, "Add ai_confidence to journal_entries")
+def _journal_ai_confidence(conn):
+    add_column(conn, "journal_entries", "ai_confidence", "FLOAT")
+
+
+@migration(3, "Add trading_goal_id to journal_entries")
+def _journal_goal_link(conn):
+    add_column(conn, "journal_entries", "trading_goal_id",
+               "INTEGER REFERENCES trading_goals(id)")
+
+
+@migration(4, "Composite indexes for per-user list and dashboard queries")
+def _hot_path_indexes(conn):
+    # Journal list/analytics/KPI week ranges: WHERE user_id = ? AND date ...
+    # profit_loss is included so P/L aggregates are served from the index alone.
+    create_index(conn, "ix_journal_entries_user_date_pnl", "journal_entries",
+                 ["user_id", "date", "profit_loss"])
+    create_index(conn, "ix_backtest_entries_user_created", "backtest_entries",
+                 ["user_id", "created_at"])
+    create_index(conn, "ix_planners_user_date", "planners", ["user_id", "date"])
+    create_index(conn, "ix_trading_goals_user_status", "trading_goals", ["user_id", "status"])
+    create_index(conn, "ix_subscriptions_user", "subscriptions", ["user_id"])
+
+
+@migration(5, "P/L rollup table, backfilled from the journal")
+def _pnl_rollups(conn):
+    from .models import PnLRollup
+    from .analytics.rollups import rebuild
+    PnLRollup.__table__.create(conn, checkfirst=True)
+    rebuild(conn)
+
+
+@migration(6, "Background jobs table")
+def _jobs_table(conn):
+    from .models import Job
+    Job.__table__.create(conn, checkfirst=True)
+
+
+@migration(7, "Import fingerprints with a unique (user_id, fingerprint) index")
+def _journal_fingerprints(conn):
+    add_column(conn, "journal_entries", "fingerprint", "VARCHAR(64)")
+    create_index(conn, "uq_journal_entries_user_fingerprint", "journal_entries",
+                 ["user_id", "fingerprint"], unique=True)
+
+
+@migration(8, "Per-user data_version for the trade cache")
+def _user_data_version(conn):
+    add_column(conn, "user", "data_version", "INTEGER NOT NULL DEFAULT 0")
+
+
+@migration(9, "Unique (user_id, week_start) on kpi_summaries for weekly snapshots")
+def _kpi_snapshots(conn):
+    from .models import KPISummary
+    KPISummary.__table__.create(conn, checkfirst=True)
+    create_index(conn, "uq_kpi_summaries_user_week", "kpi_summaries",
+                 ["user_id", "week_start"], unique=True)
+
+
+@migration(10, "Per-user predictor_models table")
+def _predictor_models(conn):
+    from .models import PredictorModel
+    PredictorModel.__table__.create(conn, checkfirst=True)
+
+
+@migration(11, "Record which predictor version scored each journal entry")
+def _ai_model_version(conn):
+    add_column(conn, "journal_entries", "ai_model_version", "INTEGER")
+
+
+@migration(12, "Predictor feature store and per-user strategy/pair vocabulary")
+def _feature_store(conn):
+    from .models import FeatureVocab, TradeFeatures
+    FeatureVocab.__table__.create(conn, checkfirst=True)
+    TradeFeatures.__table__.create(conn, checkfirst=True)
+
+
+@migration(13, "Candle replay runs; backtest entries get run_id and direction")
+def _backtest_runs(conn):
+    from .models import BacktestRun
+    BacktestRun.__table__.create(conn, checkfirst=True)
+    add_column(conn, 'backtest_entries', 'run_id', 'INTEGER REFERENCES backtest_runs(id)')
+    add_column(conn, 'backtest_entries', 'direction', 'VARCHAR(10)')
+    create_index(conn, 'ix_backtest_entries_run', 'backtest_entries', ['run_id'])
+
+
+@migration(14, "Parameter sweeps and their per-combination results")
+def _backtest_sweeps(conn):
+    from .models import BacktestSweep, SweepResult
+    BacktestSweep.__table__.create(conn, checkfirst=True)
+    SweepResult.__table__.create(conn, checkfirst=True)
+
+
+@migration(15, "MAE/MFE excursion columns on journal and backtest entries")
+def _excursions(conn):
+    for table in ('journal_entries', 'backtest_entries'):
+        for name in ('mae_pips', 'mfe_pips', 'risk_pips', 'captured_pips', 'captured_r', 'held_minutes'):
+            add_column(conn, table, name, 'FLOAT')
+        add_column(conn, table, 'excursion_at', 'DATETIME')
+
+
+@migration(16, "Per-user content_version for the response cache")
+def _user_content_version(conn):
+    add_column(conn, "user", "content_version", "INTEGER NOT NULL DEFAULT 0")
+
+
+@migration(17, "Index planners.executed_trade_id for plan-to-trade matching")
+def _planner_executed_trade_index(conn):
+    create_index(conn, "ix_planners_executed_trade", "planners", ["executed_trade_id"])
+
+
+@migration(18, "Dense per-user vocabulary codes for predictor strategy/pair features")
+def _feature_vocab_codes(conn):
+    add_column(conn, "feature_vocab", "code", "INTEGER")
+    backfill = conn.execute(text(
+        "UPDATE feature_vocab SET code = (SELECT count(*) FROM feature_vocab AS earlier "
+        "WHERE earlier.user_id = feature_vocab.user_id AND earlier.kind = feature_vocab.kind "
+        "AND earlier.id <= feature_vocab.id) WHERE code IS NULL"
+    ))
+    if backfill.rowcount:
+        # Stored vectors were encoded from the old global ids; recompute them on the next backfill
+        conn.execute(text("DELETE FROM trade_features"))
+    create_index(conn, "uq_feature_vocab_user_kind_code", "feature_vocab", ["user_id", "kind", "code"], unique=True)
+
+
+# --- Runner ---
+
+def upgrade(engine=None):
+    """Apply all pending migrations in version order. Returns applied versions."""
+    engine = engine or db.engine
+    done = []
+    with engine.begin() as conn:
+        existing = applied_versions(conn)
+
+    for version, description, func in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in existing:
+            continue
+        # One transaction per migration so a failure leaves earlier ones recorded
+        with engine.begin() as conn:
+            func(conn)
+            conn.execute(
+                text("INSERT INTO schema_version (version, description, applied_at) "
+                     "VALUES (:v, :d, :t)"),
+                {"v": version, "d": description, "t": datetime.utcnow()}
+            )
+        done.append(version)
+    return done
+
+
+@db_cli.command('upgrade')
+def upgrade_command():
+    """Create missing tables and apply pending migrations."""
+    db.create_all()
+    done = upgrade()
+    if done:
+        for version in done:
+            click.echo(f"Applied migration {version}")
+    else:
+        click.echo("Database is up to date.")
+
+
+@db_cli.command('current')
+def current_command():
+    """Show applied schema versions."""
+    with db.engine.begin() as conn:
+        versions = applied_versions(conn)
+    latest = max((m[0] for m in MIGRATIONS), default=0)
+    click.echo(f"Applied: {max(versions, default=0)} / latest: {latest}")
+    for version, description, _ in sorted(MIGRATIONS, key=lambda m: m[0]):
+        mark = "x" if version in versions else " "
+        click.echo(f"  [{mark}] {version:03d} {description}")
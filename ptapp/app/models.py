@@ -2,6 +2,7 @@ from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from .extensions import db
 from datetime import datetime, date
+import json
 
 class User(UserMixin, db.Model):
     __tablename__ = 'user'
@@ -9,6 +10,10 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     password_hash = db.Column(db.String(128))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped on every journal write; keys the per-user trade cache
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped on any journal/backtest/plan/goal write; keys cached pages (app/responses.py)
+    content_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     subscription = db.relationship('Subscription', backref='user', uselist=False)
@@ -31,6 +36,9 @@ class User(UserMixin, db.Model):
 
 class Subscription(db.Model):
     __tablename__ = 'subscriptions'
+    __table_args__ = (
+        db.Index('ix_subscriptions_user', 'user_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     plan_type = db.Column(db.String(20), default='free') # free, pro
@@ -42,6 +50,10 @@ class Subscription(db.Model):
 
 class JournalEntry(db.Model):
     __tablename__ = 'journal_entries'
+    __table_args__ = (
+        db.Index('ix_journal_entries_user_date_pnl', 'user_id', 'date', 'profit_loss'),
+        db.Index('uq_journal_entries_user_fingerprint', 'user_id', 'fingerprint', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -77,16 +89,35 @@ class JournalEntry(db.Model):
     risk_reward = db.Column(db.Float)
     news_event = db.Column(db.String(100)) # e.g. "NFP", "None"
     ai_confidence = db.Column(db.Float) # 0.0 to 1.0
+    ai_model_version = db.Column(db.Integer) # predictor version that produced ai_confidence
     
     # Link to a specific Growth Plan/Goal
     trading_goal_id = db.Column(db.Integer, db.ForeignKey('trading_goals.id'), nullable=True)
 
+    # Excursions over the trade, from local candles (app/analytics/excursions.py)
+    mae_pips = db.Column(db.Float)
+    mfe_pips = db.Column(db.Float)
+    risk_pips = db.Column(db.Float)
+    captured_pips = db.Column(db.Float)
+    captured_r = db.Column(db.Float)
+    held_minutes = db.Column(db.Float)
+    excursion_at = db.Column(db.DateTime) # None = not computed (or inputs changed since)
+
+    # Broker ticket or content hash for imported trades (None for manual entries)
+    fingerprint = db.Column(db.String(64))
+
 class BacktestEntry(db.Model):
     __tablename__ = 'backtest_entries'
+    __table_args__ = (
+        db.Index('ix_backtest_entries_user_created', 'user_id', 'created_at'),
+        db.Index('ix_backtest_entries_run', 'run_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     pair=  db.Column(db.String(20))
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    run_id = db.Column(db.Integer, db.ForeignKey('backtest_runs.id')) # set for replay-generated trades
     strategy_name = db.Column(db.String(200))
+    direction = db.Column(db.String(10)) # buy/sell; manual entries leave it empty (treated as buy)
     entry_time = db.Column(db.DateTime)
     exit_time = db.Column(db.DateTime)
     entry_price = db.Column(db.Float)
@@ -96,11 +127,93 @@ class BacktestEntry(db.Model):
     image_filename = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Excursions over the trade, from local candles (app/analytics/excursions.py)
+    mae_pips = db.Column(db.Float)
+    mfe_pips = db.Column(db.Float)
+    risk_pips = db.Column(db.Float)
+    captured_pips = db.Column(db.Float)
+    captured_r = db.Column(db.Float)
+    held_minutes = db.Column(db.Float)
+    excursion_at = db.Column(db.DateTime) # None = not computed (or inputs changed since)
+
     def __repr__(self):
         return f"<Backtest {self.strategy_name} {self.result}>"
 
+class BacktestRun(db.Model):
+    """One candle replay (app/backtest/replay.py); its trades are BacktestEntry rows"""
+    __tablename__ = 'backtest_runs'
+    __table_args__ = (
+        db.Index('ix_backtest_runs_user_created', 'user_id', 'created_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    pair = db.Column(db.String(20), nullable=False)
+    timeframe = db.Column(db.String(10), nullable=False)
+    strategy_name = db.Column(db.String(200))
+    rule = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text) # JSON
+    candles = db.Column(db.Integer, default=0)
+    trades = db.Column(db.Integer, default=0)
+    wins = db.Column(db.Integer, default=0)
+    net_pips = db.Column(db.Float, default=0.0)
+    elapsed_ms = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def win_rate(self):
+        return round(self.wins / self.trades * 100, 1) if self.trades else 0.0
+
+class BacktestSweep(db.Model):
+    """A grid search over replay parameters (app/backtest/sweep.py)"""
+    __tablename__ = 'backtest_sweeps'
+    __table_args__ = (
+        db.Index('ix_backtest_sweeps_user_created', 'user_id', 'created_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    name = db.Column(db.String(200))
+    rule = db.Column(db.String(50), nullable=False)
+    timeframe = db.Column(db.String(10), nullable=False)
+    grid = db.Column(db.Text) # JSON: pairs, rule param lists, stops, rrs, sessions, ...
+    combinations = db.Column(db.Integer, default=0)
+    completed = db.Column(db.Integer, default=0)
+    elapsed_ms = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SweepResult(db.Model):
+    """Metrics of one parameter combination of a sweep (no trades are stored)"""
+    __tablename__ = 'sweep_results'
+    __table_args__ = (
+        db.Index('ix_sweep_results_sweep_net', 'sweep_id', 'net_pips'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    sweep_id = db.Column(db.Integer, db.ForeignKey('backtest_sweeps.id'), nullable=False)
+    pair = db.Column(db.String(20), nullable=False)
+    params = db.Column(db.Text) # JSON rule parameters
+    session = db.Column(db.String(20))
+    stop_pips = db.Column(db.Float)
+    rr = db.Column(db.Float)
+    trades = db.Column(db.Integer, default=0)
+    wins = db.Column(db.Integer, default=0)
+    net_pips = db.Column(db.Float, default=0.0)
+    profit_factor = db.Column(db.Float)
+    expectancy = db.Column(db.Float) # pips per trade
+    max_drawdown = db.Column(db.Float) # pips
+
+    @property
+    def rule_params(self):
+        return json.loads(self.params) if self.params else {}
+
+    @property
+    def win_rate(self):
+        return round(self.wins / self.trades * 100, 1) if self.trades else 0.0
+
 class Planner(db.Model):
     __tablename__ = 'planners'
+    __table_args__ = (
+        db.Index('ix_planners_user_date', 'user_id', 'date'),
+        db.Index('ix_planners_executed_trade', 'executed_trade_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     date = db.Column(db.Date, default=datetime.utcnow)
@@ -121,6 +234,7 @@ class Planner(db.Model):
     # Execution Tracking
     completed = db.Column(db.Boolean, default=False)
     executed_trade_id = db.Column(db.Integer, db.ForeignKey('journal_entries.id'), nullable=True)
+    executed_trade = db.relationship('JournalEntry', foreign_keys=[executed_trade_id])  # set by app/planner/matching.py
     
     # Reflection
     reflection = db.Column(db.Text)  # Did you follow the plan?
@@ -133,6 +247,9 @@ class Planner(db.Model):
 
 class KPISummary(db.Model):
     __tablename__ = 'kpi_summaries'
+    __table_args__ = (
+        db.Index('uq_kpi_summaries_user_week', 'user_id', 'week_start', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     week_start = db.Column(db.Date)
@@ -144,8 +261,23 @@ class KPISummary(db.Model):
     total_score = db.Column(db.Float, default=0.0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    def to_dict(self):
+        # Same keys as main.kpi.compute_weekly_kpis
+        return {
+            'week_start': self.week_start.isoformat(),
+            'journaling': int(self.journaling_score),
+            'backtest': int(self.backtest_score),
+            'risk': int(self.risk_score),
+            'execution': int(self.execution_score),
+            'discipline': int(self.discipline_score),
+            'total': int(self.total_score),
+        }
+
 class TradingGoal(db.Model):
     __tablename__ = 'trading_goals'
+    __table_args__ = (
+        db.Index('ix_trading_goals_user_status', 'user_id', 'status'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)  # e.g. "Buy a Phone"
@@ -170,3 +302,110 @@ class TradingGoal(db.Model):
     def progress(self, current_balance_profit):
         if self.target_amount <= 0: return 0
         return min(100.0, (current_balance_profit / self.target_amount) * 100)
+
+class PnLRollup(db.Model):
+    """Per-user P/L aggregate for one day, ISO week (keyed by Monday), month or year"""
+    __tablename__ = 'pnl_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'grain', 'period', name='uq_pnl_rollups_user_grain_period'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    grain = db.Column(db.String(5), nullable=False) # day, week, month, year
+    period = db.Column(db.String(10), nullable=False) # '2023-10-23', '2023-10', '2023'
+    pnl = db.Column(db.Float, default=0.0)
+    wins = db.Column(db.Integer, default=0)
+    losses = db.Column(db.Integer, default=0)
+    breakeven = db.Column(db.Integer, default=0)
+
+    @property
+    def trades(self):
+        return (self.wins or 0) + (self.losses or 0) + (self.breakeven or 0)
+
+class Job(db.Model):
+    """Background job (imports, rebuilds, backfills); see app/jobs/runner.py"""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_user_created', 'user_id', 'created_at'),
+        db.Index('ix_jobs_status', 'status'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True) # None for system jobs
+    kind = db.Column(db.String(50), nullable=False) # e.g. import_journal
+    status = db.Column(db.String(20), default='queued') # queued, running, done, failed
+    payload = db.Column(db.Text) # JSON kwargs for the handler
+    progress = db.Column(db.Integer, default=0)
+    total = db.Column(db.Integer) # None when unknown
+    message = db.Column(db.String(255))
+    result = db.Column(db.Text) # JSON
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+
+    @property
+    def percent(self):
+        if self.status == 'done':
+            return 100
+        if not self.total:
+            return 0
+        return min(100, int(self.progress * 100 / self.total))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'total': self.total,
+            'percent': self.percent,
+            'message': self.message,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+class PredictorModel(db.Model):
+    """Per-user TradePredictor weights; see app/predictors.py"""
+    __tablename__ = 'predictor_models'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
+    weights = db.Column(db.Text, nullable=False) # JSON {weights, bias}
+    version = db.Column(db.Integer, nullable=False, default=1) # bumped on every save
+    samples = db.Column(db.Integer, default=0) # outcomes learned so far
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class FeatureVocab(db.Model):
+    """Per-user strategy/pair vocabulary; codes are the stable values fed to the predictor"""
+    __tablename__ = 'feature_vocab'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'kind', 'value', name='uq_feature_vocab_user_kind_value'),
+        db.Index('uq_feature_vocab_user_kind_code', 'user_id', 'kind', 'code', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False) # strategy / pair
+    value = db.Column(db.String(100), nullable=False)
+    code = db.Column(db.Integer) # 1, 2, 3... in order of first use, per user and kind
+
+class TradeFeatures(db.Model):
+    """Precomputed predictor inputs for one journal entry; see app/journal/features.py"""
+    __tablename__ = 'trade_features'
+    __table_args__ = (
+        db.Index('ix_trade_features_user_entry', 'user_id', 'journal_entry_id'),
+    )
+    journal_entry_id = db.Column(db.Integer, db.ForeignKey('journal_entries.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # ai_helper.FEATURES order
+    f_time = db.Column(db.Float, nullable=False)
+    f_sl = db.Column(db.Float, nullable=False)
+    f_tp = db.Column(db.Float, nullable=False)
+    f_rr = db.Column(db.Float, nullable=False)
+    f_news = db.Column(db.Float, nullable=False)
+    f_strategy = db.Column(db.Float, nullable=False)
+    strategy_id = db.Column(db.Integer) # FeatureVocab codes
+    pair_id = db.Column(db.Integer)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,71 @@
+"""
+Keyset (cursor) pagination for the list pages.
+
+Pages are ordered by (sort column DESC, id DESC) and the cursor is the
+(sort value, id) of the last row shown, so every page is an index range scan
+no matter how deep the user scrolls. Offsets are never used.
+
+Rows without a sort value (e.g. an undated plan) come last, newest id first;
+their cursor carries an empty value.
+"""
+import base64
+from datetime import date, datetime
+
+from flask import abort, make_response, render_template
+from sqlalchemy import or_, tuple_
+from sqlalchemy.sql import sqltypes
+
+PER_PAGE = 50
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_more(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(sort_value, row_id):
+    raw = f"{sort_value.isoformat() if sort_value is not None else ''}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort_col):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, row_id = base64.urlsafe_b64decode(padded.encode()).decode().rsplit('|', 1)
+        if not value:
+            return None, int(row_id)
+        if isinstance(sort_col.type, sqltypes.DateTime):
+            return datetime.fromisoformat(value), int(row_id)
+        return date.fromisoformat(value), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        abort(400)
+
+
+def keyset_page(query, sort_col, id_col, cursor=None, per_page=PER_PAGE):
+    """Newest-first page of `query` after `cursor` (None for the first page)"""
+    if cursor:
+        value, row_id = decode_cursor(cursor, sort_col)
+        if value is None:
+            query = query.filter(sort_col.is_(None), id_col < row_id)
+        else:
+            query = query.filter(or_(tuple_(sort_col, id_col) < tuple_(value, row_id), sort_col.is_(None)))
+
+    rows = query.order_by(sort_col.desc().nulls_last(), id_col.desc()).limit(per_page + 1).all()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_col.key), getattr(last, id_col.key))
+    return KeysetPage(rows, next_cursor)
+
+
+def render_rows(template, page, **context):
+    """'Load more' response: just the table rows, next cursor in a header"""
+    response = make_response(render_template(template, page=page, **context))
+    response.headers['X-Next-Cursor'] = page.next_cursor or ''
+    return response
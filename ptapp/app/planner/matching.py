@@ -0,0 +1,149 @@
+"""
+Automatic plan-to-trade matching.
+
+A trade plan is executed by the first journal entry with the same pair and
+direction taken on the plan's day or within the following
+``PLAN_MATCH_DAYS`` - 1 days. Pairs are compared without case or separators
+(``EUR/USD`` == ``eurusd``). Each journal entry executes at most one plan;
+plans are matched oldest first.
+
+Journal writes call ``match_trades`` with the dates they touched, on the
+writing connection: the new-entry route after its flush, the CSV import once
+per chunk. Saving a plan, or editing the date, pair or direction of a plan or
+journal entry, is picked up by the ``after_flush`` hook below. Both sides are
+read through the (user_id, date) indexes, limited to the window those dates
+can affect, and the "already executed" check uses the ``executed_trade_id``
+index.
+"""
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, event, exists, inspect, select, update
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models import JournalEntry, Planner, User
+from app.responses import bump_content_version
+
+DEFAULT_MATCH_DAYS = 2
+
+plans_cli = AppGroup('plans', help='Trade plan commands.')
+
+
+def normalize_pair(pair):
+    return re.sub(r'[^0-9A-Z]', '', (pair or '').upper())
+
+
+def _match_days():
+    return max(1, current_app.config.get('PLAN_MATCH_DAYS', DEFAULT_MATCH_DAYS))
+
+
+def match_trades(conn, user_id, start=None, end=None):
+    """
+    Link the user's unexecuted plans to the journal entries that executed them.
+    start/end bound the journal dates that changed (None = all). Returns the number of plans linked.
+    """
+    plans_t, journal_t = Planner.__table__, JournalEntry.__table__
+    days = timedelta(days=_match_days())
+
+    plan_query = select(plans_t.c.id, plans_t.c.date, plans_t.c.pair, plans_t.c.direction).where(
+        plans_t.c.user_id == user_id,
+        plans_t.c.executed_trade_id.is_(None),
+        plans_t.c.date.isnot(None),
+        plans_t.c.pair.isnot(None),
+        plans_t.c.direction.isnot(None),
+    )
+    # Only plans whose window can contain one of the changed trades
+    if start is not None:
+        plan_query = plan_query.where(plans_t.c.date > _day(start) - days)
+    if end is not None:
+        plan_query = plan_query.where(plans_t.c.date <= _day(end))
+    plans = conn.execute(plan_query.order_by(plans_t.c.date, plans_t.c.id)).all()
+    if not plans:
+        return 0
+
+    first_day = min(p.date for p in plans)
+    last_day = max(p.date for p in plans)
+    linked = exists().where(plans_t.c.executed_trade_id == journal_t.c.id)
+    trades = conn.execute(
+        select(journal_t.c.id, journal_t.c.date, journal_t.c.pair, journal_t.c.direction).where(
+            journal_t.c.user_id == user_id,
+            journal_t.c.date >= datetime.combine(first_day, datetime.min.time()),
+            journal_t.c.date < datetime.combine(last_day + days, datetime.min.time()),
+            ~linked,
+        ).order_by(journal_t.c.date, journal_t.c.id)
+    ).all()
+
+    candidates = defaultdict(list)  # (pair, direction) -> trades, oldest first
+    for trade in trades:
+        candidates[(normalize_pair(trade.pair), (trade.direction or '').lower())].append(trade)
+
+    links = []
+    taken = set()
+    for plan in plans:
+        opens = datetime.combine(plan.date, datetime.min.time())
+        closes = opens + days
+        for trade in candidates.get((normalize_pair(plan.pair), plan.direction.lower()), ()):
+            if trade.id not in taken and opens <= trade.date < closes:
+                taken.add(trade.id)
+                links.append({'plan_id': plan.id, 'trade_id': trade.id})
+                break
+
+    if links:
+        conn.execute(
+            update(plans_t)
+            .where(plans_t.c.id == bindparam('plan_id'), plans_t.c.executed_trade_id.is_(None))
+            .values(executed_trade_id=bindparam('trade_id'), completed=True),
+            links,
+        )
+        bump_content_version(conn, [user_id])
+    return len(links)
+
+
+def _day(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+# --- ORM hook ---
+
+# Columns that decide which plan a trade executes
+MATCH_ATTRS = ('user_id', 'date', 'pair', 'direction')
+
+
+@event.listens_for(Session, 'after_flush')
+def _match_edited(session, flush_context):
+    # New journal entries are matched by the code that adds them (route, import)
+    touched = [obj for obj in session.new if isinstance(obj, Planner)]
+    for obj in session.dirty:
+        if isinstance(obj, (Planner, JournalEntry)):
+            state = inspect(obj)
+            if any(state.attrs[a].history.has_changes() for a in MATCH_ATTRS):
+                touched.append(obj)
+
+    days = defaultdict(set)  # user_id -> days whose window may hold a new match
+    for obj in touched:
+        if obj.user_id is not None and obj.date is not None:
+            days[obj.user_id].add(_day(obj.date))
+    for user_id, changed in days.items():
+        match_trades(session.connection(), user_id, min(changed), max(changed))
+
+
+# --- CLI ---
+
+@plans_cli.command('match')
+@click.option('--user-id', type=int, default=None, help='Only match this user.')
+def match_command(user_id):
+    """Link existing trade plans to the journal entries that executed them."""
+    if user_id is not None:
+        user_ids = [user_id]
+    else:
+        user_ids = [uid for (uid,) in db.session.query(User.id).order_by(User.id)]
+    total = 0
+    for uid in user_ids:
+        total += match_trades(db.session.connection(), uid)
+        db.session.commit()
+    click.echo(f"Linked {total} plans to their trades.")
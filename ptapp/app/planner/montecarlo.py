@@ -0,0 +1,297 @@
+"""
+Monte Carlo projection of a TradingGoal.
+
+Every path is one possible sequence of the trades left until the deadline.
+Outcomes are drawn either from the goal's plan (a win of ``reward_per_trade``
+with probability ``win_rate``, otherwise a loss of ``risk_per_trade``) or
+bootstrapped from the user's own closed trades. All paths advance together:
+each block of trades is one (trades, paths) draw plus a cumulative sum, so
+100k paths cost a few array passes per block rather than a Python loop per path.
+
+A path is ruined once its balance can no longer fund a trade at the planned
+risk; it stays there. The projection reports the share of paths reaching the
+target before the deadline, the share ruined before reaching it, and
+percentile equity cones.
+
+Results are kept in a per-process LRU keyed by a hash of everything the
+simulation depends on (goal parameters, current profit, trades left and, for
+bootstrapped outcomes, the trade P/L itself). The random seed comes from the
+same hash, so a projection is reproducible.
+
+A full run takes seconds, so pages never wait for one: ``project`` returns the
+cached result for the current state, or else the goal's last finished result
+(marked ``stale``) and queues a ``goal_projection`` job to compute the new
+one. Only when there is no earlier result does it run inline, with
+``GOAL_INLINE_PATHS`` paths. The job bumps the user's content version when it
+is done, so cached dashboards pick up the new odds.
+"""
+import hashlib
+import json
+import math
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import numpy as np
+from flask import current_app
+
+from app.analytics import engine
+
+PATHS = 100_000
+INLINE_PATHS = 2_000  # preview when nothing has been computed for a goal yet
+BLOCK = 32  # trades drawn per step; BLOCK x PATHS floats at a time
+PERCENTILES = (5, 25, 50, 75, 95)
+CHECKPOINTS = 40  # points per cone
+MIN_HISTORY = 20  # closed trades needed to bootstrap from history
+FREQUENCY_WINDOW_DAYS = 90
+
+SOURCES = {
+    'plan': 'Plan (win rate, risk, reward)',
+    'history': 'My closed trades',
+}
+
+_lock = threading.Lock()
+_results = OrderedDict()  # key -> projection dict, oldest first
+_latest = OrderedDict()  # (goal id, source) -> last full projection
+_scheduled = set()  # keys with a goal_projection job queued or running
+
+
+# --- Inputs ---
+
+def trades_per_day(arrays, today=None):
+    """Completed trades per calendar day over the recent window (config default if none)"""
+    today = today or date.today()
+    recent = arrays.since(today - timedelta(days=FREQUENCY_WINDOW_DAYS), completed_only=True)
+    if len(recent):
+        return len(recent) / FREQUENCY_WINDOW_DAYS
+    return current_app.config.get('GOAL_TRADES_PER_DAY', 1.0)
+
+
+def trades_left(goal, arrays, today=None):
+    """(trades until the deadline, days until it); no deadline uses the configured horizon"""
+    today = today or date.today()
+    if goal.deadline:
+        days = (goal.deadline - today).days + 1  # the deadline day itself still counts
+    else:
+        days = current_app.config.get('GOAL_HORIZON_DAYS', 90)
+    if days <= 0:
+        return 0, 0
+    limit = current_app.config.get('GOAL_MAX_TRADES', 1000)
+    return min(limit, math.ceil(days * trades_per_day(arrays, today))), days
+
+
+def history_pnl(arrays):
+    """P/L of the user's completed, closed trades"""
+    return engine.closed_pnl(arrays.select(arrays.complete))
+
+
+# --- Simulation ---
+
+def plan_draw(win_rate, reward, risk):
+    p = win_rate / 100.0
+
+    def draw(rng, shape):
+        return np.where(rng.random(shape) < p, reward, -risk)
+    return draw
+
+
+def bootstrap_draw(pnl):
+    pnl = np.asarray(pnl, dtype=np.float64)
+
+    def draw(rng, shape):
+        return pnl[rng.integers(0, len(pnl), size=shape)]
+    return draw
+
+
+def simulate(start, target, floor, n_trades, draw, paths=PATHS, seed=None):
+    """
+    Run `paths` equity paths of n_trades draws from `start`. A path reaches the
+    goal at the first balance >= target and is ruined at the first balance
+    <= floor (frozen from then on). Returns (reached_at, ruined, cone_steps,
+    cone) where reached_at is the 1-based trade number (-1 if never) and cone
+    is (len(PERCENTILES), len(cone_steps)) balance percentiles.
+    """
+    rng = np.random.default_rng(seed)
+    equity = np.full(paths, float(start))
+    alive = equity > floor
+    reached_at = np.where(equity >= target, 0, -1)
+    columns = np.arange(paths)
+
+    cone_steps = np.unique(np.linspace(0, n_trades, min(CHECKPOINTS, n_trades) + 1).round().astype(int))
+    cone = [np.percentile(equity, PERCENTILES)]
+
+    for lo in range(0, n_trades, BLOCK):
+        size = min(BLOCK, n_trades - lo)
+        outcomes = draw(rng, (size, paths))
+        outcomes[:, ~alive] = 0.0
+        block = equity + np.cumsum(outcomes, axis=0)
+
+        # Freeze each path at the balance it was ruined with
+        below = np.logical_or.accumulate(block <= floor, axis=0)
+        ruined_now = below[-1]
+        if ruined_now.any():
+            frozen = block[below.argmax(axis=0), columns]
+            block = np.where(below, frozen, block)
+
+        hits = block >= target
+        first_hit = (reached_at < 0) & hits.any(axis=0)
+        reached_at[first_hit] = lo + hits[:, first_hit].argmax(axis=0) + 1
+
+        for step in cone_steps[(cone_steps > lo) & (cone_steps <= lo + size)]:
+            cone.append(np.percentile(block[step - lo - 1], PERCENTILES))
+        equity = block[-1]
+        alive &= ~ruined_now
+
+    return reached_at, ~alive, cone_steps, np.array(cone).T
+
+
+# --- Projection ---
+
+def _key(*parts):
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).digest()
+    return digest.hex(), int.from_bytes(digest[:8], 'little')
+
+
+def _prepare(goal, current_profit, arrays, source, today=None):
+    """Simulation inputs for a goal, or None when there is nothing left to project"""
+    remaining = goal.target_amount - current_profit
+    n_trades, days = trades_left(goal, arrays, today)
+    if remaining <= 0 or n_trades == 0:
+        return None
+
+    pnl = history_pnl(arrays) if source == 'history' else None
+    if pnl is not None and len(pnl) >= MIN_HISTORY:
+        draw = bootstrap_draw(pnl)
+        inputs = ('history', hashlib.sha256(np.ascontiguousarray(pnl).tobytes()).hexdigest())
+    else:
+        source = 'plan'
+        draw = plan_draw(goal.win_rate or 0.0, goal.reward_per_trade or 0.0, goal.risk_per_trade or 0.0)
+        inputs = ('plan', goal.win_rate, goal.reward_per_trade, goal.risk_per_trade)
+    return {
+        'source': source,
+        'draw': draw,
+        'inputs': inputs,
+        'start': goal.start_balance + current_profit,
+        'target': goal.start_balance + goal.target_amount,
+        'floor': max(goal.risk_per_trade or 0.0, 0.0),  # can't fund another planned-risk trade
+        'n_trades': n_trades,
+        'days': days,
+    }
+
+
+def _spec_key(spec, paths):
+    return _key(spec['inputs'], spec['start'], spec['target'], spec['floor'], spec['n_trades'],
+                spec['days'], paths)
+
+
+def _full_paths():
+    return current_app.config.get('GOAL_SIMULATION_PATHS', PATHS)
+
+
+def _remember(table, key, value):
+    limit = current_app.config.get('GOAL_PROJECTION_CACHE_SIZE', 128)
+    with _lock:
+        table[key] = value
+        table.move_to_end(key)
+        while len(table) > limit:
+            table.popitem(last=False)
+
+
+def _run(spec, paths):
+    """Simulate (or fetch from the LRU) a prepared projection"""
+    key, seed = _spec_key(spec, paths)
+    with _lock:
+        if key in _results:
+            _results.move_to_end(key)
+            return _results[key]
+
+    reached_at, ruined, steps, cone = simulate(spec['start'], spec['target'], spec['floor'],
+                                               spec['n_trades'], spec['draw'], paths, seed)
+    reached = reached_at >= 0
+    result = {
+        'source': spec['source'],
+        'paths': paths,
+        'trades': spec['n_trades'],
+        'days': spec['days'],
+        'probability': float(reached.mean()),
+        'ruin': float((ruined & ~reached).mean()),
+        'median_trades': int(np.median(reached_at[reached])) if reached.any() else None,
+        'median_balance': float(cone[PERCENTILES.index(50)][-1]),
+        'cone': {
+            'steps': steps.tolist(),
+            **{f"p{p}": np.round(row, 2).tolist() for p, row in zip(PERCENTILES, cone)},
+        },
+        'target': spec['target'],
+    }
+    _remember(_results, key, result)
+    return result
+
+
+def project(goal, current_profit, arrays, source='plan', today=None):
+    """
+    Projection dict for a goal (see simulate), or None when there is nothing
+    left to project (target already met or deadline passed). `source` is
+    'plan' or 'history'; history falls back to the plan below MIN_HISTORY trades.
+    Never runs the full simulation in the caller (see module docstring); a
+    result that is not for the current state has ``stale`` set.
+    """
+    spec = _prepare(goal, current_profit, arrays, source, today)
+    if spec is None:
+        return None
+
+    key, _ = _spec_key(spec, _full_paths())
+    with _lock:
+        current = _results.get(key)
+        latest = _latest.get((goal.id, source))
+        queue = current is None and key not in _scheduled
+        if queue:
+            _scheduled.add(key)
+    if current is not None:
+        return current
+
+    if queue:
+        from app.jobs.runner import enqueue
+        try:
+            # A system job: it doesn't belong in the user's job list
+            enqueue('goal_projection', goal_id=goal.id, source=source, key=key)
+        except Exception:
+            with _lock:
+                _scheduled.discard(key)
+            raise
+    if latest is None:
+        inline = current_app.config.get('GOAL_INLINE_PATHS', INLINE_PATHS)
+        latest = _run(spec, min(inline, _full_paths()))
+    return dict(latest, stale=True)
+
+
+def refresh(goal, current_profit, arrays, source='plan', today=None):
+    """Run the full projection for a goal's current state and make it the goal's latest result"""
+    spec = _prepare(goal, current_profit, arrays, source, today)
+    if spec is None:
+        return None
+    result = _run(spec, _full_paths())
+    _remember(_latest, (goal.id, source), result)
+    return result
+
+
+def refresh_goal(goal_id, source='plan', key=None):
+    """Body of the goal_projection job. Returns the refreshed projection (None if nothing to project)."""
+    from app.extensions import db
+    from app.models import TradingGoal
+    from app.analytics.cache import get_trades
+    from app.responses import bump_content_version
+
+    try:
+        goal = db.session.get(TradingGoal, goal_id)
+        if goal is None:
+            return None
+        arrays = get_trades(goal.user_id)
+        current_profit, _, _ = engine.goal_progress(arrays, goal.start_date)
+        result = refresh(goal, current_profit, arrays, source)
+        # Cached dashboards were rendered with the previous (or a preview) projection
+        with db.engine.begin() as conn:
+            bump_content_version(conn, [goal.user_id])
+        return result
+    finally:
+        with _lock:
+            _scheduled.discard(key)
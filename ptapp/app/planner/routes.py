@@ -1,10 +1,18 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
+from sqlalchemy import select
+from sqlalchemy.orm import contains_eager, defer, selectinload
 from datetime import datetime, timedelta
-from app.extensions import db
-from app.models import Planner, TradingGoal, JournalEntry
-from app import backtest, journal
+from app.extensions import db, read_only
+from app.models import Planner, TradingGoal, JournalEntry, BacktestEntry
+from app import backtest, identity, journal
+from app.pagination import keyset_page, render_rows
+from app.analytics import engine
+from app.analytics.cache import get_trades
+from app.responses import cached_response
+from . import montecarlo
 from .forms import PlannerForm, TradePlanForm
+from .matching import normalize_pair
 from flask import render_template
 
 planner_bp = Blueprint('planner', __name__, url_prefix='/planner')
@@ -37,6 +45,7 @@ def new_trade_plan():
             completed=False
         )
         
+        # Linked to an already journaled trade on flush (see matching._match_edited)
         db.session.add(plan)
         db.session.commit()
         flash('Trade plan saved! Remember to execute according to your plan.', 'success')
@@ -45,21 +54,40 @@ def new_trade_plan():
     return render_template('trade_plan_form.html', form=form)
 
 @planner_bp.route('/trade-plans')
+@read_only
 @login_required
 def trade_plans():
-    """List all trade plans"""
-    plans = Planner.query.filter_by(user_id=current_user.id).order_by(Planner.date.desc()).all()
-    return render_template('trade_plans_list.html', plans=plans)
+    """List trade plans, newest first, one keyset page at a time"""
+    # The executing trades (for the status column) in one extra query per page
+    query = _plan_list_query().options(selectinload(Planner.executed_trade).load_only(
+        JournalEntry.id, JournalEntry.result, JournalEntry.profit_loss))
+    page = keyset_page(query, Planner.date, Planner.id, request.args.get('cursor'))
+    if request.args.get('partial'):
+        return render_rows('_trade_plan_rows.html', page, plans=page.items)
+    return render_template('trade_plans_list.html', plans=page.items, page=page)
+
+def _plan_list_query():
+    # List pages never show the free-text columns
+    return Planner.query.filter_by(user_id=current_user.id).options(
+        defer(Planner.analysis),
+        defer(Planner.reflection),
+        defer(Planner.tasks)
+    )
 
 @planner_bp.route('/performance')
+@read_only
 @login_required
+@cached_response
 def performance():
     """Show performance: planned vs actual trades"""
-    # Get all plans
-    plans = Planner.query.filter_by(user_id=current_user.id).order_by(Planner.date.desc()).all()
-    
-    # Get all journal entries
-    journals = JournalEntry.query.filter_by(user_id=current_user.id).order_by(JournalEntry.date.desc()).all()
+    # Every plan with the trade that executed it, in one joined query
+    plans = db.session.scalars(
+        select(Planner)
+        .outerjoin(Planner.executed_trade)
+        .options(contains_eager(Planner.executed_trade))
+        .where(Planner.user_id == current_user.id)
+        .order_by(Planner.date.desc(), Planner.id.desc())
+    ).all()
     
     # Calculate adherence metrics
     total_plans = len(plans)
@@ -72,35 +100,33 @@ def performance():
     
     comparisons = []
     for plan in plans:
-        if plan.executed_trade_id:
-            # Find the corresponding journal entry
-            journal = next((j for j in journals if j.id == plan.executed_trade_id), None)
-            if journal:
-                # Compare plan vs actual
-                comparison = {
-                    'plan': plan,
-                    'actual': journal,
-                    'pair_match': plan.pair == journal.pair,
-                    'direction_match': plan.direction == journal.direction,
-                    'risk_adhered': abs((journal.risk_amount or 0) - (plan.risk_amount or 0)) <= (plan.risk_amount * 0.1) if plan.risk_amount else True,
-                    'strategy_match': plan.strategy == journal.strategy if journal.strategy else False
-                }
-                
-                # Calculate adherence score
-                score = sum([
-                    comparison['pair_match'],
-                    comparison['direction_match'],
-                    comparison['risk_adhered'],
-                    comparison['strategy_match']
-                ]) / 4 * 100
-                
-                comparison['adherence_score'] = score
-                plan_adherence_score += score
-                
-                if not comparison['risk_adhered']:
-                    risk_violations += 1
-                
-                comparisons.append(comparison)
+        journal = plan.executed_trade
+        if journal:
+            # Compare plan vs actual
+            comparison = {
+                'plan': plan,
+                'actual': journal,
+                'pair_match': normalize_pair(plan.pair) == normalize_pair(journal.pair),
+                'direction_match': plan.direction == journal.direction,
+                'risk_adhered': abs((journal.risk_amount or 0) - (plan.risk_amount or 0)) <= (plan.risk_amount * 0.1) if plan.risk_amount else True,
+                'strategy_match': plan.strategy == journal.strategy if journal.strategy else False
+            }
+            
+            # Calculate adherence score
+            score = sum([
+                comparison['pair_match'],
+                comparison['direction_match'],
+                comparison['risk_adhered'],
+                comparison['strategy_match']
+            ]) / 4 * 100
+            
+            comparison['adherence_score'] = score
+            plan_adherence_score += score
+            
+            if not comparison['risk_adhered']:
+                risk_violations += 1
+            
+            comparisons.append(comparison)
     
     avg_adherence = (plan_adherence_score / len(comparisons)) if comparisons else 0
     
@@ -165,25 +191,18 @@ def planner_home():
     """Main Growth Dashboard"""
     
     # 1. Fetch Active Goal
-    active_goal = TradingGoal.query.filter_by(user_id=current_user.id, status='active').first()
+    active_goal = identity.active_goal(current_user.id)
     
     goal_data = None
     if active_goal:
-        # Fetch trades since start date
-        trades = JournalEntry.query.filter(
-            JournalEntry.user_id == current_user.id,
-            JournalEntry.date >= datetime.combine(active_goal.start_date, datetime.min.time()),
-            JournalEntry.journal_complete == True
-        ).order_by(JournalEntry.date.desc()).all()
-        
-        # Calculate Metrics
-        realized_profit = sum((t.profit_loss or 0) for t in trades)
+        # Completed trades since start date, from the vectorized engine
+        realized_profit, avg_risk, trades_count = engine.goal_progress(
+            get_trades(current_user.id), active_goal.start_date
+        )
         current_balance = active_goal.start_balance + realized_profit
         progress_pct = min(100, int(((current_balance - active_goal.start_balance) / (active_goal.target_amount - active_goal.start_balance)) * 100)) if active_goal.target_amount > active_goal.start_balance else 0
         
         # Risk Check
-        risks = [t.risk_amount for t in trades if t.risk_amount]
-        avg_risk = sum(risks) / len(risks) if risks else 0
         risk_status = 'Good'
         if avg_risk > (active_goal.risk_per_trade * 1.1):
             risk_status = 'High'
@@ -199,7 +218,7 @@ def planner_home():
             'avg_risk': avg_risk,
             'planned_risk': active_goal.risk_per_trade,
             'risk_status': risk_status,
-            'trades_count': len(trades)
+            'trades_count': trades_count
         }
 
     # Fetch recent daily plans (keep this for legacy/day-to-day)
@@ -245,7 +264,9 @@ def planner_dashboard():
     )
 
 @planner_bp.route('/dashboardfull')
+@read_only
 @login_required
+@cached_response
 def full_dashboard():
     today = datetime.utcnow().date()
     start_week = today - timedelta(days=today.weekday())  # Monday
@@ -314,10 +335,13 @@ def full_dashboard():
         daily_stats=daily_stats
     )
 @planner_bp.route('/list')
+@read_only
 @login_required
 def planner_list():
-    plans = Planner.query.filter_by(user_id=current_user.id).order_by(Planner.date.desc()).all()
-    return render_template('planner_list.html', plans=plans)
+    page = keyset_page(_plan_list_query(), Planner.date, Planner.id, request.args.get('cursor'))
+    if request.args.get('partial'):
+        return render_rows('_planner_rows.html', page, plans=page.items)
+    return render_template('planner_list.html', plans=page.items, page=page)
 
 @planner_bp.route('/<int:id>')
 @login_required
@@ -334,7 +358,7 @@ def new_goal():
     form = TradingGoalForm()
     
     # Check if active goal exists
-    active = TradingGoal.query.filter_by(user_id=current_user.id, status='active').first()
+    active = identity.active_goal(current_user.id)
     if active:
         flash('You already have an active plan. Please complete or cancel it first.', 'warning')
         # In a full app, we'd allow managing status or editing
@@ -362,6 +386,7 @@ def new_goal():
         
     return render_template('goal_form.html', form=form)
 @planner_bp.route('/goal/<int:id>')
+@read_only
 @login_required
 def goal_detail(id):
     goal = TradingGoal.query.get_or_404(id)
@@ -378,13 +403,10 @@ def goal_detail(id):
         JournalEntry.journal_complete == True
     ).order_by(JournalEntry.date.desc()).all()
     
-    current_profit = sum((t.profit_loss or 0) for t in trades)
+    arrays = get_trades(current_user.id)
+    current_profit, avg_risk, _ = engine.goal_progress(arrays, goal.start_date)
     progress = min(100, int((current_profit / goal.target_amount) * 100)) if goal.target_amount > 0 else 0
     
-    # Risk calc
-    risks = [t.risk_amount for t in trades if t.risk_amount]
-    avg_risk = sum(risks) / len(risks) if risks else 0.0
-    
     warning = None
     if avg_risk > (goal.risk_per_trade * 1.1):
         warning = f"High Risk Warning: You are averaging ${avg_risk:.2f} risk per trade, which is higher than your planned ${goal.risk_per_trade}."
@@ -415,6 +437,12 @@ def goal_detail(id):
         analysis["rating"] = "Aggressive"
         analysis["color"] = "warning"
         analysis["message"] = f"Risking {risk_pct:.1f}% is aggressive. Be careful of drawdown streaks."
+
+    # --- Monte Carlo Projection ---
+    source = request.args.get('source', 'plan')
+    if source not in montecarlo.SOURCES:
+        source = 'plan'
+    projection = montecarlo.project(goal, current_profit, arrays, source)
     
     return render_template(
         'goal_detail.html', 
@@ -424,7 +452,10 @@ def goal_detail(id):
         progress=progress, 
         avg_risk=avg_risk, 
         warning=warning,
-        analysis=analysis
+        analysis=analysis,
+        projection=projection,
+        source=source,
+        sources=montecarlo.SOURCES
     )
 
 @planner_bp.route('/goal/<int:id>/complete', methods=['POST'])
@@ -0,0 +1,250 @@
+"""
+Per-user TradePredictor models.
+
+Weights live in ``predictor_models`` (one row per user, with a version that is
+bumped on every save). Each process keeps an LRU of deserialized models and
+checks the stored version before using one, so a model another worker saved
+is picked up on the next request.
+
+Learning is coalesced: outcomes update the in-memory model straight away and
+are buffered, and the buffer is written once it holds PREDICTOR_FLUSH_EVERY
+samples or is older than PREDICTOR_FLUSH_SECONDS (checked on the user's next
+outcome and by a background thread, so an idle user's samples are saved too).
+A save is a conditional
+UPDATE on the version it started from; if another worker saved in between,
+the buffered samples are replayed on top of its weights instead.
+"""
+import atexit
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import select, update
+
+from app.ai_helper import TradePredictor
+from app.extensions import db, dialect_insert
+from app.models import PredictorModel
+
+_lock = threading.Lock()
+_models = OrderedDict()  # user_id -> _Loaded, oldest first
+_app = None
+_flusher = None
+
+
+class _Loaded:
+    __slots__ = ('version', 'model', 'pending', 'pending_since')
+
+    def __init__(self, version, model):
+        self.version = version  # 0 = not saved yet
+        self.model = model
+        self.pending = []  # (inputs, target) learned but not yet saved
+        self.pending_since = None
+
+
+def init_app(app):
+    global _app
+    _app = app
+    atexit.register(_flush_at_exit)
+
+
+def get_predictor(user_id):
+    """The user's model, reloaded if another process saved a newer version"""
+    return _get_loaded(user_id).model
+
+
+def learn(user_id, entries):
+    """Learn from journal entries that have a result, saving in coalesced batches"""
+    from app.journal.features import entry_vector
+
+    loaded = _get_loaded(user_id)
+    samples = []
+    for entry in entries:
+        target = TradePredictor.target_for(entry.result)
+        if target is not None:
+            samples.append((entry_vector(entry), target))
+    if not samples:
+        return 0
+
+    with _lock:
+        for inputs, target in samples:
+            loaded.model._learn_step(inputs, target)
+        loaded.pending.extend(samples)
+        loaded.pending_since = loaded.pending_since or time.monotonic()
+        due = _due(loaded)
+    if due:
+        _save_pending(user_id, loaded)
+    else:
+        _start_flusher()
+    return len(samples)
+
+
+def learn_from_entry(user_id, entry):
+    return learn(user_id, [entry])
+
+
+def save(user_id, model, samples=0):
+    """Store a freshly trained model (e.g. after a batch retrain), replacing buffered samples"""
+    with _lock:
+        loaded = _models.get(user_id)
+        base_version = loaded.version if loaded is not None else current_version(user_id)
+    version = _write(user_id, model, base_version, samples, refit=True)
+    if version is None:
+        version = _write(user_id, model, current_version(user_id), samples, refit=True)
+    _remember(user_id, _Loaded(version or 0, model))
+    return version
+
+
+def flush(user_id):
+    """Write a user's buffered samples. Returns the saved version (None if nothing to do)."""
+    with _lock:
+        loaded = _models.get(user_id)
+    return _save_pending(user_id, loaded) if loaded is not None else None
+
+
+def flush_all(due_only=False):
+    with _lock:
+        user_ids = [uid for uid, loaded in _models.items()
+                    if loaded.pending and (not due_only or _due(loaded))]
+    for user_id in user_ids:
+        flush(user_id)
+
+
+# --- Internals ---
+
+def _get_loaded(user_id):
+    version = current_version(user_id)
+    with _lock:
+        loaded = _models.get(user_id)
+        if loaded is not None and (loaded.version == version or loaded.pending):
+            # Unsaved samples are reconciled with the newer version on flush
+            _models.move_to_end(user_id)
+            return loaded
+
+    loaded = _load(user_id)
+    _remember(user_id, loaded)
+    return loaded
+
+
+def _due(loaded):
+    config = current_app.config
+    return (len(loaded.pending) >= config.get('PREDICTOR_FLUSH_EVERY', 20) or
+            time.monotonic() - loaded.pending_since >= config.get('PREDICTOR_FLUSH_SECONDS', 60))
+
+
+def _start_flusher():
+    """Start this process's background flush thread, once"""
+    global _flusher
+    if _app is None or _flusher is not None:
+        return
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_periodically, daemon=True, name='predictor-flush')
+            _flusher.start()
+
+
+def _flush_periodically():
+    """Save buffers that aged past PREDICTOR_FLUSH_SECONDS without another outcome to trigger them"""
+    with _app.app_context():
+        interval = max(1, current_app.config.get('PREDICTOR_FLUSH_SECONDS', 60) / 2)
+        while True:
+            time.sleep(interval)
+            try:
+                flush_all(due_only=True)
+            except Exception:
+                current_app.logger.exception("Periodic predictor flush failed")
+            finally:
+                db.session.remove()
+
+
+def _remember(user_id, loaded):
+    limit = current_app.config.get('PREDICTOR_CACHE_SIZE', 256)
+    evicted = []
+    with _lock:
+        _models[user_id] = loaded
+        _models.move_to_end(user_id)
+        while len(_models) > limit:
+            evicted.append(_models.popitem(last=False))
+    # Models dropped from the LRU still get their buffered samples saved
+    for evicted_id, evicted_model in evicted:
+        _save_pending(evicted_id, evicted_model)
+
+
+def _save_pending(user_id, loaded):
+    with _lock:
+        if not loaded.pending:
+            return None
+        pending, loaded.pending, loaded.pending_since = loaded.pending, [], None
+        model, base_version = loaded.model, loaded.version
+
+    for _ in range(3):
+        version = _write(user_id, model, base_version, len(pending))
+        if version is not None:
+            break
+        # Someone else saved first: start from their weights and replay ours
+        fresh = _load(user_id)
+        model, base_version = fresh.model, fresh.version
+        for inputs, target in pending:
+            model._learn_step(inputs, target)
+    else:
+        current_app.logger.warning("Predictor for user %s: gave up saving after repeated conflicts", user_id)
+        return None
+
+    with _lock:
+        loaded.version = version
+        if loaded.model is not model:
+            # Replayed on a newer base; carry over samples learned meanwhile
+            for inputs, target in loaded.pending:
+                model._learn_step(inputs, target)
+            loaded.model = model
+    return version
+
+
+def current_version(user_id):
+    """Saved model version for a user, 0 if none has been saved"""
+    return db.session.execute(
+        select(PredictorModel.version).where(PredictorModel.user_id == user_id)
+    ).scalar() or 0
+
+
+def _load(user_id):
+    row = db.session.execute(
+        select(PredictorModel.version, PredictorModel.weights).where(PredictorModel.user_id == user_id)
+    ).first()
+    if row is None:
+        return _Loaded(0, TradePredictor())
+    return _Loaded(row.version, TradePredictor(json.loads(row.weights)))
+
+
+def _write(user_id, model, base_version, samples, refit=False):
+    """
+    Save if the stored version is still base_version; returns the new version or None.
+    samples are added to the stored count, or replace it for a refit on the full history.
+    """
+    table = PredictorModel.__table__
+    weights = json.dumps(model.to_json())
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        if base_version == 0:
+            result = conn.execute(
+                dialect_insert(conn, table).on_conflict_do_nothing(index_elements=['user_id']),
+                {'user_id': user_id, 'weights': weights, 'version': 1, 'samples': samples, 'updated_at': now}
+            )
+            return 1 if result.rowcount == 1 else None
+        result = conn.execute(update(table).where(
+            table.c.user_id == user_id, table.c.version == base_version
+        ).values(weights=weights, version=base_version + 1,
+                 samples=samples if refit else table.c.samples + samples, updated_at=now))
+        return base_version + 1 if result.rowcount == 1 else None
+
+
+def _flush_at_exit():
+    if _app is None:
+        return
+    try:
+        with _app.app_context():
+            flush_all()
+    except Exception:
+        _app.logger.exception("Error saving predictor models at exit")
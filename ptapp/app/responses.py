@@ -0,0 +1,163 @@
+"""
+Per-user response cache for the dashboard pages.
+
+A cached page is keyed on (user, endpoint, query args, ``User.content_version``,
+today's date). Any journal, backtest, plan, goal or subscription write bumps
+the version in the same transaction: ORM writes through the ``before_flush``
+hook below, bulk writers by calling ``bump_content_version``. A changed
+version is a different key, so nothing has to be deleted.
+
+The key's digest doubles as a strong ETag. A browser revalidating with
+``If-None-Match`` gets a 304 after one primary-key lookup, before the view
+runs. Otherwise the rendered body comes from a byte-bounded LRU in this
+process (``RESPONSE_CACHE_MAX_BYTES``), or the view renders it once.
+
+Requests with pending flash messages bypass the cache: the messages belong
+to that one response.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+from functools import wraps
+from pathlib import Path
+
+from flask import current_app, request, session
+from flask_login import current_user
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models import (BacktestEntry, BacktestRun, JournalEntry, Planner, Subscription, TradingGoal,
+                        User)
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+TRACKED = (JournalEntry, BacktestEntry, BacktestRun, Planner, TradingGoal, Subscription)
+
+_lock = threading.Lock()
+_bodies = OrderedDict()  # etag -> (body bytes, mimetype), oldest first
+_bytes = 0
+_counters = {'hits': 0, 'misses': 0, 'not_modified': 0}
+_salt = ''
+
+
+def init_app(app):
+    """Salt keys with the app's code and templates, so a deploy changes every ETag"""
+    global _salt
+    digest = hashlib.sha256()
+    root = Path(app.root_path)
+    for path in sorted(root.rglob('*')):
+        if path.suffix in ('.py', '.html') and '__pycache__' not in path.parts:
+            stat = path.stat()
+            digest.update(f"{path.relative_to(root)}:{stat.st_size}:{int(stat.st_mtime)}".encode())
+    _salt = digest.hexdigest()
+
+
+def content_version(user_id):
+    return db.session.execute(
+        select(User.content_version).where(User.id == user_id)
+    ).scalar() or 0
+
+
+def _etag(user_id):
+    args = sorted(request.args.items(multi=True))
+    key = json.dumps([_salt, user_id, request.endpoint, args, content_version(user_id),
+                      date.today().isoformat()])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def cached_response(view):
+    """Serve a logged-in GET view from the response cache / with 304s (see module docstring)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET' or not current_user.is_authenticated or session.get('_flashes'):
+            return view(*args, **kwargs)
+
+        etag = _etag(current_user.id)
+        if request.if_none_match.contains(etag):
+            _count('not_modified')
+            return _finish(current_app.response_class(status=304), etag)
+
+        with _lock:
+            cached = _bodies.get(etag)
+            if cached is not None:
+                _bodies.move_to_end(etag)
+                _counters['hits'] += 1
+        if cached is not None:
+            return _finish(current_app.response_class(cached[0], mimetype=cached[1]), etag)
+
+        _count('misses')
+        response = current_app.make_response(view(*args, **kwargs))
+        # Only plain rendered pages; redirects and errors are left alone
+        if response.status_code != 200 or response.direct_passthrough:
+            return response
+        _store(etag, response.get_data(), response.mimetype)
+        return _finish(response, etag)
+    return wrapper
+
+
+def _finish(response, etag):
+    response.set_etag(etag)
+    # Private to the user; revalidate every time (a 304 is nearly free)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def _count(name):
+    with _lock:
+        _counters[name] += 1
+
+
+def _store(etag, body, mimetype):
+    global _bytes
+    max_bytes = current_app.config.get('RESPONSE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+    if len(body) > max_bytes:
+        return
+    with _lock:
+        if etag in _bodies:
+            return
+        _bodies[etag] = (body, mimetype)
+        _bytes += len(body)
+        while _bytes > max_bytes:
+            _, (evicted, _) = _bodies.popitem(last=False)
+            _bytes -= len(evicted)
+
+
+def clear():
+    global _bytes
+    with _lock:
+        _bodies.clear()
+        _bytes = 0
+
+
+def stats():
+    with _lock:
+        return dict(_counters, pid=os.getpid(), entries=len(_bodies), bytes=_bytes)
+
+
+def bump_content_version(conn, user_ids):
+    """Mark users' pages as changed; call inside the writing transaction"""
+    user_ids = {uid for uid in user_ids if uid is not None}
+    if user_ids:
+        table = User.__table__
+        conn.execute(update(table).where(table.c.id.in_(user_ids))
+                     .values(content_version=table.c.content_version + 1))
+
+
+# --- ORM hook ---
+
+@event.listens_for(Session, 'before_flush')
+def _track_writes(session, flush_context, instances):
+    user_ids = set()
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, TRACKED):
+            user_ids.add(obj.user_id)
+    for obj in session.dirty:
+        if isinstance(obj, TRACKED) and session.is_modified(obj):
+            user_ids.add(obj.user_id)
+            user_ids.update(inspect(obj).attrs.user_id.history.deleted)
+    if user_ids:
+        bump_content_version(session.connection(), user_ids)
@@ -0,0 +1,21 @@
+from flask import send_from_directory
+
+from . import uploads_bp, storage
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+@uploads_bp.app_template_global('upload_url')
+def upload_url(name, variant=None):
+    return storage.url(name, variant)
+
+
+@uploads_bp.route('/<path:name>')
+def serve(name):
+    # Content-addressed files never change, so browsers keep them without revalidating
+    if not storage.is_content_addressed(name):
+        return send_from_directory(storage.upload_root(), name)
+    response = send_from_directory(storage.upload_root(), name, max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
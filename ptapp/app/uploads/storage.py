@@ -0,0 +1,192 @@
+"""
+Content-addressed upload storage.
+
+An upload is stored once as ``UPLOAD_FOLDER/<h[:2]>/<h>.<ext>``, where h is
+the SHA-256 of its bytes, so identical screenshots share one file and a name
+never changes meaning: it can be cached by browsers forever. Resized WebP
+variants (a thumbnail for list pages, a web-sized copy for detail pages) are
+written next to it by the ``upload_variants`` background job. Until they
+exist, or when Pillow is not installed, pages fall back to the original.
+
+Names saved before this (plain ``secure_filename`` names) are still served,
+without variants, until ``flask uploads backfill`` moves them into the store.
+"""
+import hashlib
+import os
+import re
+import uuid
+from pathlib import Path
+
+import click
+from flask import current_app, url_for
+from flask.cli import AppGroup
+from sqlalchemy import select, update
+
+from app.extensions import db
+
+try:
+    from PIL import Image
+except ImportError:  # variants are skipped; originals are still stored and served
+    Image = None
+
+uploads_cli = AppGroup('uploads', help='Uploaded screenshot commands.')
+
+# Extension by file signature, so the same bytes always get the same name
+SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF8', 'gif'),
+    (b'RIFF', 'webp'),
+]
+VARIANTS = {
+    'thumb': (320, 60),  # longest edge in px, WebP quality
+    'web': (1600, 80),
+}
+_STORED = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]+$')
+_CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{64}\.(?:[a-z0-9]+|(?:%s)\.webp)$' % '|'.join(VARIANTS))
+
+
+def upload_root():
+    return Path(current_app.config['UPLOAD_FOLDER'])
+
+
+def is_stored(name):
+    """Whether a saved name is a content-addressed original (not a legacy file name)"""
+    return bool(name and _STORED.match(name))
+
+
+def is_content_addressed(name):
+    """Originals and their variants; their bytes can never change"""
+    return bool(_CONTENT_ADDRESSED.match(name))
+
+
+def variant_name(name, variant):
+    return f"{name.rsplit('.', 1)[0]}.{variant}.webp"
+
+
+def _extension(data):
+    for signature, ext in SIGNATURES:
+        if data.startswith(signature) and (ext != 'webp' or data[8:12] == b'WEBP'):
+            return ext
+    return 'bin'
+
+
+def _temp_path(path):
+    # Unique per writer: two jobs may build the same variant at once
+    return path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+
+
+def _write(path, data):
+    """Write via a temp file so a reader never sees a partial file"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _temp_path(path)
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+# --- Saving ---
+
+def store_bytes(data, root=None):
+    """Store bytes under their content hash. Returns (name, created); identical content is not written twice."""
+    digest = hashlib.sha256(data).hexdigest()
+    name = f"{digest[:2]}/{digest}.{_extension(data)}"
+    path = Path(root or upload_root()) / name
+    if path.exists():
+        return name, False
+    _write(path, data)
+    return name, True
+
+
+def save_upload(file_storage):
+    """Store an uploaded FileStorage and queue its variants. Returns the stored name (None if empty)."""
+    if not file_storage:
+        return None
+    data = file_storage.read()
+    if not data:
+        return None
+    name, _ = store_bytes(data)
+    if Image is not None and name.rsplit('.', 1)[-1] != 'bin' and not variants_ready(name):
+        from app.jobs.runner import enqueue
+        enqueue('upload_variants', name=name)
+    return name
+
+
+# --- Variants ---
+
+def variants_ready(name, root=None):
+    root = Path(root or upload_root())
+    return all((root / variant_name(name, variant)).exists() for variant in VARIANTS)
+
+
+def make_variants(name, root=None):
+    """Write any missing variants of a stored image. Returns the variant names written."""
+    root = Path(root or upload_root())
+    missing = [v for v in VARIANTS if not (root / variant_name(name, v)).exists()]
+    if Image is None or not missing:
+        return []
+
+    written = []
+    with Image.open(root / name) as original:
+        original.load()
+        # WebP keeps transparency; palette/CMYK images are converted first
+        mode = 'RGBA' if original.mode in ('RGBA', 'LA', 'P') else 'RGB'
+        source = original.convert(mode)
+    for variant in missing:
+        edge, quality = VARIANTS[variant]
+        image = source.copy()
+        image.thumbnail((edge, edge), Image.LANCZOS)
+        path = root / variant_name(name, variant)
+        tmp = _temp_path(path)
+        image.save(tmp, 'WEBP', quality=quality, method=4)
+        os.replace(tmp, path)
+        written.append(variant_name(name, variant))
+    return written
+
+
+def url(name, variant=None):
+    """URL of an upload, or of its variant when that has been generated"""
+    if not name:
+        return None
+    if variant and is_stored(name) and (upload_root() / variant_name(name, variant)).exists():
+        name = variant_name(name, variant)
+    return url_for('uploads.serve', name=name)
+
+
+# --- CLI ---
+
+@uploads_cli.command('backfill')
+def backfill_command():
+    """Move legacy uploads into the content-addressed store and build missing variants."""
+    from app.models import BacktestEntry, JournalEntry
+
+    root = upload_root()
+    columns = [JournalEntry.before_image, JournalEntry.after_image, BacktestEntry.image_filename]
+    stored = set()
+    for column in columns:
+        model = column.class_
+        for name in db.session.scalars(select(column).where(column.isnot(None)).distinct()).all():
+            if is_stored(name):
+                stored.add(name)
+                continue
+            path = root / name
+            if not name or not path.is_file():
+                click.echo(f"{name}: file missing, left as is")
+                continue
+            new_name, created = store_bytes(path.read_bytes(), root)
+            db.session.execute(update(model).where(column == name).values({column.key: new_name}))
+            stored.add(new_name)
+            click.echo(f"{name} -> {new_name}{'' if created else ' (duplicate)'}")
+    db.session.commit()
+
+    if Image is None:
+        click.echo("Pillow is not installed; no variants written.")
+        return
+    written = 0
+    for name in sorted(stored):
+        if name.endswith('.bin'):
+            continue
+        try:
+            written += len(make_variants(name, root))
+        except (OSError, ValueError) as e:
+            click.echo(f"{name}: {e}")
+    click.echo(f"{len(stored)} stored uploads, {written} variants written.")
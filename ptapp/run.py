@@ -1,13 +1,18 @@
 from app import create_app
 from app.extensions import db
-from app.models import User, BacktestEntry, KPISummary
+from app.migrations import upgrade
 
-app = create_app()
-
-# Create DB and tables if they don't exist (dev convenience)
-with app.app_context():
-    db.create_all()
+# Sweep worker processes are spawned and re-import this module as __mp_main__;
+# they need no app (see app/backtest/sweep.py:_init_worker), so don't build one there
+if __name__ != "__mp_main__":
+    app = create_app()
 
 if __name__ == "__main__":
+    # Create DB and tables if they don't exist, then apply pending migrations (dev convenience).
+    # Elsewhere (WSGI servers, workers) run `flask db upgrade` instead.
+    with app.app_context():
+        db.create_all()
+        upgrade()
+
     # Debug on by default for development
     app.run(debug=True, host="127.0.0.1", port=5000)
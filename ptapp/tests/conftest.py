@@ -0,0 +1,75 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads DATABASE_URL when app.config is imported
+_DB_DIR = tempfile.mkdtemp(prefix='ptapp-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}"
+os.environ.pop('APP_ENV', None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text  # noqa: E402
+
+from app import create_app, identity, responses  # noqa: E402
+from app.analytics import cache  # noqa: E402
+from app.extensions import db as _db  # noqa: E402
+from app.migrations import upgrade  # noqa: E402
+from app.models import JournalEntry, Subscription, User  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return app
+
+
+@pytest.fixture
+def db(app):
+    """An empty, fully migrated database and cold per-process caches"""
+    with app.app_context():
+        _db.session.remove()
+        _db.drop_all()
+        _db.session.execute(text("DROP TABLE IF EXISTS schema_version"))
+        _db.session.commit()
+        _db.create_all()
+        upgrade()
+        cache.invalidate()
+        responses.clear()
+        identity.forget_user()
+        yield _db
+        _db.session.remove()
+
+
+@pytest.fixture
+def user_id(db):
+    user = User(username='trader')
+    user.set_password('secret')
+    db.session.add(user)
+    db.session.commit()
+    db.session.add(Subscription(user_id=user.id, plan_type='pro', is_active=True))
+    db.session.commit()
+    return user.id
+
+
+@pytest.fixture
+def client(app, user_id):
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'trader', 'password': 'secret'})
+    return client
+
+
+def add_trade(db, user_id, date, profit_loss=10.0, pair='EURUSD', direction='buy', **values):
+    entry = JournalEntry(user_id=user_id, date=date, pair=pair, direction=direction, profit_loss=profit_loss,
+                         result='win' if (profit_loss or 0) > 0 else 'loss', **values)
+    db.session.add(entry)
+    db.session.commit()
+    return entry
+
+
+@pytest.fixture
+def trade():
+    """add_trade(db, user_id, date, ...) helper"""
+    return add_trade
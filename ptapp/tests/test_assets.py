@@ -0,0 +1,19 @@
+from app.assets import _manifest
+
+
+def test_each_encoding_has_its_own_etag(app, db):
+    client = app.test_client()
+    with app.app_context():
+        asset = next(a for a in _manifest()['by_name'].values() if 'gzip' in a.encodings)
+    url = f"/assets/{asset.hashed}"
+
+    plain = client.get(url, headers={'Accept-Encoding': 'identity'})
+    gzipped = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert plain.headers['ETag'] != gzipped.headers['ETag']
+
+    # A validator for one encoding doesn't revalidate the other
+    assert client.get(url, headers={'Accept-Encoding': 'gzip',
+                                    'If-None-Match': gzipped.headers['ETag']}).status_code == 304
+    assert client.get(url, headers={'Accept-Encoding': 'identity',
+                                    'If-None-Match': gzipped.headers['ETag']}).status_code == 200
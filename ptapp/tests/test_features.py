@@ -0,0 +1,19 @@
+from app.journal.features import vocab_codes
+from app.models import User
+
+
+def test_vocab_codes_are_dense_per_user_and_kind(db, user_id):
+    other = User(username='other')
+    other.set_password('secret')
+    db.session.add(other)
+    db.session.commit()
+
+    conn = db.session.connection()
+    mine = vocab_codes(conn, user_id, 'strategy', ['breakout', 'range'])
+    assert sorted(mine.values()) == [1, 2]
+
+    # Other users' and other kinds' vocabulary doesn't shift or collide with ours
+    assert vocab_codes(conn, other.id, 'strategy', ['scalp', 'news', 'breakout']) == \
+        {'breakout': 1, 'news': 2, 'scalp': 3}
+    assert vocab_codes(conn, user_id, 'pair', ['EURUSD']) == {'EURUSD': 1}
+    assert vocab_codes(conn, user_id, 'strategy', ['range', 'swing']) == {'range': mine['range'], 'swing': 3}
@@ -0,0 +1,57 @@
+import io
+from datetime import datetime
+
+import pytest
+
+from app.analytics.queries import rollup_rows
+from app.journal.importer import RowError, _parse_float, import_csv, parse_date
+from app.models import JournalEntry
+
+STATEMENT = (
+    "Time,Symbol,Type,Open,Profit,Ticket\n"
+    "2024.05.01 10:00:00,EURUSD,Buy,1.1000,12.50,1001\n"
+    "2024.05.01 14:30:00,XAUUSD,Sell,2300.5,\"-1,250.00\",1002\n"
+    "2024.05.02 09:15:00,GBPUSD,Buy,1.2500,3.20,1003\n"
+)
+
+
+def test_reimport_adds_nothing(db, user_id):
+    first = import_csv(io.BytesIO(STATEMENT.encode()), user_id, chunk_size=2)
+    assert (first.imported, first.duplicates, first.skipped) == (3, 0, 0)
+    rollups = rollup_rows(user_id)
+
+    second = import_csv(io.BytesIO(STATEMENT.encode()), user_id, chunk_size=2)
+    assert (second.imported, second.duplicates) == (0, 3)
+    assert db.session.query(JournalEntry).filter_by(user_id=user_id).count() == 3
+    assert rollup_rows(user_id) == rollups
+
+
+def test_identical_ticketless_rows_are_all_kept(db, user_id):
+    # Two partial closes with the same time, price and profit, no ticket column
+    statement = (
+        "Time,Symbol,Type,Open,Profit\n"
+        "2024.05.01 10:00:00,EURUSD,Buy,1.1000,5.00\n"
+        "2024.05.01 10:00:00,EURUSD,Buy,1.1000,5.00\n"
+    )
+    first = import_csv(io.BytesIO(statement.encode()), user_id)
+    assert (first.imported, first.duplicates) == (2, 0)
+
+    second = import_csv(io.BytesIO(statement.encode()), user_id)
+    assert (second.imported, second.duplicates) == (0, 2)
+    assert db.session.query(JournalEntry).filter_by(user_id=user_id).count() == 2
+
+
+def test_decimal_comma_is_rejected():
+    assert _parse_float('1,234.56', 'profit') == 1234.56
+    assert _parse_float('-12.5', 'profit') == -12.5
+    with pytest.raises(RowError):
+        _parse_float('1234,56', 'profit')
+
+
+def test_parse_date_formats():
+    assert parse_date('2023.10.25 14:00:00') == datetime(2023, 10, 25, 14)
+    assert parse_date('2023-10-25 14:00:00.123') == datetime(2023, 10, 25, 14, 0, 0, 123000)
+    assert parse_date('2023.10.25 14:00:00.500') == datetime(2023, 10, 25, 14, 0, 0, 500000)
+    assert parse_date('2023.10.25 14:00') == datetime(2023, 10, 25, 14)
+    with pytest.raises(RowError):
+        parse_date('25/10/2023')
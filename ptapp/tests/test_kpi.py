@@ -0,0 +1,44 @@
+import io
+from datetime import date, datetime, timedelta
+
+from app.journal.importer import import_csv
+from app.main import kpi
+from app.models import KPISummary
+
+
+def _snapshots(user_id):
+    return {row.week_start: row.total_score for row in KPISummary.query.filter_by(user_id=user_id)}
+
+
+def _monday(weeks_ago):
+    return kpi.week_start_of(date.today()) - timedelta(days=7 * weeks_ago)
+
+
+def _at(day):
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=10)
+
+
+def test_late_writes_invalidate_closed_weeks(db, user_id, trade):
+    entry = trade(db, user_id, _at(_monday(3)))
+    assert kpi.materialize_closed_weeks(user_id) == 3
+    before = _snapshots(user_id)
+    assert kpi.materialize_closed_weeks(user_id) == 0
+
+    # Editing a trade rescores its week only
+    entry.journal_complete = True
+    entry.news_checked = True
+    db.session.commit()
+    assert set(_snapshots(user_id)) == {_monday(2), _monday(1)}
+    assert kpi.materialize_closed_weeks(user_id) == 1
+    assert _snapshots(user_id)[_monday(3)] > before[_monday(3)]
+
+    # A back-dated trade older than every snapshot fills in the weeks before them
+    trade(db, user_id, _at(_monday(5)))
+    assert kpi.materialize_closed_weeks(user_id) == 2
+    assert set(_snapshots(user_id)) == {_monday(w) for w in range(1, 6)}
+
+    # Imported rows drop the snapshot of the week they land in
+    csv = f"Time,Symbol,Type,Open,Profit\n{_at(_monday(2)):%Y.%m.%d %H:%M:%S},EURUSD,Buy,1.1,5\n"
+    import_csv(io.BytesIO(csv.encode()), user_id)
+    assert _monday(2) not in _snapshots(user_id)
+    assert kpi.materialize_closed_weeks(user_id) == 1
@@ -0,0 +1,64 @@
+from datetime import date, datetime
+
+from app.models import Planner
+from app.planner.matching import match_trades
+
+
+def _plan(db, user_id, day, pair='EURUSD', direction='buy'):
+    plan = Planner(user_id=user_id, date=day, pair=pair, direction=direction, completed=False)
+    db.session.add(plan)
+    db.session.commit()
+    return plan
+
+
+def _match(db, user_id, start=None, end=None):
+    linked = match_trades(db.session.connection(), user_id, start, end)
+    db.session.commit()
+    db.session.expire_all()
+    return linked
+
+
+def test_window(app, db, user_id, trade):
+    app.config['PLAN_MATCH_DAYS'] = 2  # the plan's day and the next
+    plan = _plan(db, user_id, date(2024, 1, 10), pair='EUR/USD')
+    trade(db, user_id, datetime(2024, 1, 9, 23, 59))  # before the plan's day
+    trade(db, user_id, datetime(2024, 1, 12, 0, 0))  # after the window
+    trade(db, user_id, datetime(2024, 1, 11, 8), direction='sell')  # wrong direction
+    assert _match(db, user_id) == 0
+
+    inside = trade(db, user_id, datetime(2024, 1, 11, 23, 0), pair='eurusd')
+    assert _match(db, user_id, inside.date, inside.date) == 1
+    plan = db.session.get(Planner, plan.id)
+    assert plan.executed_trade_id == inside.id and plan.completed
+
+
+def test_one_trade_per_plan(app, db, user_id, trade):
+    app.config['PLAN_MATCH_DAYS'] = 2
+    first = _plan(db, user_id, date(2024, 2, 1))
+    second = _plan(db, user_id, date(2024, 2, 1))
+    only = trade(db, user_id, datetime(2024, 2, 1, 10))
+    assert _match(db, user_id) == 1
+    # Oldest plan first; the trade is not reused
+    assert db.session.get(Planner, first.id).executed_trade_id == only.id
+    assert db.session.get(Planner, second.id).executed_trade_id is None
+    assert _match(db, user_id) == 0
+
+    later = trade(db, user_id, datetime(2024, 2, 2, 9))
+    assert _match(db, user_id, later.date, later.date) == 1
+    assert db.session.get(Planner, second.id).executed_trade_id == later.id
+
+
+def test_plan_saved_after_its_trade_and_edited_trades(app, db, user_id, trade):
+    app.config['PLAN_MATCH_DAYS'] = 2
+    done = trade(db, user_id, datetime(2024, 3, 4, 10), pair='GBP/USD')
+    plan = _plan(db, user_id, date(2024, 3, 4), pair='GBPUSD')
+    db.session.expire_all()
+    assert db.session.get(Planner, plan.id).executed_trade_id == done.id
+
+    # Moving a trade into an open plan's window links it on commit
+    other = _plan(db, user_id, date(2024, 3, 8))
+    moved = trade(db, user_id, datetime(2024, 3, 20, 10))
+    moved.date = datetime(2024, 3, 9, 15)
+    db.session.commit()
+    db.session.expire_all()
+    assert db.session.get(Planner, other.id).executed_trade_id == moved.id
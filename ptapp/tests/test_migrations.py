@@ -0,0 +1,36 @@
+import shutil
+from pathlib import Path
+
+from sqlalchemy import create_engine, inspect, text
+
+from app.extensions import db as _db
+from app.migrations import MIGRATIONS, applied_versions, upgrade
+
+BASELINE_DB = Path(__file__).resolve().parent.parent / 'new_data.db'
+
+
+def test_upgrade_baseline_database(app, tmp_path):
+    path = tmp_path / 'baseline.db'
+    shutil.copy(BASELINE_DB, path)
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.connect() as conn:
+        journal_rows = conn.execute(text("SELECT count(*) FROM journal_entries")).scalar()
+
+    # What `flask db upgrade` does
+    with app.app_context():
+        _db.metadata.create_all(engine)
+        done = upgrade(engine)
+    assert done == sorted(version for version, _, _ in MIGRATIONS)
+
+    with engine.connect() as conn:
+        assert applied_versions(conn) == set(done)
+        assert conn.execute(text("SELECT count(*) FROM journal_entries")).scalar() == journal_rows
+    schema = inspect(engine)
+    assert 'content_version' in {col['name'] for col in schema.get_columns('user')}
+    assert 'fingerprint' in {col['name'] for col in schema.get_columns('journal_entries')}
+    assert 'ix_planners_executed_trade' in {ix['name'] for ix in schema.get_indexes('planners')}
+
+    # Nothing left to apply the second time
+    with app.app_context():
+        assert upgrade(engine) == []
+    engine.dispose()
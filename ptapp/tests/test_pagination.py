@@ -0,0 +1,44 @@
+from datetime import datetime
+
+from app.models import JournalEntry
+from app.pagination import keyset_page
+
+
+def test_keyset_pages_with_tied_dates(app, db, user_id, trade):
+    # Runs of identical timestamps straddle the page boundaries
+    for i in range(11):
+        trade(db, user_id, datetime(2024, 1, 1 + i // 4, 12), float(i))
+
+    query = JournalEntry.query.filter_by(user_id=user_id)
+    expected = [e.id for e in query.order_by(JournalEntry.date.desc(), JournalEntry.id.desc())]
+
+    seen, cursor = [], None
+    with app.test_request_context():
+        while True:
+            page = keyset_page(query, JournalEntry.date, JournalEntry.id, cursor, per_page=3)
+            seen.extend(e.id for e in page.items)
+            if not page.has_more:
+                break
+            cursor = page.next_cursor
+    assert seen == expected
+
+
+def test_keyset_pages_reach_undated_rows(app, db, user_id, trade):
+    dated = [trade(db, user_id, datetime(2024, 1, d, 12)).id for d in (1, 2, 3)]
+    undated = []
+    for _ in range(3):
+        entry = trade(db, user_id, datetime(2024, 1, 1))
+        entry.date = None
+        db.session.commit()
+        undated.append(entry.id)
+
+    query = JournalEntry.query.filter_by(user_id=user_id)
+    seen, cursor = [], None
+    with app.test_request_context():
+        while True:
+            page = keyset_page(query, JournalEntry.date, JournalEntry.id, cursor, per_page=2)
+            seen.extend(e.id for e in page.items)
+            if not page.has_more:
+                break
+            cursor = page.next_cursor
+    assert seen == dated[::-1] + undated[::-1]
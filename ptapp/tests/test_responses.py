@@ -0,0 +1,16 @@
+from datetime import datetime
+
+
+def test_etag_revalidation(client, db, user_id, trade):
+    first = client.get('/analytics/')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert 'no-cache' in first.headers['Cache-Control']
+
+    unchanged = client.get('/analytics/', headers={'If-None-Match': etag})
+    assert unchanged.status_code == 304
+
+    trade(db, user_id, datetime(2024, 3, 1, 10), 15.0)  # bumps content_version
+    changed = client.get('/analytics/', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
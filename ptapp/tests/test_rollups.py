@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from sqlalchemy import select
+
+from app.analytics.rollups import rebuild
+from app.models import JournalEntry, PnLRollup
+
+
+def _rollups(db):
+    table = PnLRollup.__table__
+    rows = db.session.execute(select(table.c.user_id, table.c.grain, table.c.period, table.c.pnl,
+                                     table.c.wins, table.c.losses, table.c.breakeven)).all()
+    # A period whose last trade was deleted may keep an all-zero row
+    return sorted((u, g, p, round(pnl, 6), w, l, b) for u, g, p, pnl, w, l, b in rows if w or l or b)
+
+
+def _rebuilt(db):
+    with db.engine.begin() as conn:
+        rebuild(conn)
+    return _rollups(db)
+
+
+def test_incremental_rollups_match_rebuild(db, user_id, trade):
+    entries = [trade(db, user_id, datetime(2024, 1, d, 10), pnl) for d, pnl in
+               [(1, 25.0), (1, -10.0), (2, 0.0), (8, 40.0), (31, -5.5)]]
+    trade(db, user_id, datetime(2024, 2, 1, 9), None)  # open trade: no P/L yet
+    incremental = _rollups(db)
+    assert incremental and incremental == _rebuilt(db)
+
+    # Update P/L, move a trade to another week/month, delete one
+    entries[0].profit_loss = -12.0
+    entries[3].date = datetime(2024, 3, 4, 10)
+    db.session.delete(entries[4])
+    db.session.commit()
+    incremental = _rollups(db)
+    assert incremental == _rebuilt(db)
+
+    month = {period: pnl for _, grain, period, pnl, *_ in incremental if grain == 'month'}
+    assert month == {'2024-01': -22.0, '2024-03': 40.0}
+    assert db.session.query(JournalEntry).count() == 5
@@ -0,0 +1,22 @@
+from datetime import datetime
+
+from app.journal.scoring import score_user
+from app.models import PredictorModel
+
+
+def test_retrain_only_scores_new_or_edited_entries(db, user_id, trade):
+    entries = [trade(db, user_id, datetime(2024, 3, d, 9 + d % 5), pnl, entry_price=1.1, stop_loss=1.09,
+                     strategy='breakout' if d % 2 else 'range')
+               for d, pnl in [(1, 5.0), (2, -3.0), (3, 8.0), (4, -1.0)]]
+    assert score_user(user_id)['scored'] == 4
+
+    # A refit bumps the model version but leaves earlier confidences alone
+    again = score_user(user_id)
+    assert again['scored'] == 0 and again['model_version'] == 2
+
+    entries[0].stop_loss = 1.08
+    db.session.commit()
+    assert score_user(user_id)['scored'] == 1
+
+    # Full refits replace the sample count rather than adding to it
+    assert db.session.query(PredictorModel.samples).filter_by(user_id=user_id).scalar() == 4